@@ -0,0 +1,199 @@
+"""指令基准测试：在填充了大量用户的群组中按目标速率发送指令，统计延迟、写入字节数和内存峰值
+
+    python benchmarks/bench_commands.py
+    python benchmarks/bench_commands.py --users 10 1000 100000 --ops 500 --rate 200
+    python benchmarks/bench_commands.py --storage-mode sqlite --json result.json
+
+延迟从指令的计划发送时刻开始计算，处理速度跟不上目标速率时排队时间也计入延迟。
+每个指令阶段结束时会立即写入所有待写数据，写入字节数包含这次写入。
+每个阶段开始前重置进程的 RSS 峰值（Linux），RSS峰值为该阶段内的峰值。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import resource
+import sys
+import time
+
+from harness import FakeEvent, flush, make_plugin, populate, send, workdir
+
+GROUP_ID = 'bench'
+COMMANDS = {
+    '打胶': lambda uid, target: ("打胶", None),
+    '疯狂打胶': lambda uid, target: ("疯狂打胶", None),
+    '比划比划': lambda uid, target: ("比划比划", target),
+    '牛牛排行': lambda uid, target: ("牛牛排行", None),
+    '牛牛购买': lambda uid, target: ("牛牛购买 2", None),
+    '牛牛背包': lambda uid, target: ("牛牛背包", None),
+}
+
+
+def written_bytes():
+    """进程累计写入的字节数（Linux 读取 /proc/self/io，其他平台返回 None）"""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def reset_peak_rss():
+    """重置进程的 RSS 峰值（Linux 4.0 起支持），返回是否成功"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """上次重置以来的 RSS 峰值；无法读取 /proc 时返回进程启动以来的峰值"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_command(plugin, command, users, ops, rate, rng):
+    """按目标速率发送 ops 条指令，返回每条指令的延迟（毫秒）"""
+    build = COMMANDS[command]
+    latencies = []
+
+    async def one(due, uid, target):
+        text, at = build(uid, target)
+        await send(plugin, FakeEvent(GROUP_ID, uid, f"用户{uid[1:]}", text, at))
+        latencies.append((time.perf_counter() - due) * 1000)
+
+    start = time.perf_counter()
+    tasks = []
+    for i in range(ops):
+        uid = f"u{rng.randrange(users)}"
+        target = f"u{rng.randrange(users)}" if users > 1 else None
+        if rate > 0:
+            due = start + i / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(one(due, uid, target)))
+        else:
+            await one(time.perf_counter(), uid, target)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return latencies
+
+
+async def bench_size(args, users):
+    config = {
+        'storage_mode': args.storage_mode,
+        'storage_format': args.storage_format,
+        'flush_interval': args.flush_interval,
+        'rng_seed': args.seed,
+    }
+    rows = []
+    with workdir():
+        plugin = make_plugin(config)
+        if not args.keep_cooldowns:
+            plugin.COOLDOWN_DAJIAO = plugin.COOLDOWN_CRAZY_DAJIAO = plugin.COMPARE_COOLDOWN = 0
+            plugin.INVITE_LIMIT = 10 ** 9
+        rng = random.Random(args.seed)
+
+        before, rss_reset = written_bytes(), reset_peak_rss()
+        start = time.perf_counter()
+        populate(plugin, GROUP_ID, users, rng)
+        await flush(plugin)
+        setup_ms = (time.perf_counter() - start) * 1000
+        rows.append(_row('初始化', [setup_ms], before, rss_reset))
+
+        for command in args.commands:
+            before, rss_reset = written_bytes(), reset_peak_rss()
+            latencies = await run_command(plugin, command, users, args.ops, args.rate, rng)
+            await flush(plugin)
+            rows.append(_row(command, latencies, before, rss_reset))
+
+        await plugin.terminate()
+        # 用同一份数据重新创建插件，测量启动加载耗时
+        before, rss_reset = written_bytes(), reset_peak_rss()
+        start = time.perf_counter()
+        reloaded = make_plugin(config)
+        await reloaded.niuniu_lengths.preload(GROUP_ID, reloaded.io_pool)
+        reloaded.get_group_data(GROUP_ID)
+        rows.append(_row('启动加载', [(time.perf_counter() - start) * 1000], before, rss_reset))
+        await reloaded.terminate()
+    return rows
+
+
+def _row(name, latencies, bytes_before, rss_reset):
+    latencies = sorted(latencies)
+    after = written_bytes()
+    return {
+        'command': name,
+        'ops': len(latencies),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3) if latencies else 0.0,
+        'bytes_written': after - bytes_before if after is not None and bytes_before is not None else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_scope': 'command' if rss_reset else 'process',  # 无法重置峰值时为进程累计峰值
+    }
+
+
+def print_rows(users, rows):
+    print(f"\n== {users} 个用户")
+    print(f"{'指令':<8}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}{'写入字节':>14}{'RSS峰值(MB)':>13}")
+    for row in rows:
+        written = row['bytes_written'] if row['bytes_written'] is not None else '-'
+        print(f"{row['command']:<8}{row['ops']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+              f"{row['max_ms']:>10}{written:>14}{row['peak_rss_mb']:>13}")
+    if any(row['peak_rss_scope'] == 'process' for row in rows):
+        print("（当前平台无法重置 RSS 峰值，RSS峰值为进程启动以来的累计峰值，不能按指令比较）")
+
+
+async def main_async(args):
+    results = {}
+    for users in args.users:
+        rows = await bench_size(args, users)
+        print_rows(users, rows)
+        results[str(users)] = rows
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="牛牛插件指令基准测试")
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 1000, 100000], help="群组中的用户数，可指定多个")
+    parser.add_argument('--commands', nargs='+', choices=list(COMMANDS), default=list(COMMANDS))
+    parser.add_argument('--ops', type=int, default=300, help="每种指令发送的次数")
+    parser.add_argument('--rate', type=float, default=0, help="目标速率（条/秒），0 表示不限速、逐条发送")
+    parser.add_argument('--storage-mode', choices=['yaml', 'sharded', 'shared', 'sqlite'], default='yaml')
+    parser.add_argument('--storage-format', choices=['yaml', 'json', 'msgpack'], default='yaml')
+    parser.add_argument('--flush-interval', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep-cooldowns', action='store_true', help="保留指令冷却（默认关闭冷却以测量完整处理路径）")
+    parser.add_argument('--json', help="把结果写入 JSON 文件，便于比较不同版本")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
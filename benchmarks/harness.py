@@ -0,0 +1,153 @@
+"""基准测试 / 回放用的运行环境：在临时目录中构建 NiuniuPlugin，并用假的消息事件驱动它
+
+未安装 AstrBot 时会注册一个最小的 `astrbot.api.all` 替身模块，只包含插件用到的名称。
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import types
+from contextlib import contextmanager
+
+PLUGIN_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PLUGIN_ROOT not in sys.path:
+    sys.path.insert(0, PLUGIN_ROOT)
+
+
+def install_astrbot_stub():
+    """AstrBot 不可用时注册替身模块"""
+    try:
+        import astrbot.api.all  # noqa: F401
+        return False
+    except ImportError:
+        pass
+
+    class Context:
+        def __init__(self):
+            self.logger = logging.getLogger('niuniu.bench')
+
+    class Star:
+        def __init__(self, context):
+            self.context = context
+
+    class EventMessageType:
+        GROUP_MESSAGE = 'group'
+        PRIVATE_MESSAGE = 'private'
+
+    class At:
+        def __init__(self, qq):
+            self.qq = qq
+
+    class Plain:
+        def __init__(self, text):
+            self.text = text
+
+    class AstrMessageEvent:
+        pass
+
+    api_all = types.ModuleType('astrbot.api.all')
+    api_all.Context = Context
+    api_all.Star = Star
+    api_all.EventMessageType = EventMessageType
+    api_all.At = At
+    api_all.Plain = Plain
+    api_all.AstrMessageEvent = AstrMessageEvent
+    api_all.register = lambda *args, **kwargs: (lambda cls: cls)
+    api_all.event_message_type = lambda *args, **kwargs: (lambda func: func)
+    api_all.logger = logging.getLogger('astrbot')
+    api_all.__all__ = [name for name in vars(api_all) if not name.startswith('_')]
+    astrbot = types.ModuleType('astrbot')
+    api = types.ModuleType('astrbot.api')
+    astrbot.api, api.all = api, api_all
+    sys.modules.update({'astrbot': astrbot, 'astrbot.api': api, 'astrbot.api.all': api_all})
+    return True
+
+
+install_astrbot_stub()
+
+from astrbot.api.all import At, Context  # noqa: E402
+from niuniu_models import UserRecord  # noqa: E402
+
+
+class FakeMessage:
+    __slots__ = ('group_id', 'message')
+
+    def __init__(self, group_id, message):
+        self.group_id = group_id
+        self.message = message
+
+
+class FakeEvent:
+    """模拟 AstrMessageEvent 中插件用到的部分"""
+    __slots__ = ('message_obj', 'message_str', '_sender_id', '_sender_name')
+
+    def __init__(self, group_id, user_id, nickname, text, at=None):
+        self.message_obj = FakeMessage(group_id, [At(qq=at)] if at is not None else [])
+        self.message_str = text
+        self._sender_id = user_id
+        self._sender_name = nickname
+
+    def get_sender_id(self):
+        return self._sender_id
+
+    def get_sender_name(self):
+        return self._sender_name
+
+    def plain_result(self, text):
+        return text
+
+
+@contextmanager
+def workdir(path=None):
+    """在独立目录中运行插件（插件使用相对路径 data/ 保存数据）"""
+    cwd = os.getcwd()
+    tmp = None
+    if path is None:
+        tmp = tempfile.TemporaryDirectory(prefix='niuniu-bench-')
+        path = tmp.name
+    # 与实际安装后的目录结构一致：插件目录下带有默认的自定义文本
+    plugin_dir = os.path.join(path, 'data', 'plugins', 'astrbot_plugin_niuniu')
+    os.makedirs(plugin_dir, exist_ok=True)
+    texts_path = os.path.join(PLUGIN_ROOT, 'niuniu_game_texts.yml')
+    if os.path.exists(texts_path):
+        shutil.copy(texts_path, plugin_dir)
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(cwd)
+        if tmp is not None:
+            tmp.cleanup()
+
+
+def make_plugin(config=None, admins=('admin',)):
+    """在当前目录下创建插件实例；admins 为 None 时沿用目录中已有的管理员配置"""
+    import main
+    if admins is not None:
+        with open(os.path.join('data', 'cmd_config.json'), 'w', encoding='utf-8') as f:
+            json.dump({'admins_id': list(admins)}, f)
+    return main.NiuniuPlugin(Context(), {'niuniu_config': dict(config or {})})
+
+
+def populate(plugin, group_id, users, rng, coins=10 ** 9):
+    """直接写入 users 个已注册用户，并启用插件"""
+    group_data = plugin.get_group_data(group_id, create=True)
+    group_data['plugin_enabled'] = True
+    for i in range(users):
+        group_data[f"u{i}"] = UserRecord(nickname=f"用户{i}", length=rng.randint(1, 100), coins=coins)
+    plugin._save_niuniu_lengths(group_id)
+
+
+async def send(plugin, event):
+    """发送一条群消息，返回插件的全部回复"""
+    return [result async for result in plugin.on_group_message(event)]
+
+
+async def flush(plugin):
+    """立即写入所有待写数据"""
+    trace_writer = plugin.trace.writer if plugin.trace is not None else None
+    for writer in (plugin.lengths_writer, plugin.actions_writer, plugin.shop.sign_writer, plugin.rng.audit_writer, trace_writer, plugin.rush.writer, plugin.global_ranking_writer):
+        if writer is not None:
+            await writer.flush_async()
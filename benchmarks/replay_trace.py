@@ -0,0 +1,129 @@
+"""回放录制的群指令（配置 trace_record 后记录在 data/niuniu_trace.jsonl）进行压测
+
+    python benchmarks/replay_trace.py data/niuniu_trace.jsonl --data data --speed 1
+    python benchmarks/replay_trace.py data/niuniu_trace.jsonl --data data --speed 10
+    python benchmarks/replay_trace.py data/niuniu_trace.jsonl --data data --speed 0 --config cfg.json
+
+--data 指定的数据目录会先复制到临时目录，回放不会修改原数据。--speed 为回放倍速，0 表示不按时间间隔、逐条尽快发送。
+延迟从每条指令按倍速换算后的计划发送时刻开始计算。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+from bench_commands import peak_rss_mb, percentile, written_bytes
+from harness import FakeEvent, flush, make_plugin, send, workdir
+from niuniu_trace import read_trace
+
+
+async def replay(plugin, entries, speed):
+    """按倍速发送录制的指令，返回 {指令: [延迟（毫秒）]}"""
+    latencies = {}
+
+    async def one(entry, due):
+        route = plugin.router.match(entry.text.strip(), count=False)
+        await send(plugin, FakeEvent(entry.group_id, entry.user_id, entry.nickname, entry.text, entry.at))
+        command = route.command if route else '(非指令)'
+        latencies.setdefault(command, []).append((time.perf_counter() - due) * 1000)
+
+    first = entries[0].time
+    start = time.perf_counter()
+    tasks = []
+    for entry in entries:
+        if speed > 0:
+            due = start + (entry.time - first) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(one(entry, due)))
+        else:
+            await one(entry, time.perf_counter())
+    if tasks:
+        await asyncio.gather(*tasks)
+    return latencies
+
+
+def copy_data(source, path):
+    """把数据目录复制到临时目录的 data/ 下"""
+    target = os.path.join(path, 'data')
+    if os.path.isdir(source):
+        shutil.copytree(source, target, dirs_exist_ok=True)
+
+
+async def main_async(args):
+    entries = list(read_trace(args.trace))
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        print(f"{args.trace} 中没有可回放的指令")
+        return
+    config = {}
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    config['trace_record'] = False  # 回放时不再录制
+    if args.seed is not None:
+        config['rng_seed'] = args.seed
+
+    with workdir() as path:
+        if args.data:
+            copy_data(args.data, path)
+        plugin = make_plugin(config, admins=None if args.data else ('admin',))
+        before = written_bytes()
+        start = time.perf_counter()
+        latencies = await replay(plugin, entries, args.speed)
+        await flush(plugin)
+        elapsed = time.perf_counter() - start
+        after = written_bytes()
+        report = plugin._stats_report()
+        await plugin.terminate()
+
+    span = entries[-1].time - entries[0].time
+    print(f"回放 {len(entries)} 条指令（原始时长 {span:.1f} 秒，倍速 {args.speed or '不限'}），"
+          f"用时 {elapsed:.2f} 秒，吞吐 {len(entries) / elapsed:.1f} 条/秒")
+    if before is not None and after is not None:
+        print(f"写入 {after - before} 字节，RSS 峰值 {peak_rss_mb()}MB")
+    print(f"{'指令':<10}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    rows = {}
+    for command, values in sorted(latencies.items(), key=lambda item: len(item[1]), reverse=True):
+        values.sort()
+        row = rows[command] = {
+            'ops': len(values),
+            'p50_ms': round(percentile(values, 50), 3),
+            'p95_ms': round(percentile(values, 95), 3),
+            'p99_ms': round(percentile(values, 99), 3),
+            'max_ms': round(values[-1], 3),
+        }
+        print(f"{command:<10}{row['ops']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+    if args.verbose:
+        print("\n".join(report))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'elapsed': elapsed, 'results': rows}, f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回放录制的牛牛指令")
+    parser.add_argument('trace', help="录制文件（data/niuniu_trace.jsonl）")
+    parser.add_argument('--data', help="作为初始数据的 data 目录，会复制后使用；不指定时从空数据开始")
+    parser.add_argument('--speed', type=float, default=1, help="回放倍速，例如 1、10；0 表示不限速")
+    parser.add_argument('--config', help="niuniu_config 配置（JSON 文件），用于比较不同的存储或缓存设置")
+    parser.add_argument('--seed', type=int, help="随机数种子，指定后多次回放结果一致")
+    parser.add_argument('--limit', type=int, help="只回放前 N 条")
+    parser.add_argument('--verbose', action='store_true', help="同时输出插件的运行统计（同 牛牛统计 指令）")
+    parser.add_argument('--json', help="把结果写入 JSON 文件，便于比较不同版本")
+    args = parser.parse_args(argv)
+    if args.data:
+        args.data = os.path.abspath(args.data)
+    args.trace = os.path.abspath(args.trace)
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
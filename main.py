@@ -1,20 +1,43 @@
-import random
-import yaml
 import os
 import re
 import time
 import json
 import sys
+import functools
 import asyncio  # 用于异步操作
 from astrbot.api.all import *
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from niuniu_shop import NiuniuShop
 from niuniu_games import NiuniuGames
+from niuniu_admin import NiuniuAdmin
+from niuniu_locks import UserLockManager
+from niuniu_router import CommandRouter
+from niuniu_index import RankingIndex, NicknameIndex, GlobalRanking
+from niuniu_storage import AsyncIOPool, WriteBehindWriter, GroupStore, YamlFileBackend, ShardedYamlBackend, SharedShardBackend, SqliteBackend, atomic_dump, load_data
+from niuniu_cooldown import CooldownStore
+from niuniu_models import UserRecord, is_user
+from niuniu_codec import get_codec, stats as codec_stats
+from niuniu_texts import TextCatalog
+from niuniu_dajiao import simulate
+from niuniu_rng import RngService
+from niuniu_metrics import Metrics, format_histograms
+from niuniu_trace import TraceRecorder
+from niuniu_cache import Lazy, SnapshotCache
+from niuniu_rush import RushScheduler
 
 # 常量定义
 PLUGIN_DIR = os.path.join('data', 'plugins', 'astrbot_plugin_niuniu')
 os.makedirs(PLUGIN_DIR, exist_ok=True)
 NIUNIU_LENGTHS_FILE = os.path.join('data', 'niuniu_lengths.yml')
+NIUNIU_SHARD_DIR = os.path.join('data', 'niuniu_groups')
+NIUNIU_SHARED_DIR = os.path.join('data', 'niuniu_shared')
+NIUNIU_DB_FILE = os.path.join('data', 'niuniu.db')
+NIUNIU_RNG_AUDIT_FILE = os.path.join('data', 'niuniu_rng_audit.jsonl')
+NIUNIU_TRACE_FILE = os.path.join('data', 'niuniu_trace.jsonl')
+NIUNIU_CACHE_DIR = os.path.join('data', 'niuniu_cache')
+NIUNIU_RUSH_FILE = os.path.join('data', 'niuniu_rushes.yml')
+NIUNIU_GLOBAL_RANKING_FILE = os.path.join('data', 'niuniu_global_ranking.yml')
+ACTIVE_RESOLUTION = 3600  # 最后活跃时间的记录精度（秒），减少共享模式下仅活跃时间不同的记录合并
 NIUNIU_TEXTS_FILE = os.path.join(PLUGIN_DIR, 'niuniu_game_texts.yml')
 LAST_ACTION_FILE = os.path.join(PLUGIN_DIR, 'last_actions.yml')
 
@@ -23,194 +46,251 @@ class NiuniuPlugin(Star):
     # 冷却时间常量（秒）
     COOLDOWN_DAJIAO = 30         # 普通打胶冷却30秒
     COOLDOWN_CRAZY_DAJIAO = 60   # 疯狂打胶功能整体冷却1分钟
+    CRAZY_DAJIAO_ROUNDS = 10     # 疯狂打胶默认次数
     COMPARE_COOLDOWN = 600       # 比划冷却10分钟
     INVITE_LIMIT = 3             # 邀请次数限制
 
     def __init__(self, context: Context, config: dict = None):
         super().__init__(context)
         self.config = config or {}
+        cfg = self.config.get('niuniu_config', {})
+        flush_interval = cfg.get('flush_interval', 5)
+        self.io_pool = AsyncIOPool(cfg.get('io_workers', 2), cfg.get('io_max_pending', 64))
+        self.snapshot_cache = SnapshotCache(NIUNIU_CACHE_DIR) if cfg.get('snapshot_cache', True) else None
+        self.metrics = Metrics(cfg.get('stats_log_interval', 0), self.context.logger)  # 指令耗时统计
+        self.trace = TraceRecorder(NIUNIU_TRACE_FILE, self.context.logger, self.io_pool, flush_interval) if cfg.get('trace_record', False) else None
+        self.lengths_writer = WriteBehindWriter('niuniu_lengths', self._write_niuniu_lengths, flush_interval, self.context.logger, self.io_pool)
+        self.actions_writer = WriteBehindWriter('last_actions', self._write_last_actions, flush_interval, self.context.logger, self.io_pool)
         self.niuniu_lengths = self._load_niuniu_lengths()
-        self.niuniu_texts = self._load_niuniu_texts()
-        self.last_dajiao_time = {}      # {str(group_id): {str(user_id): last_time}}
-        self.last_compare_time = {}     # {str(group_id): {str(user_id): {str(target_id): last_time, 'count': count, 'last_time': time}}}
-        self.last_actions = self._load_last_actions()
-        self.admins = self._load_admins()  # 加载管理员列表
+        self.rng = RngService(
+            cfg.get('rng_seed'), NIUNIU_RNG_AUDIT_FILE if cfg.get('rng_audit', False) else None,
+            self.context.logger, self.io_pool, flush_interval
+        )
+        # 以下数据在首次使用时才加载，插件启动时不读取任何文件
+        self._texts = Lazy(self._load_niuniu_texts)
+        self._cooldowns = Lazy(self._load_last_actions)
+        self._admins = Lazy(self._load_admins)
+        self._global_ranking = Lazy(self._load_global_ranking)
+        self.global_ranking_writer = WriteBehindWriter('global_ranking', self._write_global_ranking, flush_interval, self.context.logger, self.io_pool)
+        self._global_reconcile_task = None
+        self.locks = UserLockManager()     # 用户级异步锁
+        self.ranking_index = RankingIndex()  # 群内长度排行索引
+        self.nickname_index = NicknameIndex()  # 群内昵称索引
         self.shop = NiuniuShop(self)       # 实例化商城模块
         self.games = NiuniuGames(self)     # 实例化游戏模块
+        self.admin = NiuniuAdmin(self)     # 管理员批量指令
+        self.rush = RushScheduler(self, NIUNIU_RUSH_FILE, flush_interval)  # 开冲到期自动结算
+        self.router = self._build_router()  # 命令路由只构建一次
+        self.niuniu_lengths.can_evict = self._can_evict_group
+        self.niuniu_lengths.on_evict = self._on_group_evicted
+        self.niuniu_lengths.can_sync = self._can_sync_group
+        self.niuniu_lengths.on_sync = self._on_group_synced
 
     # region 数据管理
-    def _create_niuniu_lengths_file(self):
-        """创建数据文件"""
-        try:
-            with open(NIUNIU_LENGTHS_FILE, 'w', encoding='utf-8') as f:
-                yaml.dump({}, f)
-        except Exception as e:
-            self.context.logger.error(f"创建文件失败: {str(e)}")
-
     def _load_niuniu_lengths(self):
-        """加载牛牛数据"""
-        if not os.path.exists(NIUNIU_LENGTHS_FILE):
-            self._create_niuniu_lengths_file()
-        
+        """加载牛牛数据，按配置选择单文件、分片、多进程共享或 SQLite 存储"""
+        cfg = self.config.get('niuniu_config', {})
+        storage_mode = cfg.get('storage_mode', 'yaml')
+        if storage_mode == 'shared':
+            backend = SharedShardBackend(
+                NIUNIU_SHARED_DIR, NIUNIU_LENGTHS_FILE, LAST_ACTION_FILE, self.context.logger,
+                self._get_codec(), cfg.get('shared_check_interval', 1.0)
+            )
+        elif storage_mode == 'sqlite':
+            backend = SqliteBackend(NIUNIU_DB_FILE, NIUNIU_LENGTHS_FILE, LAST_ACTION_FILE, self.context.logger)
+        elif storage_mode == 'sharded':
+            backend = ShardedYamlBackend(NIUNIU_SHARD_DIR, NIUNIU_LENGTHS_FILE, LAST_ACTION_FILE, self.context.logger, self._get_codec())
+        else:
+            codec = self._get_codec()
+            cache = self.snapshot_cache if codec.name == 'yaml' else None  # JSON / msgpack 解析已经足够快
+            backend = YamlFileBackend(NIUNIU_LENGTHS_FILE, LAST_ACTION_FILE, self.context.logger, codec, cache)
+        return GroupStore(backend, self.context.logger, cfg.get('max_resident_groups', 0))
+
+    def _get_codec(self):
+        """数据文件的写入格式（读取时总是自动识别），配置无效时使用 YAML"""
+        storage_format = self.config.get('niuniu_config', {}).get('storage_format', 'yaml')
         try:
-            with open(NIUNIU_LENGTHS_FILE, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f) or {}
-            
-            # 数据结构验证
-            for group_id in list(data.keys()):
-                group_data = data[group_id]
-                if not isinstance(group_data, dict):
-                    data[group_id] = {'plugin_enabled': False}
-                elif 'plugin_enabled' not in group_data:
-                    group_data['plugin_enabled'] = False
-                for user_id in list(group_data.keys()):
-                    user_data = group_data[user_id]
-                    if isinstance(user_data, dict):
-                        user_data.setdefault('coins', 0)
-                        user_data.setdefault('items', {}) 
-            return data
-        except Exception as e:
-            self.context.logger.error(f"加载数据失败: {str(e)}")
-            return {}
+            return get_codec(storage_format)
+        except ValueError as e:
+            self.context.logger.error(f"存储格式配置无效，改用 yaml: {str(e)}")
+            return get_codec('yaml')
+
+    def _can_evict_group(self, group_id):
+        """群组没有未写入的修改、没有正在写入、也没有进行中的指令时才能淘汰"""
+        writer = self.lengths_writer
+        return (
+            group_id not in writer.dirty_groups and None not in writer.dirty_groups
+            and group_id not in writer.writing_groups and None not in writer.writing_groups
+            and not self.locks.is_group_busy(group_id)
+        )
+
+    def _can_sync_group(self, group_id):
+        """群组正在写入时，等写入完成后再合并其他进程的修改"""
+        writer = self.lengths_writer
+        return group_id not in writer.writing_groups and None not in writer.writing_groups
+
+    def _on_group_synced(self, group_id, user_ids):
+        """合并了其他进程的修改后同步排行和昵称索引"""
+        group_data = self.get_group_data(group_id)
+        self.ranking_index.update(group_id, group_data, *user_ids)
+        self.nickname_index.update(group_id, group_data, *user_ids)
+        self._update_global_ranking(group_id, group_data, user_ids)
+
+    def _on_group_evicted(self, group_id):
+        """群组被移出内存时一并释放索引"""
+        self.ranking_index.drop(group_id)
+        self.nickname_index.drop(group_id)
+        self.rng.drop(group_id)
+
+    @property
+    def texts(self):
+        return self._texts.get()
+
+    @property
+    def cooldowns(self):
+        return self._cooldowns.get()
+
+    @property
+    def admins(self):
+        return self._admins.get()
+
+    @property
+    def global_ranking(self):
+        return self._global_ranking.get()
+
+    async def _preload_lazy(self):
+        """在线程池中完成尚未加载的数据，避免在处理指令时阻塞事件循环"""
+        for lazy in (self._texts, self._cooldowns, self._admins, self.shop._catalog, self._global_ranking):
+            if not lazy.loaded:
+                await lazy.preload(self.io_pool)
 
     def _load_niuniu_texts(self):
-        """加载游戏文本"""
-        default_texts = {
-            'register': {
-                'success': "🧧 {nickname} 成功注册牛牛！\n📏 初始长度：{length}cm\n💪 硬度等级：{hardness}",
-                'already_registered': "⚠️ {nickname} 你已经注册过牛牛啦！",
-            },
-            'dajiao': {
-                'cooldown': [
-                    "⏳ {nickname} 牛牛需要休息，{remaining}秒后可再打胶",
-                    "🛑 冷却中，{nickname} 请耐心等待 ({remaining}秒)"
-                ],
-                'increase': [
-                    "🚀 {nickname} 打胶成功！长度增加 {change}cm！",
-                    "🎉 {nickname} 的牛牛茁壮成长！+{change}cm"
-                ],
-                'decrease': [
-                    "😱 {nickname} 用力过猛！长度减少 {change}cm！",
-                    "⚠️ {nickname} 操作失误！-{change}cm"
-                ],
-                'no_effect': [
-                    "🌀 {nickname} 的牛牛毫无变化...",
-                    "🔄 {nickname} 这次打胶没有效果"
-                ],
-                'not_registered': "❌ {nickname} 请先注册牛牛"
-            },
-            'crazy_dajiao': {
-                'increase': [
-                    "🚀 {nickname} 疯狂打胶成功！牛牛暴涨 {change}cm！",
-                    "🎉 {nickname} 的牛牛狂暴生长！+{change}cm"
-                ],
-                'decrease': [
-                    "😱 {nickname} 疯狂打胶失误，牛牛骤减 {change}cm！",
-                    "⚠️ {nickname} 操作失误！-{change}cm"
-                ],
-                'no_effect': [
-                    "🌀 {nickname} 疯狂打胶后牛牛毫无变化...",
-                    "🔄 {nickname} 的疯狂打胶结果平平"
-                ],
-                'evaluation': "【疯狂打胶十次结束】 {nickname} 的牛牛最终长度为 {length}，评价：{evaluation}"
-            },
-            'my_niuniu': {
-                'info': "📊 {nickname} 的牛牛状态\n📏 长度：{length}\n💪 硬度：{hardness}\n📝 评价：{evaluation}",
-                'evaluation': {
-                    'short': ["小巧玲珑", "精致可爱"],
-                    'medium': ["中规中矩", "潜力无限"],
-                    'long': ["威风凛凛", "傲视群雄"],
-                    'very_long': ["擎天巨柱", "突破天际"],
-                    'super_long': ["超级长", "无与伦比"],
-                    'ultra_long': ["超越极限", "无人能敌"]
-                },
-                'not_registered': "❌ {nickname} 请先注册牛牛"
-            },
-            'compare': {
-                'no_target': "❌ {nickname} 请指定比划对象",
-                'target_not_registered': "❌ 对方尚未注册牛牛",
-                'cooldown': "⏳ {nickname} 请等待{remaining}秒后再比划",
-                'self_compare': "❌ 不能和自己比划",
-                'win': [
-                    "🎉 {winner} 战胜了 {loser}！\n📈 增加 {gain}cm",
-                    "🏆 {winner} 的牛牛更胜一筹！+{gain}cm"
-                ],
-                'lose': [
-                    "😭 {loser} 败给 {winner}\n📉 减少 {loss}cm",
-                    "💔 {loser} 的牛牛不敌对方！-{loss}cm"
-                ],
-                'draw': "🤝 双方势均力敌！",
-                'double_loss': "😱 {nickname1} 和 {nickname2} 的牛牛因过于柔软发生缠绕，长度减半！",
-                'hardness_win': "🎉 {nickname} 因硬度优势获胜！",
-                'hardness_lose': "💔 {nickname} 因硬度劣势败北！",
-                'user_no_increase': "😅 {nickname} 的牛牛没有任何增长。"
-            },
-            'ranking': {
-                'strong_header': "🏅 最强牛牛排行榜 TOP5：\n",
-                'weak_header': "💔 阳痿榜 TOP5：\n",
-                'no_data': "📭 本群暂无牛牛数据",
-                'item': "{rank}. {name} ➜ {length}"
-            },
-            'menu': {
-                'default': """📜 牛牛菜单：
-🔹 注册牛牛 - 初始化你的牛牛
-🔹 打胶 - 提升牛牛长度
-🔹 疯狂打胶 - 连续打胶十次（无单次冷却），功能整体1分钟冷却
-🔹 我的牛牛 - 查看当前状态
-🔹 比划比划 @目标 - 发起对决
-🔹 牛牛排行 - 查看群排行榜
-🔹 牛牛商城 - 查看商城
-🔹 牛牛购买 - 购买道具
-🔹 牛牛背包 - 查看已购道具
-🔹 牛牛开/关 - 管理插件"""
-            },
-            'system': {
-                'enable': "✅ 牛牛插件已启用",
-                'disable': "❌ 牛牛插件已禁用"
-            }
-        }
-        
+        """加载游戏文本，校验并编译所有模板"""
+        custom_texts = {}
         try:
-            if os.path.exists(NIUNIU_TEXTS_FILE):
-                with open(NIUNIU_TEXTS_FILE, 'r', encoding='utf-8') as f:
-                    custom_texts = yaml.safe_load(f) or {}
-                    return self._deep_merge(default_texts, custom_texts)
+            custom_texts = load_data(NIUNIU_TEXTS_FILE, {}, self.snapshot_cache)
         except Exception as e:
             self.context.logger.error(f"加载文本失败: {str(e)}")
-        return default_texts
+        thresholds = self.config.get('niuniu_config', {}).get('evaluation_thresholds')
+        return TextCatalog(custom_texts, thresholds, self.context.logger, self.rng.cosmetic.choice)
 
-    def _deep_merge(self, base, update):
-        """深度合并字典"""
-        for key, value in update.items():
-            if isinstance(value, dict):
-                base[key] = self._deep_merge(base.get(key, {}), value)
-            else:
-                base[key] = value
-        return base
+    def _save_niuniu_lengths(self, group_id=None, *user_ids):
+        """标记数据已修改，由写回器合并后统一落盘，同时更新排行和昵称索引"""
+        self.lengths_writer.mark_dirty(group_id, *user_ids)
+        if group_id is None:
+            self.ranking_index.drop()
+            self.nickname_index.drop()
+            self._invalidate_global_ranking()
+        else:
+            group_data = self.get_group_data(group_id)
+            self.ranking_index.update(group_id, group_data, *user_ids)
+            self.nickname_index.update(group_id, group_data, *user_ids)
+            self._update_global_ranking(group_id, group_data, user_ids)
+
+    def _write_niuniu_lengths(self, dirty_groups, dirty_users):
+        """拍下牛牛数据快照，返回写入函数"""
+        return self.niuniu_lengths.prepare_save(dirty_groups, dirty_users)
 
-    def _save_niuniu_lengths(self):
-        """保存数据"""
+    # region 全服排行
+    def _load_global_ranking(self):
+        """读取上次保存的全服排行，读取失败时等待首次查询时校准"""
+        cfg = self.config.get('niuniu_config', {})
+        ranking = GlobalRanking(cfg.get('global_ranking_size', 50))
         try:
-            with open(NIUNIU_LENGTHS_FILE, 'w', encoding='utf-8') as f:
-                yaml.dump(self.niuniu_lengths, f, allow_unicode=True)
+            ranking.load(load_data(NIUNIU_GLOBAL_RANKING_FILE))
         except Exception as e:
-            self.context.logger.error(f"保存失败: {str(e)}")
+            self.context.logger.error(f"加载全服排行失败: {str(e)}")
+        return ranking
 
-    def _load_last_actions(self):
-        """加载冷却数据"""
+    def _write_global_ranking(self, dirty_groups, dirty_users):
+        return functools.partial(atomic_dump, NIUNIU_GLOBAL_RANKING_FILE, self.global_ranking.to_data(), self._get_codec())
+
+    def _update_global_ranking(self, group_id, group_data, user_ids):
+        """同步用户的最新长度；整群变化时等待下次查询时校准"""
+        if not user_ids:
+            self._invalidate_global_ranking()
+            return
+        ranking = self.global_ranking
+        enabled = group_data.get('plugin_enabled', False)
+        changed = False
+        for user_id in user_ids:
+            user_data = group_data.get(str(user_id)) if enabled else None
+            if is_user(user_data):
+                changed = ranking.update(group_id, user_id, user_data.length, user_data.nickname) or changed
+            else:
+                changed = ranking.update(group_id, user_id, None) or changed
+        if changed:
+            self.global_ranking_writer.mark_dirty()
+
+    def _invalidate_global_ranking(self):
+        ranking = self.global_ranking
+        if not ranking.stale:
+            ranking.stale = True
+            self.global_ranking_writer.mark_dirty()
+
+    def _start_global_reconcile(self):
+        """启动一次校准，已有校准在进行时复用同一个任务"""
+        task = self._global_reconcile_task
+        if task is None or task.done():
+            task = self._global_reconcile_task = asyncio.ensure_future(self._reconcile_global_ranking())
+        return task
+
+    async def _reconcile_global_ranking(self):
+        """扫描所有群组重建全服排行：未加载的群组在线程池中读取，内存中的群组以内存为准"""
+        start = time.perf_counter()
         try:
-            with open(LAST_ACTION_FILE, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f) or {}
-        except:
-            return {}
+            records = await self.niuniu_lengths.scan_lengths(self.io_pool)
+        except Exception as e:
+            self.context.logger.error(f"校准全服排行失败: {str(e)}")
+            return
+        self.global_ranking.rebuild(records, time.time())
+        self.global_ranking_writer.mark_dirty()
+        self.metrics.record_timing('全服排行校准', time.perf_counter() - start)
+    # endregion
 
-    def _save_last_actions(self):
-        """保存冷却数据"""
+    def _load_last_actions(self):
+        """加载仍在冷却中的记录"""
+        cooldowns = CooldownStore(self.config.get('niuniu_config', {}).get('max_cooldowns_per_group', 5000))
         try:
-            with open(LAST_ACTION_FILE, 'w', encoding='utf-8') as f:
-                yaml.dump(self.last_actions, f, allow_unicode=True)
+            cooldowns.load(self.niuniu_lengths.backend.load_actions(), cooldown_for=self.cooldown_for)
         except Exception as e:
-            self.context.logger.error(f"保存冷却数据失败: {str(e)}")
+            self.context.logger.error(f"加载冷却数据失败: {str(e)}")
+        return cooldowns
+
+    def _save_last_actions(self, group_id=None):
+        """标记冷却数据已修改"""
+        self.actions_writer.mark_dirty(group_id)
+
+    def _write_last_actions(self, dirty_groups, dirty_users):
+        """导出仍有效的冷却记录，返回写入函数"""
+        return functools.partial(self.niuniu_lengths.backend.save_actions, self.cooldowns.snapshot(), dirty_groups)
+
+    async def terminate(self):
+        """插件卸载时写入所有未落盘的数据"""
+        await self.rush.close()
+        if self._global_reconcile_task is not None:
+            self._global_reconcile_task.cancel()
+        await self.global_ranking_writer.close()
+        await self.lengths_writer.close()
+        await self.actions_writer.close()
+        await self.shop.close()
+        await self.rng.close()
+        if self.trace is not None:
+            await self.trace.close()
+        if hasattr(self.niuniu_lengths.backend, 'close'):
+            self.niuniu_lengths.backend.close()
+        self.io_pool.shutdown()
+        for writer in (self.lengths_writer, self.actions_writer):
+            stats = writer.stats()
+            self.context.logger.info(f"{stats['name']} 共修改 {stats['marks']} 次，写入 {stats['flushes']} 次，合并 {stats['avoided']} 次")
+        io_stats = self.io_pool.stats()
+        self.context.logger.info(f"I/O 线程池共执行 {io_stats['completed']} 次，最大排队 {io_stats['peak_pending']}，平均耗时 {io_stats['avg_latency_ms']}ms")
+        for name, stats in codec_stats().items():
+            if stats['loads'] or stats['dumps']:
+                self.context.logger.info(
+                    f"{name}（{stats['backend']}）解析 {stats['loads']} 次共 {stats['load_ms']}ms，"
+                    f"写出 {stats['dumps']} 次共 {stats['dump_ms']}ms / {stats['dump_bytes']} 字节"
+                )
 
     def _load_admins(self):
         """加载管理员列表"""
@@ -234,12 +314,15 @@ class NiuniuPlugin(Star):
             return f"{length/100:.2f}m"
         return f"{length}cm"
 
-    def get_group_data(self, group_id):
-        """获取群组数据"""
+    def get_group_data(self, group_id, create=False):
+        """获取群组数据；未记录的群组返回默认数据，只有 create=True 时才会保存到内存"""
         group_id = str(group_id)
-        if group_id not in self.niuniu_lengths:
-            self.niuniu_lengths[group_id] = {'plugin_enabled': False}  # 默认关闭插件
-        return self.niuniu_lengths[group_id]
+        group_data = self.niuniu_lengths.get(group_id)
+        if group_data is None:
+            group_data = {'plugin_enabled': False}  # 默认关闭插件
+            if create:
+                self.niuniu_lengths[group_id] = group_data
+        return group_data
 
     def get_user_data(self, group_id, user_id):
         """获取用户数据"""
@@ -247,13 +330,29 @@ class NiuniuPlugin(Star):
         user_id = str(user_id)
         return group_data.get(user_id)
 
-    def check_cooldown(self, last_time, cooldown):
-        """检查冷却时间"""
-        current = time.time()
-        elapsed = current - last_time
-        remaining = cooldown - elapsed
+    def _touch_user(self, group_id, user_id, user_data, nickname):
+        """用户改名后同步昵称；最后活跃时间只在内存中更新，随该用户下一次数据保存一同写入"""
+        now = time.time()
+        if now - user_data.last_active >= ACTIVE_RESOLUTION:
+            user_data.last_active = now  # 只读指令不会因此触发写入
+        if nickname and user_data.nickname != nickname:
+            user_data.nickname = nickname
+            self._save_niuniu_lengths(group_id, user_id)
+
+    def check_cooldown(self, group_id, user_id, action):
+        """检查冷却时间，返回 (是否冷却中, 剩余秒数)"""
+        remaining = self.cooldowns.remaining(group_id, user_id, action)
         return remaining > 0, remaining
 
+    def cooldown_for(self, action):
+        """旧版冷却数据中各操作的冷却时长，用于把上次操作的时间换算为到期时间"""
+        return {'dajiao': self.COOLDOWN_DAJIAO, 'crazy_dajiao': self.COOLDOWN_CRAZY_DAJIAO}.get(action)
+
+    def start_cooldown(self, group_id, user_id, action, cooldown):
+        """开始冷却并标记待保存"""
+        self.cooldowns.start(group_id, user_id, action, cooldown)
+        self._save_last_actions(group_id)
+
     def parse_at_target(self, event):
         """解析@目标"""
         for comp in event.message_obj.message:
@@ -261,91 +360,111 @@ class NiuniuPlugin(Star):
                 return str(comp.qq)
         return None
 
-    def parse_target(self, event):
-        """解析@目标或用户名"""
+    def resolve_target(self, event):
+        """解析@目标或用户名，返回 (目标ID, 候选用户列表)；匹配到多人时目标ID为 None"""
         for comp in event.message_obj.message:
             if isinstance(comp, At):
-                return str(comp.qq)
+                return str(comp.qq), []
         msg = event.message_str.strip()
-        if msg.startswith("比划比划"):
-            target_name = msg[len("比划比划"):].strip()
-            if target_name:
-                group_id = str(event.message_obj.group_id)
-                group_data = self.get_group_data(group_id)
-                for user_id, user_data in group_data.items():
-                    if isinstance(user_data, dict): 
-                        nickname = user_data.get('nickname', '')
-                        if re.search(re.escape(target_name), nickname, re.IGNORECASE):
-                            return user_id
-        return None
+        if not msg.startswith("比划比划"):
+            return None, []
+        target_name = msg[len("比划比划"):].strip()
+        if not target_name:
+            return None, []
+        group_id = str(event.message_obj.group_id)
+        group_data = self.get_group_data(group_id)
+        candidates = self.nickname_index.get(group_id, group_data).search(target_name)
+        sender_id = str(event.get_sender_id())
+        if len(candidates) > 1 and sender_id in candidates:
+            candidates.remove(sender_id)  # 关键词同时匹配到自己时优先选择其他人
+        if len(candidates) == 1 or (candidates and group_data[candidates[0]].nickname.casefold() == target_name.casefold()):
+            return candidates[0], candidates
+        return None, candidates
+
+    def parse_target(self, event):
+        """解析@目标或用户名"""
+        return self.resolve_target(event)[0]
     # endregion
 
     # region 事件处理
-    niuniu_commands = ["牛牛菜单", "牛牛开", "牛牛关", "注册牛牛", "打胶", "疯狂打胶", "我的牛牛", "比划比划", "牛牛排行", "牛牛商城", "牛牛购买", "牛牛背包"]
+    def _build_router(self):
+        """构建命令路由"""
+        router = CommandRouter()
+        router.add("牛牛开", lambda event: self._toggle_plugin(event, True), requires_enabled=False, blocks_rushing=False, lock=None)
+        router.add("牛牛关", lambda event: self._toggle_plugin(event, False), requires_enabled=False, blocks_rushing=False, lock=None)
+        router.add("牛牛菜单", self._show_menu, requires_enabled=False, blocks_rushing=False, lock=None)
+        router.add("牛牛统计", self._show_stats, requires_enabled=False, blocks_rushing=False, lock=None)
+        router.add("牛牛管理", self.admin.handle, requires_enabled=False, blocks_rushing=False, lock=None)
+        router.add("开冲", self.games.start_rush, blocks_rushing=False)
+        router.add("停止开冲", self._stop_rush_anytime, blocks_rushing=False)
+        router.add("飞飞机", self.games.fly_plane, blocks_rushing=False)
+        router.add("注册牛牛", self._register)
+        router.add("打胶", self._dajiao)
+        router.add("疯狂打胶", self._crazy_dajiao)
+        router.add("我的牛牛", self._show_status)
+        router.add("比划比划", self._compare, lock='pair')  # 比划涉及双方数据，需要同时锁住发起者和目标
+        router.add("牛牛排行", self._show_ranking)
+        router.add("我的排名", self._show_my_rank)
+        router.add("全服排行", self._show_global_ranking)
+        router.add("牛牛商城", self.shop.show_shop)
+        router.add("牛牛商城重载", self.shop.reload_shop, requires_enabled=False, blocks_rushing=False, lock=None)
+        router.add("牛牛购买", self.shop.handle_buy)
+        router.add("牛牛背包", self.shop.show_items)
+        return router
 
     @event_message_type(EventMessageType.GROUP_MESSAGE)
     async def on_group_message(self, event: AstrMessageEvent):
         """群聊消息处理器"""
+        msg = event.message_str.strip()
+        route = self.router.match(msg)
+        if route is None:
+            return  # 普通聊天消息，不访问任何群组数据
+        if self.trace is not None:
+            self.trace.record(
+                str(event.message_obj.group_id), str(event.get_sender_id()), event.get_sender_name(),
+                msg, self.parse_at_target(event)
+            )
+        async for result in self.metrics.track(route.command, self._dispatch(route, event, msg)):
+            yield result
+        if self.metrics.due():
+            self.context.logger.info(self._stats_log_line())
+
+    async def _dispatch(self, route, event, msg):
+        """加载群组数据、检查开关和开冲状态，加锁后执行指令"""
         group_id = str(event.message_obj.group_id)
+        await self.niuniu_lengths.preload(group_id, self.io_pool)
+        await self._preload_lazy()
+        await self.rush.restore()
         group_data = self.get_group_data(group_id)
-        msg = event.message_str.strip()
-        if msg.startswith("牛牛开"):
-            async for result in self._toggle_plugin(event, True):
-                yield result
-            return
-        elif msg.startswith("牛牛关"):
-            async for result in self._toggle_plugin(event, False):
-                yield result
-            return
-        elif msg.startswith("牛牛菜单"):
-            async for result in self._show_menu(event):
-                yield result
-            return
         # 如果插件未启用，忽略其他所有消息
-        if not group_data.get('plugin_enabled', False):
+        if route.requires_enabled and not group_data.get('plugin_enabled', False):
             return
-        if msg.startswith("开冲"):
-            async for result in self.games.start_rush(event):
-                yield result
-        elif msg.startswith("停止开冲"):
-            async for result in self._stop_rush_anytime(event):
+        if route.lock is None:
+            async for result in route.handler(event):
                 yield result
-        elif msg.startswith("飞飞机"):
-            async for result in self.games.fly_plane(event):
-                yield result
-        else:
-            handler_map = {
-                "注册牛牛": self._register,
-                "打胶": self._dajiao,
-                "疯狂打胶": self._crazy_dajiao,
-                "我的牛牛": self._show_status,
-                "比划比划": self._compare,
-                "牛牛排行": self._show_ranking,
-                "牛牛商城": self.shop.show_shop,
-                "牛牛购买": self.shop.handle_buy,
-                "牛牛背包": self.shop.show_items
-            }
-            for cmd, handler in handler_map.items():
-                if msg.startswith(cmd):
-                    user_id = str(event.get_sender_id())
-                    user_data = self.get_user_data(group_id, user_id)
-                    if user_data and user_data.get('is_rushing', False):
-                        yield event.plain_result("❌ 牛牛快冲晕了，还做不了其他事情，要不先停止开冲？")
-                        return
-                    async for result in handler(event):
-                        yield result
+            return
+        user_id = str(event.get_sender_id())
+        lock_ids = [user_id, self.parse_target(event)] if route.lock == 'pair' else [user_id]
+        async with self.locks.hold(group_id, *lock_ids):
+            user_data = self.get_user_data(group_id, user_id)
+            if user_data:
+                self._touch_user(group_id, user_id, user_data, event.get_sender_name())
+                if user_data.is_rushing:
+                    coins = self.rush.ensure(group_id, user_id, user_data)  # 已超过 30 分钟的开冲立即结算
+                    if coins is not None:
+                        yield event.plain_result(f"⏰ {event.get_sender_name()} 已经冲满30分钟，自动结算获得 {coins} 金币")
+                if route.blocks_rushing and user_data.is_rushing:
+                    yield event.plain_result("❌ 牛牛快冲晕了，还做不了其他事情，要不先停止开冲？")
                     return
+            with self.rng.draw(group_id, user_id, route.command, msg):
+                async for result in route.handler(event):
+                    yield result
 
     @event_message_type(EventMessageType.PRIVATE_MESSAGE)
     async def on_private_message(self, event: AstrMessageEvent):
         """私聊消息处理器"""
         msg = event.message_str.strip()
-        niuniu_commands = [
-            "牛牛菜单", "牛牛开", "牛牛关", "注册牛牛", "打胶", "疯狂打胶", "我的牛牛",
-            "比划比划", "牛牛排行", "牛牛商城", "牛牛购买", "牛牛背包",
-            "开冲", "停止开冲", "飞飞机"  
-        ]
-        if any(msg.startswith(cmd) for cmd in niuniu_commands):
+        if self.router.match(msg, count=False):
             yield event.plain_result("不许一个人偷偷玩牛牛")
         else:
             return
@@ -357,10 +476,10 @@ class NiuniuPlugin(Star):
         if not self.is_admin(user_id):
             yield event.plain_result("❌ 只有管理员才能使用此指令")
             return
-        self.get_group_data(group_id)['plugin_enabled'] = enable
-        self._save_niuniu_lengths()
+        self.get_group_data(group_id, create=True)['plugin_enabled'] = enable
+        self._save_niuniu_lengths(group_id)
         text_key = 'enable' if enable else 'disable'
-        yield event.plain_result(self.niuniu_texts['system'][text_key])
+        yield event.plain_result(self.texts.render('system', text_key))
 
     async def _register(self, event):
         """注册牛牛"""
@@ -372,22 +491,21 @@ class NiuniuPlugin(Star):
             yield event.plain_result("❌ 插件未启用")
             return
         if user_id in group_data:
-            text = self.niuniu_texts['register']['already_registered'].format(nickname=nickname)
+            text = self.texts.render('register', 'already_registered', nickname=nickname)
             yield event.plain_result(text)
             return
         cfg = self.config.get('niuniu_config', {})
-        group_data[user_id] = {
-            'nickname': nickname,
-            'length': random.randint(cfg.get('min_length', 3), cfg.get('max_length', 10)),
-            'hardness': 1,
-            'coins': 0,
-            'items': {}
-        }
-        self._save_niuniu_lengths()
-        text = self.niuniu_texts['register']['success'].format(
+        group_data[user_id] = UserRecord(
+            nickname=nickname,
+            length=self.rng.stream(group_id, user_id).randint(cfg.get('min_length', 3), cfg.get('max_length', 10)),
+            last_active=time.time(),
+        )
+        self._save_niuniu_lengths(group_id, user_id)
+        text = self.texts.render(
+            'register', 'success',
             nickname=nickname,
-            length=group_data[user_id]['length'],
-            hardness=group_data[user_id]['hardness']
+            length=group_data[user_id].length,
+            hardness=group_data[user_id].hardness
         )
         yield event.plain_result(text)
 
@@ -402,42 +520,32 @@ class NiuniuPlugin(Star):
             return
         user_data = self.get_user_data(group_id, user_id)
         if not user_data:
-            text = self.niuniu_texts['dajiao']['not_registered'].format(nickname=nickname)
+            text = self.texts.render('dajiao', 'not_registered', nickname=nickname)
             yield event.plain_result(text)
             return
         user_items = self.shop.get_user_items(group_id, user_id)
         has_zhiming_rhythm = user_items.get("致命节奏", 0) > 0
-        last_time = self.last_actions.setdefault(group_id, {}).get(user_id, {}).get('dajiao', 0)
         result_msg = []
-        on_cooldown, remaining = self.check_cooldown(last_time, self.COOLDOWN_DAJIAO)
+        on_cooldown, remaining = self.check_cooldown(group_id, user_id, 'dajiao')
         if on_cooldown and not has_zhiming_rhythm:
             sec = int(remaining) + 1
-            text = random.choice(self.niuniu_texts['dajiao']['cooldown']).format(nickname=nickname, remaining=sec)
+            text = self.texts.render('dajiao', 'cooldown', nickname=nickname, remaining=sec)
             yield event.plain_result(text)
             return
         if on_cooldown and has_zhiming_rhythm:
             self.shop.consume_item(group_id, user_id, "致命节奏")
             result_msg.append(f"⚡ 触发致命节奏！{nickname} 无视冷却强行打胶！")
-        rand = random.random()
-        if rand < 0.4:
-            change = random.randint(2, 5)
-            template = random.choice(self.niuniu_texts['dajiao']['increase'])
-        elif rand < 0.7:
-            change = -random.randint(1, 3)
-            template = random.choice(self.niuniu_texts['dajiao']['decrease'])
-        else:
-            change = 0
-            template = random.choice(self.niuniu_texts['dajiao']['no_effect'])
-        user_data['length'] = user_data['length'] + change
-        self.last_actions.setdefault(group_id, {}).setdefault(user_id, {})['dajiao'] = time.time()
-        self._save_last_actions()
-        self._save_niuniu_lengths()
-        text = template.format(nickname=nickname, change=abs(change))
+        batch = simulate(1, user_data.length, self.rng.stream(group_id, user_id))
+        text_key, change = batch.rounds[0]
+        user_data.length = batch.final_length
+        self.start_cooldown(group_id, user_id, 'dajiao', self.COOLDOWN_DAJIAO)
+        self._save_niuniu_lengths(group_id, user_id)
+        text = self.texts.render('dajiao', text_key, nickname=nickname, change=abs(change))
         final_text = "\n".join(result_msg + [text]) if result_msg else text
-        yield event.plain_result(f"{final_text}\n当前长度：{self.format_length(user_data['length'])}")
+        yield event.plain_result(f"{final_text}\n当前长度：{self.format_length(user_data.length)}")
 
     async def _crazy_dajiao(self, event: AstrMessageEvent):
-        """疯狂打胶功能：启动后连续执行十次打胶，显示每次的长度变化，最后显示一条总的评价；整体冷却1分钟"""
+        """疯狂打胶功能：连续打胶多次（默认十次，可用「疯狂打胶 N」指定），显示每次变化或汇总，最后显示一条总的评价；整体冷却1分钟"""
         group_id = str(event.message_obj.group_id)
         user_id = str(event.get_sender_id())
         nickname = event.get_sender_name()
@@ -447,67 +555,65 @@ class NiuniuPlugin(Star):
             return
         user_data = self.get_user_data(group_id, user_id)
         if not user_data:
-            text = self.niuniu_texts['dajiao']['not_registered'].format(nickname=nickname)
+            text = self.texts.render('dajiao', 'not_registered', nickname=nickname)
             yield event.plain_result(text)
             return
-        crazy_last_time = self.last_actions.setdefault(group_id, {}).setdefault(user_id, {}).get('crazy_dajiao', 0)
-        on_cooldown, remaining = self.check_cooldown(crazy_last_time, self.COOLDOWN_CRAZY_DAJIAO)
+        on_cooldown, remaining = self.check_cooldown(group_id, user_id, 'crazy_dajiao')
         if on_cooldown:
             sec = int(remaining) + 1
             yield event.plain_result(f"⏳ {nickname} 疯狂打胶功能冷却中，请等待{sec}秒后再试")
             return
-        messages = []
-        # 连续执行十次打胶，显示每次变化
-        for i in range(1, 11):
-            rand = random.random()
-            if rand < 0.4:
-                change = random.randint(2, 5)
-                template = random.choice(self.niuniu_texts['crazy_dajiao']['increase'])
-            elif rand < 0.7:
-                change = -random.randint(1, 3)
-                template = random.choice(self.niuniu_texts['crazy_dajiao']['decrease'])
-            else:
-                change = 0
-                template = random.choice(self.niuniu_texts['crazy_dajiao']['no_effect'])
-            user_data['length'] = user_data['length'] + change
-            self._save_niuniu_lengths()
-            round_msg = f"[第{i}次] {template.format(nickname=nickname, change=abs(change))} 当前长度：{self.format_length(user_data['length'])}"
-            messages.append(round_msg)
-        # 更新疯狂打胶冷却时间
-        self.last_actions.setdefault(group_id, {}).setdefault(user_id, {})['crazy_dajiao'] = time.time()
-        self._save_last_actions()
-        # 计算总评价
-        final_length = user_data['length']
-        if final_length < 12:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['short'])
-        elif final_length < 25:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['medium'])
-        elif final_length < 50:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['long'])
-        elif final_length < 100:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['very_long'])
-        elif final_length < 200:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['super_long'])
+        cfg = self.config.get('niuniu_config', {})
+        rounds, max_rounds = self.CRAZY_DAJIAO_ROUNDS, cfg.get('crazy_dajiao_max_rounds', self.CRAZY_DAJIAO_ROUNDS)
+        arg = event.message_str.strip()[len("疯狂打胶"):].strip()
+        if arg.isdigit() and int(arg) > 0:
+            rounds = min(int(arg), max_rounds)
+        # 一次抽完所有轮次，只修改并保存一次
+        batch = simulate(rounds, user_data.length, self.rng.stream(group_id, user_id))
+        user_data.length = batch.final_length
+        self._save_niuniu_lengths(group_id, user_id)
+        self.start_cooldown(group_id, user_id, 'crazy_dajiao', self.COOLDOWN_CRAZY_DAJIAO)
+        output = cfg.get('crazy_dajiao_output', 'auto')
+        if output == 'full' or (output == 'auto' and rounds <= cfg.get('crazy_dajiao_full_limit', 10)):
+            render = self.texts.render
+            format_length = self.format_length
+            messages = [
+                f"[第{i}次] {render('crazy_dajiao', text_key, nickname=nickname, change=abs(change))} 当前长度：{format_length(length)}"
+                for i, ((text_key, change), length) in enumerate(zip(batch.rounds, batch.lengths()), 1)
+            ]
         else:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['ultra_long'])
-        eval_text = self.niuniu_texts['crazy_dajiao']['evaluation'].format(
+            messages = [self.texts.render(
+                'crazy_dajiao', 'summary',
+                nickname=nickname,
+                rounds=rounds,
+                increase=batch.counts['increase'],
+                decrease=batch.counts['decrease'],
+                no_effect=batch.counts['no_effect'],
+                net=f"{batch.net:+d}",
+                length=self.format_length(batch.final_length)
+            )]
+        messages.append(self.texts.render(
+            'crazy_dajiao', 'evaluation',
             nickname=nickname,
-            length=self.format_length(final_length),
-            evaluation=evaluation
-        )
-        messages.append(eval_text)
+            rounds=rounds,
+            length=self.format_length(batch.final_length),
+            evaluation=self.texts.evaluation(batch.final_length)
+        ))
         yield event.plain_result("\n".join(messages))
 
     async def _stop_rush_anytime(self, event: AstrMessageEvent):
-        """停止开冲功能：随时停止，不要求等待满十分钟"""
+        """停止开冲功能：随时停止，冲够十分钟时按时长结算金币"""
         group_id = str(event.message_obj.group_id)
         user_id = str(event.get_sender_id())
-        group_data = self.get_group_data(group_id)
+        nickname = event.get_sender_name()
         user_data = self.get_user_data(group_id, user_id)
-        if user_data and user_data.get('is_rushing', False):
-            user_data['is_rushing'] = False
-            self._save_niuniu_lengths()
-            yield event.plain_result("已成功停止开冲")
+        if user_data and user_data.is_rushing:
+            coins = self.rush.settle(group_id, user_id, user_data)
+            self._save_niuniu_lengths(group_id, user_id)
+            if coins:
+                yield event.plain_result(f"🎉 {nickname} 停止开冲，你获得了 {coins} 金币！")
+            else:
+                yield event.plain_result("已成功停止开冲（不足十分钟，没有获得金币）")
         else:
             yield event.plain_result("你当前没有在开冲")
 
@@ -522,173 +628,176 @@ class NiuniuPlugin(Star):
             return
         user_data = self.get_user_data(group_id, user_id)
         if not user_data:
-            yield event.plain_result(self.niuniu_texts['dajiao']['not_registered'].format(nickname=nickname))
+            yield event.plain_result(self.texts.render('dajiao', 'not_registered', nickname=nickname))
+            return
+        target_id, candidates = self.resolve_target(event)
+        if not target_id and len(candidates) > 1:
+            names = "、".join(self.get_user_data(group_id, uid).nickname for uid in candidates[:5])
+            yield event.plain_result(self.texts.render('compare', 'ambiguous', nickname=nickname, candidates=names, count=len(candidates)))
             return
-        target_id = self.parse_target(event)
         if not target_id:
-            yield event.plain_result(self.niuniu_texts['compare']['no_target'].format(nickname=nickname))
+            yield event.plain_result(self.texts.render('compare', 'no_target', nickname=nickname))
             return
         if target_id == user_id:
-            yield event.plain_result(self.niuniu_texts['compare']['self_compare'])
+            yield event.plain_result(self.texts.render('compare', 'self_compare', nickname=nickname))
             return
         target_data = self.get_user_data(group_id, target_id)
         if not target_data:
-            yield event.plain_result(self.niuniu_texts['compare']['target_not_registered'])
+            yield event.plain_result(self.texts.render('compare', 'target_not_registered', nickname=nickname))
             return
-        compare_records = self.last_compare_time.setdefault(group_id, {}).setdefault(user_id, {})
-        last_compare = compare_records.get(target_id, 0)
-        on_cooldown, remaining = self.check_cooldown(last_compare, self.COMPARE_COOLDOWN)
+        on_cooldown, remaining = self.check_cooldown(group_id, user_id, f'compare:{target_id}')
         if on_cooldown:
             sec = int(remaining) + 1
-            text = self.niuniu_texts['compare']['cooldown'].format(nickname=nickname, remaining=sec)
+            text = self.texts.render('compare', 'cooldown', nickname=nickname, remaining=sec)
             yield event.plain_result(text)
             return
-        compare_records = self.last_compare_time.setdefault(group_id, {}).setdefault(user_id, {})
-        last_compare_time = compare_records.get('last_time', 0)
-        current_time = time.time()
-        if current_time - last_compare_time > 600:
-            compare_records['count'] = 0
-            compare_records['last_time'] = current_time
-        compare_count = compare_records.get('count', 0)
-        if compare_count >= 3:
+        if not self.cooldowns.hit(group_id, user_id, 'compare_count', self.COMPARE_COOLDOWN, self.INVITE_LIMIT):
             yield event.plain_result("❌ 10分钟内只能比划三次")
             return
-        compare_records[target_id] = current_time
-        compare_records['count'] = compare_count + 1
+        self.start_cooldown(group_id, user_id, f'compare:{target_id}', self.COMPARE_COOLDOWN)
+        rng = self.rng.stream(group_id, user_id)
         if self.shop.get_user_items(group_id, user_id).get("夺心魔蝌蚪", 0) > 0:
-            if random.random() < 0.5:
-                user_data['length'] = user_data['length'] + target_data['length']
-                target_data['length'] = 0
+            if rng.random() < 0.5:
+                user_data.length = user_data.length + target_data.length
+                target_data.length = 0
                 result_msg = [
                     "⚔️ 【牛牛对决结果】 ⚔️",
-                    f"🎉 {nickname} 使用夺心魔蝌蚪成功夺取了 {target_data['nickname']} 的全部长度！",
-                    f"🗡️ {nickname}: {self.format_length(user_data['length'] - target_data['length'])} > {self.format_length(user_data['length'])}",
-                    f"🛡️ {target_data['nickname']}: {self.format_length(target_data['length'])} > 0cm"
+                    f"🎉 {nickname} 使用夺心魔蝌蚪成功夺取了 {target_data.nickname} 的全部长度！",
+                    f"🗡️ {nickname}: {self.format_length(user_data.length - target_data.length)} > {self.format_length(user_data.length)}",
+                    f"🛡️ {target_data.nickname}: {self.format_length(target_data.length)} > 0cm"
                 ]
                 self.shop.consume_item(group_id, user_id, "夺心魔蝌蚪")
-                self._save_niuniu_lengths()
+                self._save_niuniu_lengths(group_id, user_id, target_id)
                 yield event.plain_result("\n".join(result_msg))
                 return
-            elif random.random() < 0.1:
-                original_length = user_data['length']
-                user_data['length'] = 0
+            elif rng.random() < 0.1:
+                original_length = user_data.length
+                user_data.length = 0
                 result_msg = [
                     "⚔️ 【牛牛对决结果】 ⚔️",
                     f"💔 {nickname} 使用夺心魔蝌蚪失败，长度被清空！",
                     f"🗡️ {nickname}: {self.format_length(original_length)} > 0cm",
-                    f"🛡️ {target_data['nickname']}: {self.format_length(target_data['length'])}"
+                    f"🛡️ {target_data.nickname}: {self.format_length(target_data.length)}"
                 ]
                 self.shop.consume_item(group_id, user_id, "夺心魔蝌蚪")
-                self._save_niuniu_lengths()
+                self._save_niuniu_lengths(group_id, user_id, target_id)
                 yield event.plain_result("\n".join(result_msg))
                 return
             else:
                 result_msg = [
                     "⚔️ 【牛牛对决结果】 ⚔️",
                     f"⚠️ {nickname} 使用夺心魔蝌蚪，但没有效果！",
-                    f"🗡️ {nickname}: {self.format_length(user_data['length'])}",
-                    f"🛡️ {target_data['nickname']}: {self.format_length(target_data['length'])}"
+                    f"🗡️ {nickname}: {self.format_length(user_data.length)}",
+                    f"🛡️ {target_data.nickname}: {self.format_length(target_data.length)}"
                 ]
                 self.shop.consume_item(group_id, user_id, "夺心魔蝌蚪")
-                self._save_niuniu_lengths()
+                self._save_niuniu_lengths(group_id, user_id, target_id)
                 yield event.plain_result("\n".join(result_msg))
                 return
-        u_len = user_data['length']
-        t_len = target_data['length']
-        u_hardness = user_data['hardness']
-        t_hardness = target_data['hardness']
+        u_len = user_data.length
+        t_len = target_data.length
+        u_hardness = user_data.hardness
+        t_hardness = target_data.hardness
         base_win = 0.5
         length_factor = (u_len - t_len) / max(abs(u_len), abs(t_len)) * 0.2 if max(abs(u_len), abs(t_len)) != 0 else 0
         hardness_factor = (u_hardness - t_hardness) * 0.05
         win_prob = min(max(base_win + length_factor + hardness_factor, 0.2), 0.8)
-        old_u_len = user_data['length']
-        old_t_len = target_data['length']
-        if random.random() < win_prob:
-            gain = random.randint(0, 3)
-            loss = random.randint(1, 2)
-            user_data['length'] = user_data['length'] + gain
-            target_data['length'] = target_data['length'] - loss
-            text = random.choice(self.niuniu_texts['compare']['win']).format(winner=nickname, loser=target_data['nickname'], gain=gain)
+        old_u_len = user_data.length
+        old_t_len = target_data.length
+        if rng.random() < win_prob:
+            gain = rng.randint(0, 3)
+            loss = rng.randint(1, 2)
+            user_data.length = user_data.length + gain
+            target_data.length = target_data.length - loss
+            text = self.texts.render(
+                'compare', 'win',
+                winner=nickname, loser=target_data.nickname, gain=gain,
+                nickname=nickname, target_nickname=target_data.nickname
+            )
             total_gain = gain
             if (self.shop.get_user_items(group_id, user_id).get("淬火爪刀", 0) > 0 
                 and abs(u_len - t_len) > 10 
                 and u_len < t_len):
-                extra_loot = int(target_data['length'] * 0.1)
-                user_data['length'] = user_data['length'] + extra_loot
+                extra_loot = int(target_data.length * 0.1)
+                user_data.length = user_data.length + extra_loot
                 total_gain += extra_loot
                 text += f"\n🔥 淬火爪刀触发！额外掠夺 {extra_loot}cm！"
                 self.shop.consume_item(group_id, user_id, "淬火爪刀")  
-            if abs(u_len - t_len) >= 20 and user_data['hardness'] < target_data['hardness']:
-                extra_gain = random.randint(0, 5)
-                user_data['length'] = user_data['length'] + extra_gain
+            if abs(u_len - t_len) >= 20 and user_data.hardness < target_data.hardness:
+                extra_gain = rng.randint(0, 5)
+                user_data.length = user_data.length + extra_gain
                 total_gain += extra_gain
                 text += f"\n🎁 由于极大劣势获胜，额外增加 {extra_gain}cm！"
             if abs(u_len - t_len) > 10 and u_len < t_len:
-                stolen_length = int(target_data['length'] * 0.2)
-                user_data['length'] = user_data['length'] + stolen_length
+                stolen_length = int(target_data.length * 0.2)
+                user_data.length = user_data.length + stolen_length
                 total_gain += stolen_length
-                target_data['length'] = target_data['length'] - stolen_length
+                target_data.length = target_data.length - stolen_length
                 text += f"\n🎉 {nickname} 掠夺了 {stolen_length}cm！"
-            if abs(u_len - t_len) <= 5 and user_data['hardness'] > target_data['hardness']:
+            if abs(u_len - t_len) <= 5 and user_data.hardness > target_data.hardness:
                 text += f"\n🎉 {nickname} 因硬度优势获胜！"
             if total_gain == 0:
-                text += f"\n{self.niuniu_texts['compare']['user_no_increase'].format(nickname=nickname)}"
+                text += f"\n{self.texts.render('compare', 'user_no_increase', nickname=nickname)}"
         else:
-            gain = random.randint(0, 3)
-            loss = random.randint(1, 2)
-            target_data['length'] = target_data['length'] + gain
+            gain = rng.randint(0, 3)
+            loss = rng.randint(1, 2)
+            target_data.length = target_data.length + gain
             if self.shop.consume_item(group_id, user_id, "余震"):
                 result_msg = [f"🛡️ 【余震生效】{nickname} 未减少长度！"]
             else:
-                user_data['length'] = user_data['length'] - loss
+                user_data.length = user_data.length - loss
                 result_msg = [f"💔 {nickname} 减少 {loss}cm"]
-            text = random.choice(self.niuniu_texts['compare']['lose']).format(nickname=nickname, target_nickname=target_data['nickname'], loss=loss)
-        if random.random() < 0.3:
-            user_data['hardness'] = max(1, user_data['hardness'] - 1)
-        if random.random() < 0.3:
-            target_data['hardness'] = max(1, target_data['hardness'] - 1)
-        self._save_niuniu_lengths()
+            text = self.texts.render(
+                'compare', 'lose',
+                winner=target_data.nickname, loser=nickname, loss=loss,
+                nickname=nickname, target_nickname=target_data.nickname
+            )
+        if rng.random() < 0.3:
+            user_data.hardness = max(1, user_data.hardness - 1)
+        if rng.random() < 0.3:
+            target_data.hardness = max(1, target_data.hardness - 1)
+        self._save_niuniu_lengths(group_id, user_id, target_id)
         result_msg = [
             "⚔️ 【牛牛对决结果】 ⚔️",
-            f"🗡️ {nickname}: {self.format_length(old_u_len)} → {self.format_length(user_data['length'])}",
-            f"🛡️ {target_data['nickname']}: {self.format_length(old_t_len)} → {self.format_length(target_data['length'])}",
+            f"🗡️ {nickname}: {self.format_length(old_u_len)} → {self.format_length(user_data.length)}",
+            f"🛡️ {target_data.nickname}: {self.format_length(old_t_len)} → {self.format_length(target_data.length)}",
             f"📢 {text}"
         ]
         special_event_triggered = False
-        if abs(u_len - t_len) <= 5 and random.random() < 0.075:
+        if abs(u_len - t_len) <= 5 and rng.random() < 0.075:
             result_msg.append("💥 双方势均力敌！")
             special_event_triggered = True
-        if not special_event_triggered and (user_data['hardness'] <= 2 or target_data['hardness'] <= 2) and random.random() < 0.05:
-            original_user_len = user_data['length']
-            original_target_len = target_data['length']
-            user_data['length'] = original_user_len // 2
-            target_data['length'] = original_target_len // 2
+        if not special_event_triggered and (user_data.hardness <= 2 or target_data.hardness <= 2) and rng.random() < 0.05:
+            original_user_len = user_data.length
+            original_target_len = target_data.length
+            user_data.length = original_user_len // 2
+            target_data.length = original_target_len // 2
             if self.shop.get_user_items(group_id, user_id).get("妙脆角", 0) > 0:
-                user_data['length'] = original_user_len
+                user_data.length = original_user_len
                 result_msg.append(f"🛡️ {nickname} 的妙脆角生效，防止了长度减半！")
                 self.shop.consume_item(group_id, user_id, "妙脆角")
             if self.shop.get_user_items(group_id, target_id).get("妙脆角", 0) > 0:
-                target_data['length'] = original_target_len
-                result_msg.append(f"🛡️ {target_data['nickname']} 的妙脆角生效，防止了长度减半！")
+                target_data.length = original_target_len
+                result_msg.append(f"🛡️ {target_data.nickname} 的妙脆角生效，防止了长度减半！")
                 self.shop.consume_item(group_id, target_id, "妙脆角")
             result_msg.append("双方牛牛因过于柔软发生缠绕！")
             special_event_triggered = True
-        if not special_event_triggered and abs(u_len - t_len) < 10 and random.random() < 0.025:
-            original_user_len = user_data['length']
-            original_target_len = target_data['length']
-            user_data['length'] = original_user_len // 2
-            target_data['length'] = original_target_len // 2
+        if not special_event_triggered and abs(u_len - t_len) < 10 and rng.random() < 0.025:
+            original_user_len = user_data.length
+            original_target_len = target_data.length
+            user_data.length = original_user_len // 2
+            target_data.length = original_target_len // 2
             if self.shop.get_user_items(group_id, user_id).get("妙脆角", 0) > 0:
-                user_data['length'] = original_user_len
+                user_data.length = original_user_len
                 result_msg.append(f"🛡️ {nickname} 的妙脆角生效，防止了长度减半！")
                 self.shop.consume_item(group_id, user_id, "妙脆角")
             if self.shop.get_user_items(group_id, target_id).get("妙脆角", 0) > 0:
-                target_data['length'] = original_target_len
-                result_msg.append(f"🛡️ {target_data['nickname']} 的妙脆角生效，防止了长度减半！")
+                target_data.length = original_target_len
+                result_msg.append(f"🛡️ {target_data.nickname} 的妙脆角生效，防止了长度减半！")
                 self.shop.consume_item(group_id, target_id, "妙脆角")
-            result_msg.append(self.niuniu_texts['compare']['double_loss'].format(nickname1=nickname, nickname2=target_data['nickname']))
+            result_msg.append(self.texts.render('compare', 'double_loss', nickname1=nickname, nickname2=target_data.nickname))
             special_event_triggered = True
-        self._save_niuniu_lengths()
+        self._save_niuniu_lengths(group_id, user_id, target_id)
         yield event.plain_result("\n".join(result_msg))
 
     async def _show_status(self, event):
@@ -702,30 +811,37 @@ class NiuniuPlugin(Star):
             return
         user_data = self.get_user_data(group_id, user_id)
         if not user_data:
-            yield event.plain_result(self.niuniu_texts['my_niuniu']['not_registered'].format(nickname=nickname))
+            yield event.plain_result(self.texts.render('my_niuniu', 'not_registered', nickname=nickname))
             return
-        length = user_data['length']
+        length = user_data.length
         length_str = self.format_length(length)
-        if length < 12:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['short'])
-        elif length < 25:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['medium'])
-        elif length < 50:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['long'])
-        elif length < 100:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['very_long'])
-        elif length < 200:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['super_long'])
-        else:
-            evaluation = random.choice(self.niuniu_texts['my_niuniu']['evaluation']['ultra_long'])
-        text = self.niuniu_texts['my_niuniu']['info'].format(
+        evaluation = self.texts.evaluation(length)
+        text = self.texts.render(
+            'my_niuniu', 'info',
             nickname=nickname,
             length=length_str,
-            hardness=user_data['hardness'],
+            hardness=user_data.hardness,
             evaluation=evaluation
         )
         yield event.plain_result(text)
 
+    async def _get_ranking(self, group_id, group_data):
+        """取群内排行索引；SQLite 存储首次构建时直接按 (group_id, length) 索引读出有序数据"""
+        backend = self.niuniu_lengths.backend
+        if group_id not in self.ranking_index and hasattr(backend, 'ranking'):
+            self.ranking_index.begin_seed(group_id)
+            entries = None
+            try:
+                await self.lengths_writer.flush_async()  # 先写入未落盘的修改
+                dirty = self.lengths_writer.dirty_groups
+                if group_id not in dirty and None not in dirty:  # 写入失败时改为从内存数据构建
+                    rows = await self.io_pool.run(backend.ranking, group_id, -1, False)
+                    entries = [(length, user_id) for user_id, _, length in rows]
+            except Exception as e:
+                self.context.logger.error(f"读取排行数据失败: {str(e)}")
+            self.ranking_index.seed(group_id, group_data, entries)
+        return self.ranking_index.get(group_id, group_data)
+
     async def _show_ranking(self, event):
         """显示排行榜，分为最强牛牛排行榜和阳痿榜"""
         group_id = str(event.message_obj.group_id)
@@ -733,25 +849,103 @@ class NiuniuPlugin(Star):
         if not group_data.get('plugin_enabled', False):
             yield event.plain_result("❌ 插件未启用")
             return
-        valid_users = [
-            (uid, data) for uid, data in group_data.items()
-            if isinstance(data, dict) and 'length' in data
-        ]
-        if not valid_users:
-            yield event.plain_result(self.niuniu_texts['ranking']['no_data'])
+        index = await self._get_ranking(group_id, group_data)
+        if not len(index):
+            yield event.plain_result(self.texts.render('ranking', 'no_data'))
             return
-        sorted_desc = sorted(valid_users, key=lambda x: x[1]['length'], reverse=True)
-        sorted_asc = sorted(valid_users, key=lambda x: x[1]['length'])
         ranking = []
-        ranking.append(self.niuniu_texts['ranking']['strong_header'])
-        for idx, (uid, data) in enumerate(sorted_desc[:5], 1):
-            ranking.append(self.niuniu_texts['ranking']['item'].format(rank=idx, name=data['nickname'], length=self.format_length(data['length'])))
-        ranking.append("\n" + self.niuniu_texts['ranking']['weak_header'])
-        for idx, (uid, data) in enumerate(sorted_asc[:5], 1):
-            ranking.append(self.niuniu_texts['ranking']['item'].format(rank=idx, name=data['nickname'], length=self.format_length(data['length'])))
+        ranking.append(self.texts.render('ranking', 'strong_header'))
+        for idx, (uid, length) in enumerate(index.top(5), 1):
+            ranking.append(self.texts.render('ranking', 'item', rank=idx, name=group_data[uid].nickname, length=self.format_length(length)))
+        ranking.append("\n" + self.texts.render('ranking', 'weak_header'))
+        for idx, (uid, length) in enumerate(index.bottom(5), 1):
+            ranking.append(self.texts.render('ranking', 'item', rank=idx, name=group_data[uid].nickname, length=self.format_length(length)))
         yield event.plain_result("\n".join(ranking))
 
+    async def _show_global_ranking(self, event):
+        """显示全服排行：只读取维护好的两端榜单，榜单不完整或有整群变化时先校准"""
+        k = self.config.get('niuniu_config', {}).get('global_ranking_show', 10)
+        ranking = self.global_ranking
+        if ranking.stale or not ranking.complete(k):
+            await self._start_global_reconcile()
+        elif time.time() - ranking.reconciled_at >= self.config.get('niuniu_config', {}).get('global_ranking_reconcile_interval', 3600):
+            self._start_global_reconcile()  # 定期校准在后台进行，本次直接使用现有榜单
+        top = ranking.top.first(k)
+        if not top:
+            yield event.plain_result(self.texts.render('ranking', 'global_no_data'))
+            return
+        lines = [self.texts.render('ranking', 'global_strong_header', count=len(top))]
+        for idx, (gid, uid, nickname, length) in enumerate(top, 1):
+            lines.append(self.texts.render('ranking', 'global_item', rank=idx, name=nickname, group=gid, length=self.format_length(length)))
+        bottom = ranking.bottom.first(k)
+        lines.append("\n" + self.texts.render('ranking', 'global_weak_header', count=len(bottom)))
+        for idx, (gid, uid, nickname, length) in enumerate(bottom, 1):
+            lines.append(self.texts.render('ranking', 'global_item', rank=idx, name=nickname, group=gid, length=self.format_length(length)))
+        yield event.plain_result("\n".join(lines))
+
+    async def _show_my_rank(self, event):
+        """查看自己在本群的排名"""
+        group_id = str(event.message_obj.group_id)
+        user_id = str(event.get_sender_id())
+        nickname = event.get_sender_name()
+        group_data = self.get_group_data(group_id)
+        if not group_data.get('plugin_enabled', False):
+            yield event.plain_result("❌ 插件未启用")
+            return
+        user_data = self.get_user_data(group_id, user_id)
+        if not user_data:
+            yield event.plain_result(self.texts.render('my_niuniu', 'not_registered', nickname=nickname))
+            return
+        index = await self._get_ranking(group_id, group_data)
+        text = self.texts.render(
+            'ranking', 'my_rank',
+            nickname=nickname,
+            rank=index.rank(user_id),
+            total=len(index),
+            length=self.format_length(user_data.length)
+        )
+        yield event.plain_result(text)
+
     async def _show_menu(self, event):
         """显示菜单"""
-        yield event.plain_result(self.niuniu_texts['menu']['default'])
+        yield event.plain_result(self.texts.render('menu', 'default'))
+
+    async def _show_stats(self, event):
+        """显示运行统计（管理员）"""
+        if not self.is_admin(event.get_sender_id()):
+            yield event.plain_result("❌ 只有管理员才能使用此指令")
+            return
+        yield event.plain_result("\n".join(self._stats_report()))
+
+    def _stats_report(self):
+        """指令耗时、保存次数、序列化字节数和签到金币读取耗时"""
+        stats = self.metrics.stats()
+        lines = [f"📊 牛牛统计（运行 {int(stats['uptime'])} 秒，出错 {stats['errors']} 次，非指令消息 {self.router.miss_count} 条）"]
+        lines += format_histograms("⏱️ 指令耗时：", self.metrics.commands)
+        lines += format_histograms("⏱️ 代码段耗时：", self.metrics.timings)
+        lines.append("💾 保存：")
+        for writer in (self.lengths_writer, self.actions_writer, self.shop.sign_writer, self.rush.writer, self.global_ranking_writer):
+            w = writer.stats()
+            lines.append(f"🔹 {w['name']}：保存调用 {w['marks']} 次，实际写入 {w['flushes']} 次，待写群组 {w['pending_groups']}，上次写入 {w['last_flush_cost_ms']}ms")
+        for name, c in codec_stats().items():
+            if c['loads'] or c['dumps']:
+                lines.append(f"🔹 {name}（{c['backend']}）：写出 {c['dumps']} 次共 {c['dump_bytes']} 字节 / {c['dump_ms']}ms，解析 {c['loads']} 次共 {c['load_bytes']} 字节 / {c['load_ms']}ms")
+        rush = self.rush.stats()
+        lines.append(f"🔹 开冲：进行中 {rush['active']}，堆中 {rush['heap']}，已结算 {rush['settled']}（自动结算 {rush['batches']} 批）")
+        if self._global_ranking.loaded:
+            g = self.global_ranking.stats()
+            lines.append(f"🔹 全服排行：榜单 {g['top']}/{g['bottom']} 人，增量更新 {g['updates']} 次，校准 {g['reconciles']} 次{'（待校准）' if g['stale'] else ''}")
+        io = self.io_pool.stats()
+        lines.append(f"🔹 I/O 线程池：完成 {io['completed']} 次，排队 {io['pending']}（峰值 {io['peak_pending']}），平均 {io['avg_latency_ms']}ms，最大 {io['max_latency_ms']}ms")
+        return lines
+
+    def _stats_log_line(self):
+        """定期输出的单行统计"""
+        parts = [
+            f"{name} {h.count}次/p95≤{h.percentile(95)}ms"
+            for name, h in sorted(self.metrics.commands.items(), key=lambda item: item[1].total, reverse=True)
+        ]
+        writers = "，".join(f"{w.name} 保存{w.mark_count}次/写入{w.flush_count}次" for w in (self.lengths_writer, self.actions_writer))
+        dump_bytes = sum(c['dump_bytes'] for c in codec_stats().values())
+        return f"牛牛统计：{'，'.join(parts) or '暂无指令'}；{writers}；共序列化 {dump_bytes} 字节"
     # endregion
@@ -0,0 +1,158 @@
+import time
+from astrbot.api.all import AstrMessageEvent
+from niuniu_catalog import ShopCatalog
+from niuniu_models import is_user
+
+USAGE = """❌ 格式：牛牛管理 操作 参数 [确认]
+🔹 牛牛管理 重置长度 [长度]
+🔹 牛牛管理 发金币 数量
+🔹 牛牛管理 发道具 商品编号或名称 [数量]
+🔹 牛牛管理 清理 天数 [全部]
+不加「确认」时只预览受影响的人数，加上「确认」才会执行"""
+
+
+def _int(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name}必须是整数") from None
+
+
+class BulkOperation:
+    """一次批量操作：select 判断用户是否受影响，apply 修改单个用户（删除用户的操作为 None）"""
+    __slots__ = ('label', 'select', 'apply', 'note')
+
+    def __init__(self, label, select, apply=None, note=''):
+        self.label = label
+        self.select = select
+        self.apply = apply
+        self.note = note
+
+
+class NiuniuAdmin:
+    """管理员批量指令：整群一次遍历完成修改，只标记保存一次"""
+
+    def __init__(self, main_plugin):
+        self.main = main_plugin  # 主插件实例
+        self.operations = {
+            '重置长度': self._reset_length,
+            '发金币': self._grant_coins,
+            '发道具': self._grant_item,
+            '清理': self._purge_inactive,
+        }
+
+    # region 操作定义
+    def _reset_length(self, args, now):
+        cfg = self.main.config.get('niuniu_config', {})
+        length = _int(args[0], '长度') if args else cfg.get('min_length', 3)
+        return BulkOperation(
+            f"重置长度为 {self.main.format_length(length)}",
+            lambda user_data: user_data.length != length,
+            lambda user_data: setattr(user_data, 'length', length),
+        )
+
+    def _grant_coins(self, args, now):
+        if not args:
+            raise ValueError("请指定金币数量")
+        coins = _int(args[0], '金币数量')
+        if coins == 0:
+            raise ValueError("金币数量不能为 0")
+
+        def apply(user_data):
+            user_data.coins = user_data.coins + coins
+        return BulkOperation(f"每人发放 {coins} 金币", lambda user_data: True, apply)
+
+    def _grant_item(self, args, now):
+        if not args:
+            raise ValueError("请指定商品编号或名称")
+        catalog = self.main.shop.catalog
+        item = catalog.get(int(args[0])) if args[0].isdigit() else catalog.find(args[0])
+        if item is None:
+            raise ValueError(f"商城中没有 {args[0]}")
+        if not ShopCatalog.is_held(item):
+            raise ValueError(f"{item['name']} 购买后立即生效，不能放入背包")
+        count = _int(args[1], '道具数量') if len(args) > 1 else 1
+        if count <= 0:
+            raise ValueError("道具数量必须大于 0")
+        name = ShopCatalog.inventory_name(item)
+        max_count = item.get('max', 3)
+
+        def apply(user_data):
+            user_data.items[name] = min(user_data.items.get(name, 0) + count, max_count)
+        return BulkOperation(
+            f"每人发放 {name}x{count}",
+            lambda user_data: user_data.items.get(name, 0) < max_count,
+            apply,
+            f"（最多持有 {max_count} 个，已达上限的用户不受影响）",
+        )
+
+    def _purge_inactive(self, args, now):
+        if not args or not args[0].isdigit() or int(args[0]) <= 0:
+            raise ValueError("请指定天数")
+        days = int(args[0])
+        cutoff = now - days * 86400
+        include_unknown = len(args) > 1 and args[1] == '全部'
+
+        def select(user_data):
+            if user_data.is_rushing:
+                return False
+            if not user_data.last_active:
+                return include_unknown  # 升级前的数据没有活跃记录
+            return user_data.last_active < cutoff
+        note = "" if include_unknown else "（没有活跃记录的旧数据不清理，需要时加上「全部」）"
+        return BulkOperation(f"清理 {days} 天未活跃的用户", select, None, note)
+    # endregion
+
+    async def handle(self, event: AstrMessageEvent):
+        """牛牛管理 操作 参数 [确认]"""
+        if not self.main.is_admin(event.get_sender_id()):
+            yield event.plain_result("❌ 只有管理员才能使用此指令")
+            return
+        parts = event.message_str.split()
+        if len(parts) < 2 or parts[1] not in self.operations:
+            yield event.plain_result(USAGE)
+            return
+        confirm = parts[-1] == '确认'
+        args = parts[2:-1] if confirm else parts[2:]
+        now = time.time()
+        try:
+            operation = self.operations[parts[1]](args, now)
+        except ValueError as e:
+            yield event.plain_result(f"❌ {e}\n{USAGE}")
+            return
+
+        group_id = str(event.message_obj.group_id)
+        group_data = self.main.get_group_data(group_id)
+        if not confirm:
+            total = affected = 0
+            for user_data in group_data.values():
+                if is_user(user_data):
+                    total += 1
+                    affected += operation.select(user_data)
+            yield event.plain_result(
+                f"🔍 预览：{operation.label}，将影响 {affected}/{total} 名用户{operation.note}\n"
+                f"确认执行请发送：{' '.join(parts)} 确认"
+            )
+            return
+
+        # 等待群内正在执行的指令结束，之后的遍历和修改中间没有 await，不会与其他指令交错
+        async with self.main.locks.hold(group_id, *self.main.locks.held_users(group_id)):
+            start = time.perf_counter()
+            affected, total = self.apply(group_id, operation)
+            self.main.metrics.record_timing(f"牛牛管理 {parts[1]}", time.perf_counter() - start)
+        yield event.plain_result(f"✅ {operation.label}：已处理 {affected}/{total} 名用户")
+
+    def apply(self, group_id, operation):
+        """一次遍历整群数据执行操作，有修改时整群只标记保存一次，返回 (受影响人数, 总人数)"""
+        group_data = self.main.get_group_data(group_id)
+        users = [(user_id, user_data) for user_id, user_data in group_data.items() if is_user(user_data)]
+        affected = [user_id for user_id, user_data in users if operation.select(user_data)]
+        if operation.apply is None:
+            for user_id in affected:
+                del group_data[user_id]
+        else:
+            for user_id in affected:
+                operation.apply(group_data[user_id])
+        if affected:
+            self.main._save_niuniu_lengths(group_id)
+        return len(affected), len(users)
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import pickle
+import threading
+
+# 缓存文件格式版本，解析结果的结构变化时递增
+CACHE_VERSION = 1
+
+
+class Lazy:
+    """首次使用时才执行加载函数，之后返回缓存的结果"""
+    __slots__ = ('_loader', '_value', '_lock', 'loaded')
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._value = None
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def get(self):
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    self._value = self._loader()
+                    self.loaded = True
+        return self._value
+
+    async def preload(self, io_pool):
+        """在线程池中加载，避免首次使用时阻塞事件循环"""
+        if not self.loaded:
+            await io_pool.run(self.get)
+        return self._value
+
+    def reset(self):
+        """丢弃已加载的结果，下次使用时重新加载"""
+        with self._lock:
+            self._value = None
+            self.loaded = False
+
+
+class SnapshotCache:
+    """解析结果缓存：源文件未变化时直接读取上次的解析结果，跳过 YAML 解析
+
+    缓存以源文件的 (mtime, 大小) 和内容哈希为键：文件状态相同时不读取源文件，
+    状态变化但内容哈希相同（例如只被 touch 过）时也能命中。
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def _cache_path(self, path):
+        name = hashlib.blake2b(os.path.abspath(path).encode('utf-8'), digest_size=8).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}.pickle")
+
+    @staticmethod
+    def _stat(path):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def digest(raw):
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+    def _read_meta(self, cache_path):
+        """读取缓存文件头部的元信息，返回 (元信息, 打开的文件)"""
+        try:
+            f = open(cache_path, 'rb')
+        except FileNotFoundError:
+            return None, None
+        try:
+            meta = pickle.load(f)
+        except Exception:
+            f.close()
+            return None, None
+        if not isinstance(meta, dict) or meta.get('version') != CACHE_VERSION:
+            f.close()
+            return None, None
+        return meta, f
+
+    def load(self, path, parse):
+        """读取 path 的解析结果；未命中时读取源文件并用 parse(raw) 解析，然后写入缓存"""
+        stat = self._stat(path)
+        meta, f = self._read_meta(self._cache_path(path))
+        if f is not None:
+            with f:
+                if meta['stat'] == stat:
+                    self.hits += 1
+                    return pickle.load(f)
+                with open(path, 'rb') as source:
+                    raw = source.read()
+                if meta['hash'] == self.digest(raw):
+                    self.hits += 1
+                    return pickle.load(f)
+        else:
+            with open(path, 'rb') as source:
+                raw = source.read()
+        self.misses += 1
+        data = parse(raw)
+        self.store(path, data, raw, stat)
+        return data
+
+    def store(self, path, data, raw, stat=None):
+        """写入解析结果；data 必须与 parse(raw) 的结果一致"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            cache_path = self._cache_path(path)
+            tmp_path = f"{cache_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({
+                    'version': CACHE_VERSION,
+                    'source': path,
+                    'stat': stat or self._stat(path),
+                    'hash': self.digest(raw),
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # 缓存只用于加速，写入失败时下次重新解析即可
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
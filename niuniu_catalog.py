@@ -0,0 +1,44 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class ShopCatalog:
+    """商城目录：按编号和名称（含别名）索引商品，商城菜单在构建时渲染一次
+
+    商品仍是配置中的字典；每个商品可以用 aliases 指定别名，用 inventory_name 指定放入背包时使用的名称
+    （默认为商品名称）。背包中的名称、商品名称和别名都能查到对应商品。
+    """
+
+    def __init__(self, items: Iterable[Dict[str, Any]]):
+        self.items: List[Dict[str, Any]] = list(items)
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        for item in self.items:
+            self._by_id[item['id']] = item
+            for name in (item['name'], self.inventory_name(item), *item.get('aliases', ())):
+                self._by_name.setdefault(name, item)  # 名称冲突时以编号靠前的商品为准
+        self.menu = "\n".join(["🛒 牛牛商城（使用 牛牛购买+编号）"] + [
+            f"{item['id']}. {item['name']} - {item['desc']} (价格: {item['price']} 金币)" for item in self.items
+        ])
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, item_id: int) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(item_id)
+
+    def find(self, name: str) -> Optional[Dict[str, Any]]:
+        """按商品名称、背包名称或别名查找"""
+        return self._by_name.get(name)
+
+    @staticmethod
+    def inventory_name(item: Dict[str, Any]) -> str:
+        return item.get('inventory_name', item['name'])
+
+    @staticmethod
+    def is_held(item: Dict[str, Any]) -> bool:
+        """购买后放入背包（被动道具，或效果需要在比划等场合触发的主动道具）"""
+        return item['type'] == 'passive' or not isinstance(item.get('effect'), dict)
+
+    def describe(self, name: str) -> str:
+        item = self._by_name.get(name)
+        return item['desc'] if item else "未知道具"
@@ -0,0 +1,247 @@
+"""数据文件编解码：YAML（优先使用 libyaml）、JSON（优先使用 orjson）、msgpack（需安装）
+
+读取时根据文件内容自动识别格式，写入格式由 `storage_format` 配置决定。
+也可作为命令行工具使用，供管理员转换和检查数据文件：
+
+    python niuniu_codec.py convert data/niuniu_lengths.yml lengths.json
+    python niuniu_codec.py convert data/niuniu_lengths.yml readable.yml --expand
+    python niuniu_codec.py bench data/niuniu_lengths.yml
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import yaml
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# libyaml 可用时使用 C 实现的解析器和输出器
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
+class CompactDumper(SafeDumper):
+    """列表（紧凑用户记录）单行输出，字典保持块格式"""
+
+
+CompactDumper.add_representer(
+    list, lambda dumper, data: dumper.represent_sequence('tag:yaml.org,2002:seq', data, flow_style=True)
+)
+
+
+class Codec:
+    """编解码器基类，记录每种格式的读写次数、耗时和字节数"""
+    name = None
+    ext = None
+    backend = None
+
+    def __init__(self):
+        self.load_count = 0
+        self.load_time = 0.0
+        self.load_bytes = 0
+        self.dump_count = 0
+        self.dump_time = 0.0
+        self.dump_bytes = 0
+
+    def _loads(self, raw):
+        raise NotImplementedError
+
+    def _dumps(self, data):
+        raise NotImplementedError
+
+    def loads(self, raw):
+        start = time.perf_counter()
+        data = self._loads(raw)
+        self.load_time += time.perf_counter() - start
+        self.load_count += 1
+        self.load_bytes += len(raw)
+        return data
+
+    def dumps(self, data):
+        start = time.perf_counter()
+        raw = self._dumps(data)
+        self.dump_time += time.perf_counter() - start
+        self.dump_count += 1
+        self.dump_bytes += len(raw)
+        return raw
+
+    def stats(self):
+        return {
+            'backend': self.backend,
+            'loads': self.load_count,
+            'load_ms': round(self.load_time * 1000, 2),
+            'load_bytes': self.load_bytes,
+            'dumps': self.dump_count,
+            'dump_ms': round(self.dump_time * 1000, 2),
+            'dump_bytes': self.dump_bytes,
+        }
+
+
+class YamlCodec(Codec):
+    name = 'yaml'
+    ext = '.yml'
+    backend = 'libyaml' if SafeLoader is not yaml.SafeLoader else 'pyyaml'
+
+    def _loads(self, raw):
+        return yaml.load(raw, Loader=SafeLoader)
+
+    def _dumps(self, data):
+        return yaml.dump(data, Dumper=CompactDumper, allow_unicode=True, encoding='utf-8')
+
+
+class JsonCodec(Codec):
+    name = 'json'
+    ext = '.json'
+    backend = 'orjson' if orjson else 'json'
+
+    def _loads(self, raw):
+        return orjson.loads(raw) if orjson else json.loads(raw)
+
+    def _dumps(self, data):
+        if orjson:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    ext = '.msgpack'
+    backend = 'msgpack'
+
+    def _loads(self, raw):
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+    def _dumps(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+
+CODECS = {'yaml': YamlCodec(), 'json': JsonCodec()}
+if msgpack:
+    CODECS['msgpack'] = MsgpackCodec()
+
+# msgpack 编码的字典以这些字节开头。0x80-0x8f（fixmap）不可能是 UTF-8 文本的首字节；
+# 0xde/0xdf（map16/map32）同时也是 U+0780-U+07FF 字符的 UTF-8 首字节，按 msgpack 解析失败时改按文本格式解析
+_MSGPACK_MAP_PREFIXES = set(range(0x80, 0x90)) | {0xde, 0xdf}
+_UTF8_LEAD_PREFIXES = {0xde, 0xdf}
+
+
+def get_codec(name):
+    """按名称获取编解码器，格式未知或依赖未安装时抛出 ValueError"""
+    codec = CODECS.get(name)
+    if codec is None:
+        if name == 'msgpack':
+            raise ValueError("msgpack 格式需要先安装 msgpack（pip install msgpack）")
+        raise ValueError(f"未知的存储格式: {name}")
+    return codec
+
+
+def _detect_text(raw):
+    return 'json' if raw[:64].lstrip()[:1] in (b'{', b'[') else 'yaml'
+
+
+def detect(raw):
+    """根据内容识别格式"""
+    if raw[:1] and raw[0] in _MSGPACK_MAP_PREFIXES:
+        return 'msgpack'
+    return _detect_text(raw)
+
+
+def decode(raw):
+    """自动识别格式并解析；msgpack 解析失败时按文本格式再试，JSON 解析失败时按 YAML 流式写法再试"""
+    if not raw.strip():
+        return None
+    name = detect(raw)
+    if name == 'msgpack':
+        try:
+            return get_codec('msgpack').loads(raw)
+        except Exception:
+            if raw[0] not in _UTF8_LEAD_PREFIXES:
+                raise
+            name = _detect_text(raw)
+    if name == 'json':
+        try:
+            return CODECS['json'].loads(raw)
+        except ValueError:
+            name = 'yaml'
+    return get_codec(name).loads(raw)
+
+
+def stats():
+    return {name: codec.stats() for name, codec in CODECS.items()}
+
+
+# region 命令行工具
+def _expand(data):
+    """把紧凑用户记录展开为字典，便于阅读和手工编辑"""
+    from niuniu_models import COMPACT_LAYOUTS, UserRecord
+    if isinstance(data, dict):
+        return {key: _expand(value) for key, value in data.items()}
+    if (isinstance(data, list) and data and type(data[0]) is int
+            and data[0] in COMPACT_LAYOUTS and len(data) > len(COMPACT_LAYOUTS[data[0]])):
+        return UserRecord.from_compact(data).to_dict()
+    return data
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return decode(f.read())
+
+
+def _convert(args):
+    target = args.to or next((name for name, codec in CODECS.items()
+                              if os.path.splitext(args.output)[1] in (codec.ext, f".{name}")), 'yaml')
+    data = _read(args.input)
+    if args.expand:
+        data = _expand(data)
+    raw = get_codec(target).dumps(data if data is not None else {})
+    with open(args.output, 'wb') as f:
+        f.write(raw)
+    print(f"{args.input} -> {args.output}（{target}，{len(raw)} 字节）")
+
+
+def _bench(args):
+    data = _read(args.input)
+    print(f"{'格式':<10}{'实现':<10}{'大小':>12}{'解析(ms)':>12}{'写出(ms)':>12}")
+    for name, codec in CODECS.items():
+        raw = codec.dumps(data)
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            codec.dumps(data)
+        dump_ms = (time.perf_counter() - start) * 1000 / args.rounds
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            codec.loads(raw)
+        load_ms = (time.perf_counter() - start) * 1000 / args.rounds
+        print(f"{name:<10}{codec.backend:<10}{len(raw):>12}{load_ms:>12.2f}{dump_ms:>12.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="牛牛插件数据文件格式转换")
+    sub = parser.add_subparsers(dest='command', required=True)
+    convert = sub.add_parser('convert', help="转换数据文件格式（输入格式自动识别）")
+    convert.add_argument('input')
+    convert.add_argument('output')
+    convert.add_argument('--to', choices=sorted(CODECS), help="输出格式，默认按输出文件扩展名判断")
+    convert.add_argument('--expand', action='store_true', help="把紧凑用户记录展开为字典")
+    convert.set_defaults(func=_convert)
+    bench = sub.add_parser('bench', help="比较各格式读写同一份数据的耗时")
+    bench.add_argument('input')
+    bench.add_argument('--rounds', type=int, default=5)
+    bench.set_defaults(func=_bench)
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+# endregion
@@ -0,0 +1,133 @@
+import heapq
+import time
+
+
+class CooldownStore:
+    """带过期时间的冷却记录
+
+    条目按 (group_id, user_id, key) 保存到期时间，计数类条目额外保存窗口内的次数。
+    过期条目由最小堆按到期时间清理，每个群组的条目数有上限，持久化时只导出仍有效的条目。
+    """
+
+    def __init__(self, max_per_group=5000):
+        self.max_per_group = max_per_group
+        self._groups = {}   # {group_id: {(user_id, key): [expires_at, count]}}
+        self._heap = []     # [(expires_at, group_id, user_id, key)]，惰性删除
+        self._size = 0
+        self.expired_count = 0
+        self.evicted_count = 0
+
+    def __len__(self):
+        return self._size
+
+    def _purge(self, now):
+        """弹出所有已到期的条目"""
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires_at, group_id, user_id, key = heapq.heappop(heap)
+            entries = self._groups.get(group_id)
+            entry = entries.get((user_id, key)) if entries else None
+            if entry is None or entry[0] != expires_at:
+                continue  # 条目已被更新或删除
+            del entries[(user_id, key)]
+            self._size -= 1
+            self.expired_count += 1
+            if not entries:
+                del self._groups[group_id]
+        # 堆中失效的旧记录过多时重建
+        if len(heap) > 2 * self._size + 64:
+            self._heap = [
+                (entry[0], group_id, user_id, key)
+                for group_id, entries in self._groups.items()
+                for (user_id, key), entry in entries.items()
+            ]
+            heapq.heapify(self._heap)
+
+    def _set(self, group_id, user_id, key, expires_at, count=0):
+        entries = self._groups.setdefault(group_id, {})
+        if (user_id, key) not in entries:
+            if len(entries) >= self.max_per_group:
+                # 超出上限时淘汰最早到期的条目
+                oldest = min(entries, key=lambda k: entries[k][0])
+                del entries[oldest]
+                self._size -= 1
+                self.evicted_count += 1
+            self._size += 1
+        entries[(user_id, key)] = [expires_at, count]
+        heapq.heappush(self._heap, (expires_at, group_id, user_id, key))
+
+    def _get(self, group_id, user_id, key, now):
+        self._purge(now)
+        entries = self._groups.get(group_id)
+        return entries.get((user_id, key)) if entries else None
+
+    def remaining(self, group_id, user_id, key, now=None):
+        """剩余冷却秒数，不在冷却中返回 0"""
+        now = time.time() if now is None else now
+        entry = self._get(str(group_id), str(user_id), key, now)
+        return entry[0] - now if entry else 0.0
+
+    def start(self, group_id, user_id, key, duration, now=None):
+        """开始一次冷却"""
+        now = time.time() if now is None else now
+        self._purge(now)
+        self._set(str(group_id), str(user_id), key, now + duration)
+
+    def hit(self, group_id, user_id, key, window, limit, now=None):
+        """窗口计数：窗口内次数未达上限时计数并返回 True，否则返回 False"""
+        now = time.time() if now is None else now
+        group_id, user_id = str(group_id), str(user_id)
+        entry = self._get(group_id, user_id, key, now)
+        if entry is None:
+            self._set(group_id, user_id, key, now + window, 1)
+            return True
+        if entry[1] >= limit:
+            return False
+        entry[1] += 1
+        return True
+
+    def snapshot(self, now=None):
+        """导出仍有效的条目：{group_id: {user_id: {key: [到期时间, 次数]}}}"""
+        now = time.time() if now is None else now
+        self._purge(now)
+        data = {}
+        for group_id, entries in self._groups.items():
+            group_out = data[group_id] = {}
+            for (user_id, key), (expires_at, count) in entries.items():
+                group_out.setdefault(user_id, {})[key] = [expires_at, count]
+        return data
+
+    def load(self, data, now=None, cooldown_for=None):
+        """载入持久化的条目，已过期的直接丢弃
+
+        旧版 last_actions 中的值是上次操作的时间戳（单个数字而不是列表），
+        按 cooldown_for(key) 返回的冷却时长换算为到期时间，返回 None 的条目丢弃。
+        """
+        now = time.time() if now is None else now
+        for group_id, users in (data or {}).items():
+            if not isinstance(users, dict):
+                continue
+            for user_id, keys in users.items():
+                if not isinstance(keys, dict):
+                    continue
+                for key, value in keys.items():
+                    if isinstance(value, (list, tuple)) and len(value) == 2:
+                        expires_at, count = value
+                    elif isinstance(value, (int, float)) and cooldown_for is not None:
+                        duration = cooldown_for(key)
+                        if duration is None:
+                            continue
+                        expires_at, count = value + duration, 0
+                    else:
+                        continue
+                    if isinstance(expires_at, (int, float)) and expires_at > now:
+                        self._set(str(group_id), str(user_id), key, expires_at, count)
+
+    def stats(self):
+        return {
+            'entries': self._size,
+            'groups': len(self._groups),
+            'heap': len(self._heap),
+            'expired': self.expired_count,
+            'evicted': self.evicted_count,
+        }
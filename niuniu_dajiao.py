@@ -0,0 +1,48 @@
+import random
+from itertools import accumulate, islice
+
+# 单次打胶的结果分布：(概率, 文本键, 最小变化, 最大变化)
+DAJIAO_OUTCOMES = (
+    (0.4, 'increase', 2, 5),
+    (0.3, 'decrease', -3, -1),
+    (0.3, 'no_effect', 0, 0),
+)
+
+
+def _flatten(outcomes):
+    """把「先选结果再选变化量」展开为一张 (文本键, 变化量) 表，一次 choices 调用即可抽完所有轮次"""
+    table, weights = [], []
+    for probability, text_key, low, high in outcomes:
+        for change in range(low, high + 1):
+            table.append((text_key, change))
+            weights.append(probability / (high - low + 1))
+    return tuple(table), tuple(accumulate(weights))
+
+
+_TABLE, _CUM_WEIGHTS = _flatten(DAJIAO_OUTCOMES)
+
+
+class DajiaoBatch:
+    """多轮打胶的模拟结果"""
+    __slots__ = ('rounds', 'start_length', 'net', 'counts')
+
+    def __init__(self, rounds, start_length):
+        self.rounds = rounds  # [(文本键, 变化量)]
+        self.start_length = start_length
+        self.net = sum(change for _, change in rounds)
+        self.counts = {'increase': 0, 'decrease': 0, 'no_effect': 0}
+        for text_key, _ in rounds:
+            self.counts[text_key] += 1
+
+    @property
+    def final_length(self):
+        return self.start_length + self.net
+
+    def lengths(self):
+        """每轮结束后的长度"""
+        return islice(accumulate((change for _, change in self.rounds), initial=self.start_length), 1, None)
+
+
+def simulate(rounds, start_length, rng=random):
+    """一次性抽取 rounds 轮打胶结果，不修改任何数据"""
+    return DajiaoBatch(rng.choices(_TABLE, cum_weights=_CUM_WEIGHTS, k=rounds), start_length)
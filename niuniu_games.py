@@ -1,4 +1,3 @@
-import random
 import time
 import yaml
 from astrbot.api.all import AstrMessageEvent
@@ -25,17 +24,18 @@ class NiuniuGames:
             return
 
         # 检查是否已经在冲
-        if user_data.get('is_rushing', False):
-            remaining_time = user_data['rush_start_time'] + 1800 - time.time()
+        if user_data.is_rushing:
+            remaining_time = user_data.rush_start_time + 1800 - time.time()
             if remaining_time > 0:
                 mins = int(remaining_time // 60) + 1
                 yield event.plain_result(f"⏳ {nickname} 你已经在冲了")
                 return
 
         # 开始
-        user_data['is_rushing'] = True
-        user_data['rush_start_time'] = time.time()
-        self.main._save_niuniu_lengths()
+        user_data.is_rushing = True
+        user_data.rush_start_time = time.time()
+        self.main._save_niuniu_lengths(group_id, user_id)
+        self.main.rush.schedule(group_id, user_id, user_data.rush_start_time)  # 30分钟后自动结算
 
         yield event.plain_result(f"💪 {nickname} 芜湖！开冲！你暂时无法主动打胶或者比划！输入\"停止开冲\"来结束并结算金币。")
 
@@ -52,35 +52,24 @@ class NiuniuGames:
             return
 
         # 检查是否在冲
-        if not user_data.get('is_rushing', False):
+        if not user_data.is_rushing:
             yield event.plain_result(f"❌ {nickname} 你当前没有在冲")
             return
 
         # 计算时间
-        work_time = time.time() - user_data['rush_start_time']
+        work_time = time.time() - user_data.rush_start_time
 
         # 如果时间少于10分钟，没有奖励
         if work_time < 600:  # 10分钟 = 600秒
             yield event.plain_result(f"❌ {nickname} 至少冲够十分钟才能停")
             return
 
-        # 如果时间超过30分钟，按30分钟计算
-        work_time = min(work_time, 1800)  # 30分钟 = 1800秒
-
-        # 动态计算金币奖励
-        coins_per_minute = random.randint(1, 2)
-        coins = int((work_time / 60) * coins_per_minute)
-
-        # 更新用户金币
-        user_data['coins'] = user_data.get('coins', 0) + coins
-        self.main._save_niuniu_lengths()
+        # 按时长发放金币（超过30分钟按30分钟计算）并结束开冲
+        coins = self.main.rush.settle(group_id, user_id, user_data)
+        self.main._save_niuniu_lengths(group_id, user_id)
 
         yield event.plain_result(f"🎉 {nickname} 总算冲够了！你获得了 {coins} 金币！")
 
-        # 重置状态
-        user_data['is_rushing'] = False
-        self.main._save_niuniu_lengths()
-
     async def fly_plane(self, event: AstrMessageEvent):
         """飞机游戏"""
         group_id = str(event.message_obj.group_id)
@@ -99,7 +88,7 @@ class NiuniuGames:
             return
 
         # 检查冷却时间
-        last_fly_time = user_data.get('last_fly_time', 0)
+        last_fly_time = user_data.last_fly_time
         current_time = time.time()
         if current_time - last_fly_time < 14400:  # 4小时
             remaining_time = 14400 - (current_time - last_fly_time)
@@ -108,23 +97,24 @@ class NiuniuGames:
             return
 
         # 飞行事件
+        rng = self.main.rng.stream(group_id, user_id)
         fly_events = [
-            {"description": "牛牛没赶上飞机，不过也算出来透了口气", "coins": random.randint(20, 40)},
-            {"description": "竟然赶上了国际航班，遇到了兴奋的大母猴", "coins": random.randint(80, 100)},
-            {"description": "无惊无险，牛牛顺利抵达目的地", "coins": random.randint(70,80)},
-            {"description": "牛牛刚出来就遇到了冷空气，冻得像个鹌鹑似的", "coins": random.randint(40, 60)},
-            {"description": "牛牛好像到奇怪的地方，不过也算是完成了目标", "coins": random.randint(60, 80)}
+            {"description": "牛牛没赶上飞机，不过也算出来透了口气", "coins": rng.randint(20, 40)},
+            {"description": "竟然赶上了国际航班，遇到了兴奋的大母猴", "coins": rng.randint(80, 100)},
+            {"description": "无惊无险，牛牛顺利抵达目的地", "coins": rng.randint(70,80)},
+            {"description": "牛牛刚出来就遇到了冷空气，冻得像个鹌鹑似的", "coins": rng.randint(40, 60)},
+            {"description": "牛牛好像到奇怪的地方，不过也算是完成了目标", "coins": rng.randint(60, 80)}
         ]
 
         # 随机选择一个事件
-        event_data = random.choice(fly_events)
+        event_data = rng.choice(fly_events)
         description = event_data["description"]
         coins = event_data["coins"]
 
         # 更新用户金币
-        user_data['coins'] = user_data.get('coins', 0) + coins
-        user_data['last_fly_time'] = current_time
-        self.main._save_niuniu_lengths()
+        user_data.coins = user_data.coins + coins
+        user_data.last_fly_time = current_time
+        self.main._save_niuniu_lengths(group_id, user_id)
 
         yield event.plain_result(f"🎉 {nickname} {description}！你获得了 {coins} 金币！")
 
@@ -132,10 +122,10 @@ class NiuniuGames:
         """更新用户金币"""
         user_data = self.main.get_user_data(group_id, user_id)
         if user_data:
-            user_data['coins'] = user_data.get('coins', 0) + coins
-            self.main._save_niuniu_lengths()
+            user_data.coins = user_data.coins + coins
+            self.main._save_niuniu_lengths(group_id, user_id)
 
     def get_user_coins(self, group_id: str, user_id: str) -> float:
         """获取用户金币"""
         user_data = self.main.get_user_data(group_id, user_id)
-        return user_data.get('coins', 0) if user_data else 0
+        return user_data.coins if user_data else 0
@@ -0,0 +1,351 @@
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
+
+from niuniu_models import is_user
+
+_length_key = itemgetter(0)
+
+
+class GroupRanking:
+    """单个群组按长度升序排列的索引，元素为 (length, user_id)"""
+    __slots__ = ('entries', 'lengths')
+
+    def __init__(self, group_data):
+        self.lengths = {
+            user_id: user_data.length
+            for user_id, user_data in group_data.items()
+            if is_user(user_data)
+        }
+        self.entries = sorted((length, user_id) for user_id, length in self.lengths.items())
+
+    @classmethod
+    def from_sorted(cls, entries):
+        """由已按 (length, user_id) 升序排列的数据构建，不再排序"""
+        ranking = cls.__new__(cls)
+        ranking.entries = list(entries)
+        ranking.lengths = {user_id: length for length, user_id in ranking.entries}
+        return ranking
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, user_id, length):
+        """更新单个用户的长度，length 为 None 表示移除"""
+        old = self.lengths.get(user_id)
+        if old is not None:
+            if old == length:
+                return
+            del self.entries[bisect_left(self.entries, (old, user_id))]
+            del self.lengths[user_id]
+        if length is not None:
+            self.lengths[user_id] = length
+            insort(self.entries, (length, user_id))
+
+    def top(self, k):
+        """长度最大的 k 个，O(k)"""
+        return [(user_id, length) for length, user_id in reversed(self.entries[-k:])] if k > 0 else []
+
+    def bottom(self, k):
+        """长度最小的 k 个，O(k)"""
+        return [(user_id, length) for length, user_id in self.entries[:k]]
+
+    def rank(self, user_id):
+        """用户的名次（长度相同则名次相同），O(log n)；未上榜返回 None"""
+        length = self.lengths.get(user_id)
+        if length is None:
+            return None
+        return len(self.entries) - bisect_right(self.entries, length, key=_length_key) + 1
+
+
+class RankingIndex:
+    """各群组的排行索引：首次查询时构建，之后随长度变化增量维护"""
+
+    def __init__(self):
+        self._groups = {}
+        self._seeding = {}  # {group_id: 构建期间长度有变化的用户}，None 表示整群有变化
+
+    def __contains__(self, group_id):
+        group_id = str(group_id)
+        return group_id in self._groups or group_id in self._seeding
+
+    def get(self, group_id, group_data):
+        group_id = str(group_id)
+        ranking = self._groups.get(group_id)
+        if ranking is None:
+            ranking = self._groups[group_id] = GroupRanking(group_data)
+        return ranking
+
+    def begin_seed(self, group_id):
+        """开始用存储后端读出的有序数据构建索引，期间的长度变化先记下，构建时补上"""
+        self._seeding[str(group_id)] = set()
+
+    def seed(self, group_id, group_data, entries):
+        """用按 (length, user_id) 升序排列的数据构建索引；entries 为 None 或期间有整群变化时放弃"""
+        group_id = str(group_id)
+        touched = self._seeding.pop(group_id, None)
+        if touched is None or entries is None or group_id in self._groups:
+            return
+        ranking = self._groups[group_id] = GroupRanking.from_sorted(entries)
+        self._apply(ranking, group_data, touched)
+
+    def update(self, group_id, group_data, *user_ids):
+        """同步用户的最新长度；未指定用户时丢弃整个群组索引，下次查询时重建"""
+        group_id = str(group_id)
+        if group_id in self._seeding:
+            touched = self._seeding[group_id]
+            if user_ids and touched is not None:
+                touched.update(user_ids)
+            else:
+                self._seeding[group_id] = None
+        ranking = self._groups.get(group_id)
+        if ranking is None:
+            return
+        if not user_ids:
+            del self._groups[group_id]
+            return
+        self._apply(ranking, group_data, user_ids)
+
+    @staticmethod
+    def _apply(ranking, group_data, user_ids):
+        for user_id in user_ids:
+            user_data = group_data.get(str(user_id))
+            length = user_data.length if is_user(user_data) else None
+            ranking.update(str(user_id), length)
+
+    def drop(self, group_id=None):
+        if group_id is None:
+            self._groups.clear()
+            for key in self._seeding:
+                self._seeding[key] = None
+        else:
+            self._groups.pop(str(group_id), None)
+            if str(group_id) in self._seeding:
+                self._seeding[str(group_id)] = None
+
+
+def _grams(text):
+    """文本中所有的单字和相邻二字组合"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+class GroupNicknames:
+    """单个群组的昵称索引：以小写化后的单字和二字组合索引到用户"""
+    __slots__ = ('names', 'grams')
+
+    def __init__(self, group_data):
+        self.names = {}
+        self.grams = {}
+        for user_id, user_data in group_data.items():
+            if is_user(user_data):
+                self.update(user_id, user_data.nickname)
+
+    def update(self, user_id, nickname):
+        """更新单个用户的昵称，nickname 为 None 表示移除"""
+        folded = nickname.casefold() if nickname else None
+        old = self.names.get(user_id)
+        if old == folded:
+            return
+        if old is not None:
+            for gram in _grams(old):
+                users = self.grams.get(gram)
+                if users is not None:
+                    users.discard(user_id)
+                    if not users:
+                        del self.grams[gram]
+            del self.names[user_id]
+        if folded:
+            self.names[user_id] = folded
+            for gram in _grams(folded):
+                self.grams.setdefault(gram, set()).add(user_id)
+
+    def search(self, keyword):
+        """返回昵称包含关键词的所有用户，完全匹配的排在前面"""
+        folded = keyword.casefold()
+        if not folded:
+            return []
+        keys = _grams(folded) if len(folded) <= 2 else {folded[i:i + 2] for i in range(len(folded) - 1)}
+        candidate_sets = sorted((self.grams.get(key, set()) for key in keys), key=len)
+        if not candidate_sets or not candidate_sets[0]:
+            return []
+        users = set(candidate_sets[0]).intersection(*candidate_sets[1:])
+        matched = [user_id for user_id in users if folded in self.names[user_id]]
+        return sorted(matched, key=lambda user_id: (self.names[user_id] != folded, len(self.names[user_id]), user_id))
+
+
+class NicknameIndex:
+    """各群组的昵称索引：首次搜索时构建，之后随注册和改名增量维护"""
+
+    def __init__(self):
+        self._groups = {}
+
+    def get(self, group_id, group_data):
+        group_id = str(group_id)
+        nicknames = self._groups.get(group_id)
+        if nicknames is None:
+            nicknames = self._groups[group_id] = GroupNicknames(group_data)
+        return nicknames
+
+    def update(self, group_id, group_data, *user_ids):
+        """同步用户的最新昵称；未指定用户时丢弃整个群组索引，下次搜索时重建"""
+        group_id = str(group_id)
+        nicknames = self._groups.get(group_id)
+        if nicknames is None:
+            return
+        if not user_ids:
+            del self._groups[group_id]
+            return
+        for user_id in user_ids:
+            user_data = group_data.get(str(user_id))
+            nicknames.update(str(user_id), user_data.nickname if is_user(user_data) else None)
+
+    def drop(self, group_id=None):
+        if group_id is None:
+            self._groups.clear()
+        else:
+            self._groups.pop(str(group_id), None)
+
+
+class BoundedRanking:
+    """全服排行的一端：只保留最靠前的 capacity 名，元素为 (排序键, group_id, user_id)
+
+    不变式：不在榜上的用户都排在榜上最后一名之后，因此榜上的 n 人就是全服的前 n 名。
+    榜上的人被移除或名次跌出榜尾后，榜外的人无法在不扫描的情况下补上，由定期校准重建。
+    """
+    __slots__ = ('capacity', 'sign', 'entries', 'members', 'truncated')
+
+    def __init__(self, capacity, descending):
+        self.capacity = capacity
+        self.sign = -1 if descending else 1  # 排序键为 sign * 长度，升序即名次顺序
+        self.entries = []
+        self.members = {}       # {(group_id, user_id): (长度, 昵称)}
+        self.truncated = False  # 榜外是否还有用户
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _insert(self, key, length, nickname):
+        self.members[key] = (length, nickname)
+        insort(self.entries, (self.sign * length, *key))
+        if len(self.entries) > self.capacity:
+            _, group_id, user_id = self.entries.pop()
+            del self.members[(group_id, user_id)]
+            self.truncated = True
+
+    def update(self, key, length, nickname):
+        """更新用户的长度，length 为 None 表示移除，返回榜单是否变化"""
+        old = self.members.get(key)
+        if old is not None:
+            if old == (length, nickname):
+                return False
+            last = self.entries[-1][0]
+            del self.entries[bisect_left(self.entries, (self.sign * old[0], *key))]
+            del self.members[key]
+            # 名次跌出原来的榜尾时，榜外可能有人排在它前面，只能先移出榜单
+            if length is not None and (self.sign * length <= last or not self.truncated):
+                self._insert(key, length, nickname)
+            return True
+        if length is None:
+            return False
+        if not self.truncated and len(self.entries) < self.capacity:
+            self._insert(key, length, nickname)
+            return True
+        if self.entries and self.sign * length < self.entries[-1][0]:
+            self._insert(key, length, nickname)
+            return True
+        self.truncated = True  # 没有进入榜单的用户留在榜外
+        return False
+
+    def first(self, k):
+        """前 k 名 [(group_id, user_id, 昵称, 长度)]，O(k)"""
+        return [self._record(group_id, user_id) for _, group_id, user_id in self.entries[:k]]
+
+    def _record(self, group_id, user_id):
+        length, nickname = self.members[(group_id, user_id)]
+        return group_id, user_id, nickname, length
+
+    def complete(self, k):
+        """榜上是否确定有全服的前 k 名"""
+        return len(self.entries) >= k or not self.truncated
+
+    def rebuild(self, records):
+        """用全量数据 [(group_id, user_id, 昵称, 长度)] 重建"""
+        best = heapq.nsmallest(self.capacity, records, key=lambda r: (self.sign * r[3], r[0], r[1]))
+        self.entries = [(self.sign * length, group_id, user_id) for group_id, user_id, _, length in best]
+        self.members = {(group_id, user_id): (length, nickname) for group_id, user_id, nickname, length in best}
+        self.truncated = len(records) > len(best)
+
+    def to_data(self):
+        return {
+            'truncated': self.truncated,
+            'entries': [list(self._record(group_id, user_id)) for _, group_id, user_id in self.entries],
+        }
+
+    def load(self, data):
+        records = [tuple(entry) for entry in data.get('entries', ()) if len(entry) == 4]
+        self.rebuild(records)
+        self.truncated = bool(data.get('truncated', False)) or self.truncated
+
+
+class GlobalRanking:
+    """全服排行：长度最大和最小的两端各保留 capacity 名，随长度变化增量维护，查询 O(k)"""
+
+    VERSION = 1
+
+    def __init__(self, capacity=50):
+        self.capacity = capacity
+        self.top = BoundedRanking(capacity, descending=True)
+        self.bottom = BoundedRanking(capacity, descending=False)
+        self.stale = True        # 有整群变化（开关插件、批量修改等）或从未构建过，需要校准
+        self.reconciled_at = 0   # 上次校准的时间戳
+        self.update_count = 0
+        self.reconcile_count = 0
+
+    def update(self, group_id, user_id, length, nickname=None):
+        """同步用户的最新长度，length 为 None 表示移除，返回榜单是否变化"""
+        key = (str(group_id), str(user_id))
+        changed = self.top.update(key, length, nickname)
+        changed = self.bottom.update(key, length, nickname) or changed
+        if changed:
+            self.update_count += 1
+        return changed
+
+    def complete(self, k):
+        return self.top.complete(k) and self.bottom.complete(k)
+
+    def rebuild(self, records, now):
+        self.top.rebuild(records)
+        self.bottom.rebuild(records)
+        self.stale = False
+        self.reconciled_at = now
+        self.reconcile_count += 1
+
+    def to_data(self):
+        return {
+            'version': self.VERSION,
+            'capacity': self.capacity,
+            'reconciled_at': self.reconciled_at,
+            'stale': self.stale,
+            'top': self.top.to_data(),
+            'bottom': self.bottom.to_data(),
+        }
+
+    def load(self, data):
+        """读取持久化的榜单；版本或容量不一致时保持待校准状态"""
+        if not isinstance(data, dict) or data.get('version') != self.VERSION or data.get('capacity') != self.capacity:
+            return
+        self.top.load(data.get('top') or {})
+        self.bottom.load(data.get('bottom') or {})
+        self.reconciled_at = data.get('reconciled_at', 0)
+        self.stale = bool(data.get('stale', False))
+
+    def stats(self):
+        return {
+            'top': len(self.top),
+            'bottom': len(self.bottom),
+            'updates': self.update_count,
+            'reconciles': self.reconcile_count,
+            'stale': self.stale,
+        }
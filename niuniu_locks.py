@@ -0,0 +1,66 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class UserLockManager:
+    """按 (group_id, user_id) 分配的异步锁，不同群组之间互不竞争"""
+
+    def __init__(self):
+        self._locks = {}  # {group_id: {user_id: [lock, 引用计数]}}
+        self.wait_count = 0  # 因锁被占用而等待的次数
+
+    def _acquire_entry(self, group_id, user_id):
+        group_locks = self._locks.setdefault(group_id, {})
+        entry = group_locks.get(user_id)
+        if entry is None:
+            entry = group_locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry
+
+    def _release_entry(self, group_id, user_id):
+        group_locks = self._locks.get(group_id)
+        if not group_locks:
+            return
+        entry = group_locks.get(user_id)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del group_locks[user_id]
+            if not group_locks:
+                del self._locks[group_id]
+
+    @asynccontextmanager
+    async def hold(self, group_id, *user_ids):
+        """锁住同一群组内的一个或多个用户，按固定顺序加锁以避免死锁"""
+        group_id = str(group_id)
+        ordered = sorted({str(user_id) for user_id in user_ids if user_id is not None})
+        entries = [self._acquire_entry(group_id, user_id) for user_id in ordered]
+        acquired = []
+        try:
+            for entry in entries:
+                if entry[0].locked():
+                    self.wait_count += 1
+                await entry[0].acquire()
+                acquired.append(entry)
+            yield
+        finally:
+            for entry in reversed(acquired):
+                entry[0].release()
+            for user_id in ordered:
+                self._release_entry(group_id, user_id)
+
+    def held_users(self, group_id):
+        """群组内正在持有或等待锁的用户"""
+        return list(self._locks.get(str(group_id), ()))
+
+    def is_group_busy(self, group_id):
+        """群组内是否有正在执行的指令"""
+        return str(group_id) in self._locks
+
+    def stats(self):
+        return {
+            'groups': len(self._locks),
+            'held': sum(len(group_locks) for group_locks in self._locks.values()),
+            'waits': self.wait_count,
+        }
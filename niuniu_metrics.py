@@ -0,0 +1,120 @@
+import time
+from bisect import bisect_left
+
+# 延迟分桶上界（毫秒），最后一个桶收集超过 5 秒的记录
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LatencyHistogram:
+    """固定分桶的延迟直方图：记录为 O(log 桶数)，内存占用与记录次数无关"""
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, pct):
+        """估算分位数：返回该分位所在桶的上界（不超过实际最大值）"""
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.max
+                return round(min(bound, self.max), 3)
+        return round(self.max, 3)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 3) if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max, 3),
+        }
+
+
+class Metrics:
+    """运行统计：每个指令的处理耗时，以及热点代码段的耗时"""
+
+    def __init__(self, log_interval=0, logger=None):
+        self.commands = {}  # {指令: LatencyHistogram}
+        self.timings = {}   # {代码段: LatencyHistogram}
+        self.errors = 0
+        self.log_interval = log_interval  # 定期输出统计日志的间隔（秒），0 表示不输出
+        self.logger = logger
+        self.started = time.monotonic()
+        self._last_log = self.started
+
+    def record_command(self, command, seconds):
+        histogram = self.commands.get(command)
+        if histogram is None:
+            histogram = self.commands[command] = LatencyHistogram()
+        histogram.record(seconds * 1000)
+
+    def record_timing(self, name, seconds):
+        histogram = self.timings.get(name)
+        if histogram is None:
+            histogram = self.timings[name] = LatencyHistogram()
+        histogram.record(seconds * 1000)
+
+    async def track(self, command, results):
+        """逐条转发处理器的回复并计时；回复被发送出去的时间不计入处理耗时"""
+        elapsed = 0.0
+        start = time.perf_counter()
+        try:
+            async for result in results:
+                elapsed += time.perf_counter() - start
+                yield result
+                start = time.perf_counter()
+            elapsed += time.perf_counter() - start
+        except Exception:
+            self.errors += 1
+            elapsed += time.perf_counter() - start
+            raise
+        finally:
+            self.record_command(command, elapsed)
+
+    def due(self):
+        """是否到了定期输出统计日志的时间"""
+        if self.log_interval <= 0:
+            return False
+        now = time.monotonic()
+        if now - self._last_log < self.log_interval:
+            return False
+        self._last_log = now
+        return True
+
+    def stats(self):
+        return {
+            'uptime': round(time.monotonic() - self.started, 1),
+            'errors': self.errors,
+            'commands': {name: h.summary() for name, h in self.commands.items()},
+            'timings': {name: h.summary() for name, h in self.timings.items()},
+        }
+
+
+def format_histograms(title, histograms):
+    """把直方图格式化为文本，按累计耗时从高到低排列"""
+    lines = [title]
+    for name, h in sorted(histograms.items(), key=lambda item: item[1].total, reverse=True):
+        s = h.summary()
+        lines.append(
+            f"🔹 {name}：{s['count']}次 平均{s['avg_ms']}ms "
+            f"p50≤{s['p50_ms']} p95≤{s['p95_ms']} p99≤{s['p99_ms']} 最大{s['max_ms']}ms"
+        )
+    if len(lines) == 1:
+        lines.append("🔹 暂无记录")
+    return lines
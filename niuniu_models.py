@@ -0,0 +1,142 @@
+SCHEMA_VERSION = 2
+
+
+def _migrate_legacy(data):
+    """版本 0：旧版自由格式字典，补全缺失字段"""
+    data = dict(data)
+    data.setdefault('coins', 0)
+    data.setdefault('items', {})
+    return data
+
+
+def _migrate_last_active(data):
+    """版本 1 -> 2：新增最后活跃时间，取已记录的开冲或飞飞机时间，都没有时为 0（未知）"""
+    data = dict(data)
+    data.setdefault('last_active', max(data.get('rush_start_time') or 0, data.get('last_fly_time') or 0))
+    return data
+
+
+# {旧版本号: 升级到下一版本的函数}，每个函数接收并返回字段字典
+MIGRATIONS = {
+    0: _migrate_legacy,
+    1: _migrate_last_active,
+}
+
+
+class UserRecord:
+    """用户数据记录
+
+    磁盘上以紧凑列表保存：[版本号, 字段1, 字段2, ...]，未知字段放在末尾的 extra 字典中。
+    同时保留字典式访问（user_data['length']），兼容自定义道具效果和旧代码。
+    """
+    __slots__ = ('nickname', 'length', 'hardness', 'coins', 'items',
+                 'is_rushing', 'rush_start_time', 'last_fly_time', 'last_active', 'extra')
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, nickname='', length=0, hardness=1, coins=0, items=None,
+                 is_rushing=False, rush_start_time=0, last_fly_time=0, last_active=0, extra=None):
+        self.nickname = nickname
+        self.length = length
+        self.hardness = hardness
+        self.coins = coins
+        self.items = items if items is not None else {}
+        self.is_rushing = is_rushing
+        self.rush_start_time = rush_start_time
+        self.last_fly_time = last_fly_time
+        self.last_active = last_active
+        self.extra = extra or None
+
+    # region 编解码
+    @classmethod
+    def from_dict(cls, data, version=0):
+        """从字段字典创建记录，按需执行迁移"""
+        while version < SCHEMA_VERSION:
+            data = MIGRATIONS[version](data)
+            version += 1
+        fields = {key: data[key] for key in cls.FIELDS if key in data}
+        extra = {key: value for key, value in data.items() if key not in cls.FIELDS}
+        return cls(extra=extra, **fields)
+
+    def to_dict(self):
+        """导出为字段字典（便于查看和导出 YAML）"""
+        data = {key: getattr(self, key) for key in self.FIELDS}
+        data['items'] = dict(self.items)
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def to_compact(self):
+        """导出为紧凑列表，道具字典会被复制，可安全交给后台线程序列化"""
+        compact = [SCHEMA_VERSION, self.nickname, self.length, self.hardness, self.coins, dict(self.items),
+                   self.is_rushing, self.rush_start_time, self.last_fly_time, self.last_active]
+        if self.extra:
+            compact.append(dict(self.extra))
+        return compact
+
+    @classmethod
+    def from_compact(cls, compact):
+        version = compact[0]
+        if version == SCHEMA_VERSION:
+            return cls(*compact[1:])
+        # 旧版本的列表先还原为字典再逐级迁移
+        names = COMPACT_LAYOUTS[version]
+        data = dict(zip(names, compact[1:len(names) + 1]))
+        if len(compact) > len(names) + 1:
+            data.update(compact[len(names) + 1] or {})
+        return cls.from_dict(data, version)
+
+    @classmethod
+    def decode(cls, raw):
+        """解析磁盘上的用户数据，兼容旧版字典格式"""
+        if isinstance(raw, cls):
+            return raw
+        if isinstance(raw, (list, tuple)):
+            return cls.from_compact(raw)
+        return cls.from_dict(raw)
+
+    def assign(self, other):
+        """用另一条记录的内容原地替换，已持有本对象引用的代码也能看到新值"""
+        for name in self.__slots__:
+            setattr(self, name, getattr(other, name))
+    # endregion
+
+    # region 字典式访问
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.FIELDS or bool(self.extra and key in self.extra)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    # endregion
+
+    def __repr__(self):
+        return f"UserRecord({self.to_dict()!r})"
+
+
+# 各历史版本紧凑列表的字段顺序，当前版本为 UserRecord.FIELDS
+COMPACT_LAYOUTS = {
+    1: ('nickname', 'length', 'hardness', 'coins', 'items', 'is_rushing', 'rush_start_time', 'last_fly_time'),
+    SCHEMA_VERSION: UserRecord.FIELDS,
+}
+
+
+def is_user(value):
+    """群组数据中的值是否为用户记录"""
+    return isinstance(value, UserRecord)
@@ -0,0 +1,195 @@
+"""随机数服务：每个群组独立的随机数流，可指定种子复现结果，并可记录审计日志
+
+审计日志每行记录一条指令使用的种子和偏移量片段 [[offset, count], ...]，可用命令行工具复现当时抽到的随机数：
+
+    python niuniu_rng.py replay --seed 123456 --offset 40 --count 6
+"""
+import argparse
+import hashlib
+import json
+import random
+import secrets
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect
+from contextlib import contextmanager
+from functools import partial
+
+from niuniu_storage import WriteBehindWriter, append_lines
+
+
+def derive_seed(master_seed, key):
+    """由主种子和名称派生出子种子"""
+    digest = hashlib.blake2b(f"{master_seed}:{key}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class _Draws:
+    """基于 random() 的常用抽取方法"""
+    __slots__ = ()
+
+    def randint(self, a, b):
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def choices(self, population, cum_weights, k=1):
+        total = cum_weights[-1]
+        hi = len(population) - 1
+        random_ = self.random
+        return [population[bisect(cum_weights, random_() * total, 0, hi)] for _ in range(k)]
+
+
+class GroupStream(_Draws):
+    """单个群组的随机数流：按批预先抽取 [0, 1) 均匀分布随机数
+
+    offset 为已消耗的随机数个数，Random(seed) 的第 offset 个输出即下一次抽到的值，
+    因此 (seed, offset) 可以精确复现任意一次结果。
+    """
+    __slots__ = ('seed', 'offset', 'batch', '_rng', '_buffer', '_pos')
+
+    def __init__(self, seed, batch=64):
+        self.seed = seed
+        self.offset = 0
+        self.batch = batch
+        self._rng = random.Random(seed)
+        self._buffer = array('d')
+        self._pos = 0
+
+    @classmethod
+    def at(cls, seed, offset):
+        """从指定偏移量开始的随机数流（用于复现）"""
+        stream = cls(seed)
+        for _ in range(offset):
+            stream.random()
+        return stream
+
+    def random(self):
+        if self._pos >= len(self._buffer):
+            rand = self._rng.random
+            self._buffer = array('d', [rand() for _ in range(self.batch)])
+            self._pos = 0
+        value = self._buffer[self._pos]
+        self._pos += 1
+        self.offset += 1
+        return value
+
+
+class AuditedStream(_Draws):
+    """记录一条指令实际使用了群组随机数流中的哪些位置
+
+    同一群组的其他指令可能在中途插入抽取，因此按连续片段记录 [起始偏移量, 个数]。
+    """
+    __slots__ = ('stream', 'segments')
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.segments = []
+
+    def random(self):
+        offset = self.stream.offset
+        segments = self.segments
+        if segments and segments[-1][0] + segments[-1][1] == offset:
+            segments[-1][1] += 1
+        else:
+            segments.append([offset, 1])
+        return self.stream.random()
+
+
+class RngService:
+    """按群组分配随机数流，可选把每条指令使用的种子和偏移量写入审计日志"""
+
+    def __init__(self, seed=None, audit_path=None, logger=None, io_pool=None, flush_interval=5.0, batch=64):
+        self.master_seed = secrets.randbits(64) if seed is None else seed
+        self.batch = batch
+        self.audit_path = audit_path
+        self.logger = logger
+        self._streams = {}
+        self._generations = {}  # 群组随机数流被释放后重建时使用新的子种子，避免重复同一序列
+        self._active = {}       # {(group_id, user_id): AuditedStream}，正在执行的指令
+        self._pending = []      # 待写入的审计记录，写入在线程池中进行，读写都需持有 _lock
+        self._lock = threading.Lock()
+        self.audit_count = 0
+        self.cosmetic = random.Random(derive_seed(self.master_seed, 'cosmetic'))  # 只影响文本变体，不记录审计
+        self.audit_writer = WriteBehindWriter('rng_audit', self._write_audit, flush_interval, logger, io_pool) if audit_path else None
+
+    def stream(self, group_id, user_id=None):
+        """群组的随机数流；该用户的指令正在审计时返回记录用的包装"""
+        group_id = str(group_id)
+        if self._active:
+            active = self._active.get((group_id, str(user_id)))
+            if active is not None:
+                return active
+        stream = self._streams.get(group_id)
+        if stream is None:
+            generation = self._generations.get(group_id, 0)
+            self._generations[group_id] = generation + 1
+            seed = derive_seed(self.master_seed, f"{group_id}#{generation}")
+            stream = self._streams[group_id] = GroupStream(seed, self.batch)
+        return stream
+
+    def drop(self, group_id):
+        self._streams.pop(str(group_id), None)
+
+    @contextmanager
+    def draw(self, group_id, user_id, command, message=''):
+        """审计一条指令：记录其间该用户抽取的随机数所在的种子和偏移量"""
+        if not self.audit_writer:
+            yield
+            return
+        key = (str(group_id), str(user_id))
+        audited = self._active[key] = AuditedStream(self.stream(group_id))
+        try:
+            yield
+        finally:
+            self._active.pop(key, None)
+            if audited.segments:
+                entry = {
+                    't': round(time.time(), 3), 'g': key[0], 'u': key[1], 'cmd': command, 'msg': message,
+                    'seed': audited.stream.seed, 'draws': audited.segments,
+                }
+                with self._lock:
+                    self._pending.append(entry)
+                self.audit_count += 1
+                self.audit_writer.mark_dirty()
+
+    def _write_audit(self, dirty_groups, dirty_users):
+        with self._lock:
+            entries, self._pending = self._pending, []
+        return partial(self._append, entries)
+
+    def _append(self, entries):
+        """写入审计日志；失败时把这批记录放回待写队列最前面，由写回器重试"""
+        try:
+            append_lines(self.audit_path, [json.dumps(entry, ensure_ascii=False) for entry in entries])
+        except Exception:
+            with self._lock:
+                self._pending[:0] = entries
+            raise
+
+    async def close(self):
+        if self.audit_writer:
+            await self.audit_writer.close()
+
+    def stats(self):
+        return {'streams': len(self._streams), 'audited': self.audit_count}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="复现审计日志中记录的随机数")
+    sub = parser.add_subparsers(dest='command', required=True)
+    replay = sub.add_parser('replay', help="输出指定种子和偏移量处抽到的随机数")
+    replay.add_argument('--seed', type=int, required=True)
+    replay.add_argument('--offset', type=int, required=True)
+    replay.add_argument('--count', type=int, default=1)
+    args = parser.parse_args(argv)
+    stream = GroupStream.at(args.seed, args.offset)
+    for i in range(args.count):
+        print(f"{args.offset + i}\t{stream.random():.17f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
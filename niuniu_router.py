@@ -0,0 +1,59 @@
+from itertools import islice
+
+
+class Route:
+    """一条命令路由"""
+    __slots__ = ('command', 'handler', 'requires_enabled', 'blocks_rushing', 'lock', 'hits')
+
+    def __init__(self, command, handler, requires_enabled=True, blocks_rushing=True, lock='user'):
+        self.command = command
+        self.handler = handler
+        self.requires_enabled = requires_enabled  # 插件未启用时是否忽略
+        self.blocks_rushing = blocks_rushing      # 开冲期间是否禁止使用
+        self.lock = lock                          # None / 'user' / 'pair'
+        self.hits = 0
+
+
+class CommandRouter:
+    """基于前缀树的命令路由：启动时构建一次，非命令消息在首字符处即被拒绝"""
+    _ROUTE = object()  # 前缀树节点中存放路由的键
+
+    def __init__(self):
+        self._root = {}
+        self.routes = []
+        self.miss_count = 0
+
+    def add(self, command, handler, **options):
+        route = Route(command, handler, **options)
+        node = self._root
+        for char in command:
+            node = node.setdefault(char, {})
+        node[self._ROUTE] = route
+        self.routes.append(route)
+        return route
+
+    def match(self, msg, count=True):
+        """返回与消息前缀匹配的最长命令，没有匹配时返回 None"""
+        node = self._root.get(msg[:1])
+        if node is None:
+            if count:
+                self.miss_count += 1
+            return None
+        route = node.get(self._ROUTE)
+        for char in islice(msg, 1, None):
+            node = node.get(char)
+            if node is None:
+                break
+            route = node.get(self._ROUTE, route)
+        if count:
+            if route is None:
+                self.miss_count += 1
+            else:
+                route.hits += 1
+        return route
+
+    def stats(self):
+        return {
+            'hits': {route.command: route.hits for route in self.routes},
+            'misses': self.miss_count,
+        }
@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import time
+from functools import partial
+
+from niuniu_storage import WriteBehindWriter, atomic_dump, load_data
+
+RUSH_MIN_SECONDS = 600    # 至少冲够 10 分钟才有金币
+RUSH_MAX_SECONDS = 1800   # 最多按 30 分钟结算，到时自动结束
+
+
+class RushScheduler:
+    """开冲结算调度：进行中的开冲按到期时间放在一个最小堆里，由一个后台任务在到期时批量结算
+
+    active 记录 {(群号, 用户): 开始时间}，是进行中开冲的唯一来源并持久化到文件；
+    堆中的条目在提前停止后不会立即删除，弹出时与 active 不一致的直接丢弃。
+    """
+
+    def __init__(self, main_plugin, path, flush_interval=5.0, batch_window=1.0):
+        self.main = main_plugin
+        self.path = path
+        self.batch_window = batch_window  # 到期时间相近的开冲合并为一批结算（秒）
+        self.codec = main_plugin._get_codec()
+        self.active = {}
+        self._heap = []   # [(到期时间, 群号, 用户, 开始时间)]
+        self._task = None
+        self._wakeup = None
+        self._restored = False
+        self.settled_count = 0
+        self.batch_count = 0
+        self.writer = WriteBehindWriter('rushes', self._write, flush_interval, main_plugin.context.logger, main_plugin.io_pool)
+
+    # region 持久化
+    def _write(self, dirty_groups, dirty_users):
+        data = {}
+        for (group_id, user_id), start in self.active.items():
+            data.setdefault(group_id, {})[user_id] = start
+        return partial(atomic_dump, self.path, data, self.codec)
+
+    async def restore(self):
+        """首次收到指令时读取进行中的开冲，一次性重建堆并启动后台任务"""
+        if self._restored:
+            return
+        self._restored = True
+        try:
+            data = await self.main.io_pool.run(load_data, self.path, {})
+        except Exception as e:
+            self.main.context.logger.error(f"加载开冲数据失败: {str(e)}")
+            data = {}
+        for group_id, users in (data or {}).items():
+            for user_id, start in (users or {}).items():
+                self.active.setdefault((str(group_id), str(user_id)), start)
+        self._heap = [(start + RUSH_MAX_SECONDS, group_id, user_id, start) for (group_id, user_id), start in self.active.items()]
+        heapq.heapify(self._heap)
+        self._start_task()
+
+    async def close(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.writer.close()
+    # endregion
+
+    # region 调度
+    def schedule(self, group_id, user_id, start):
+        """登记一次开冲，到期时自动结算"""
+        key = (str(group_id), str(user_id))
+        self.active[key] = start
+        entry = (start + RUSH_MAX_SECONDS, key[0], key[1], start)
+        heapq.heappush(self._heap, entry)
+        self.writer.mark_dirty()
+        if self._heap[0] is entry and self._wakeup is not None:
+            self._wakeup.set()  # 新条目成为最早到期的，唤醒后台任务重新计时
+        self._start_task()
+
+    def ensure(self, group_id, user_id, user_data, now=None):
+        """处理未登记的开冲（例如旧版本留下的数据）：已超时的立即结算，否则补登记，返回结算的金币"""
+        key = (str(group_id), str(user_id))
+        if key in self.active:
+            return None
+        now = time.time() if now is None else now
+        if user_data.rush_start_time + RUSH_MAX_SECONDS <= now:
+            coins = self.settle(group_id, user_id, user_data, now)
+            self.main._save_niuniu_lengths(group_id, user_id)
+            return coins
+        self.schedule(group_id, user_id, user_data.rush_start_time)
+        return None
+
+    def _start_task(self):
+        if self._task is not None or not self._heap:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # 没有事件循环时等首次收到指令后再启动
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        try:
+            while self._heap:
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                due = {}
+                limit = time.time() + self.batch_window
+                while self._heap and self._heap[0][0] <= limit:
+                    _, group_id, user_id, start = heapq.heappop(self._heap)
+                    if self.active.get((group_id, user_id)) == start:
+                        due.setdefault(group_id, []).append(user_id)
+                for group_id, user_ids in due.items():
+                    try:
+                        await self._settle_group(group_id, user_ids)
+                    except Exception as e:
+                        self.main.context.logger.error(f"自动结算开冲失败: {str(e)}")
+        finally:
+            if self._task is asyncio.current_task():
+                self._task = None
+    # endregion
+
+    # region 结算
+    def coins_for(self, group_id, user_id, work_time):
+        """按开冲时长计算金币（最多按 30 分钟计）"""
+        coins_per_minute = self.main.rng.stream(group_id, user_id).randint(1, 2)
+        return int((min(work_time, RUSH_MAX_SECONDS) / 60) * coins_per_minute)
+
+    def settle(self, group_id, user_id, user_data, now=None):
+        """结束开冲并发放金币（不足 10 分钟不发放），返回获得的金币；调用方负责保存"""
+        now = time.time() if now is None else now
+        work_time = now - user_data.rush_start_time
+        coins = self.coins_for(group_id, user_id, work_time) if work_time >= RUSH_MIN_SECONDS else 0
+        user_data.coins = user_data.coins + coins
+        user_data.is_rushing = False
+        if self.active.pop((str(group_id), str(user_id)), None) is not None:
+            self.writer.mark_dirty()
+        self.settled_count += 1
+        return coins
+
+    async def _settle_group(self, group_id, user_ids):
+        """结算同一群组内到期的开冲：加锁后一次修改，只标记保存一次"""
+        main = self.main
+        await main.niuniu_lengths.preload(group_id, main.io_pool)
+        async with main.locks.hold(group_id, *user_ids):
+            settled = []
+            now = time.time()
+            for user_id in user_ids:
+                user_data = main.get_user_data(group_id, user_id)
+                start = self.active.get((group_id, user_id))
+                if user_data is None or not user_data.is_rushing or user_data.rush_start_time != start:
+                    self.active.pop((group_id, user_id), None)  # 已被停止或数据已变化
+                    continue
+                self.settle(group_id, user_id, user_data, now)
+                settled.append(user_id)
+            if settled:
+                main._save_niuniu_lengths(group_id, *settled)
+            self.writer.mark_dirty()
+            self.batch_count += 1
+    # endregion
+
+    def stats(self):
+        return {
+            'active': len(self.active),
+            'heap': len(self._heap),
+            'settled': self.settled_count,
+            'batches': self.batch_count,
+        }
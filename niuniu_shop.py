@@ -1,13 +1,151 @@
 import os
+import time
+import threading
 import yaml
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from astrbot.api.all import Context, AstrMessageEvent
+from niuniu_storage import WriteBehindWriter, load_data
+from niuniu_cache import Lazy
+from niuniu_catalog import ShopCatalog
+from niuniu_codec import SafeLoader, SafeDumper
+
+SIGN_DATA_FILE = os.path.join('data', 'sign_data.yml')
+
+
+class SignCoinCache:
+    """签到插件金币缓存：文件 mtime/大小变化时才重新解析，写入以增量合并"""
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval  # 两次检查文件状态的最小间隔（秒）
+        self._lock = threading.Lock()
+        self._data: Dict[str, Any] = {}
+        self._key: Optional[Tuple[int, int]] = None
+        self._last_check = 0.0
+        self._pending: Dict[Tuple[str, str], float] = {}   # 尚未写入的金币增量
+        self._inflight: Dict[Tuple[str, str], float] = {}  # 正在写入的金币增量
+        self.parse_count = 0
+        self.conflict_count = 0
+
+    def _stat_key(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _parse(self) -> Dict[str, Any]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self.parse_count += 1
+            return yaml.load(f, Loader=SafeLoader) or {}
+
+    def needs_check(self) -> bool:
+        return time.monotonic() - self._last_check >= self.check_interval
+
+    def refresh(self):
+        """文件被签到插件修改过时重新解析（阻塞调用，应在线程池中执行）"""
+        key = self._stat_key()
+        self._last_check = time.monotonic()
+        if key == self._key:
+            return
+        data = self._parse()
+        with self._lock:
+            self._data, self._key = data, key
+
+    def get(self, group_id: str, user_id: str) -> float:
+        with self._lock:
+            coins = self._data.get(group_id, {}).get(user_id, {}).get('coins', 0.0)
+            key = (group_id, user_id)
+            return coins + self._pending.get(key, 0.0) + self._inflight.get(key, 0.0)
+
+    def add(self, group_id: str, user_id: str, delta: float):
+        """记录金币增减，实际写入时基于文件最新内容合并"""
+        with self._lock:
+            key = (group_id, user_id)
+            self._pending[key] = self._pending.get(key, 0.0) + delta
+
+    def take_pending(self) -> Dict[Tuple[str, str], float]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            for key, delta in pending.items():
+                self._inflight[key] = self._inflight.get(key, 0.0) + delta
+            return pending
+
+    def write(self, pending: Dict[Tuple[str, str], float]):
+        """把增量合并进文件；若签到插件在此期间修改过文件，则基于最新内容合并"""
+        try:
+            if self._stat_key() != self._key:
+                self.conflict_count += 1
+                data = self._parse()
+            else:
+                with self._lock:
+                    data = {gid: dict(users) for gid, users in self._data.items()}
+            for (group_id, user_id), delta in pending.items():
+                user_data = dict(data.setdefault(group_id, {}).get(user_id, {}))
+                user_data['coins'] = user_data.get('coins', 0.0) + delta
+                data[group_id][user_id] = user_data
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                yaml.dump(data, f, Dumper=SafeDumper, allow_unicode=True)
+            os.replace(tmp_path, self.path)
+            key = self._stat_key()
+        except Exception:
+            # 写入失败时把增量放回待写队列
+            with self._lock:
+                for k, delta in pending.items():
+                    self._inflight[k] = self._inflight.get(k, 0.0) - delta
+                    self._pending[k] = self._pending.get(k, 0.0) + delta
+            raise
+        with self._lock:
+            self._data, self._key = data, key
+            for k, delta in pending.items():
+                self._inflight[k] = self._inflight.get(k, 0.0) - delta
+                if abs(self._inflight[k]) < 1e-9:
+                    del self._inflight[k]
+
 
 class NiuniuShop:
     def __init__(self, main_plugin):
         self.main = main_plugin  # 主插件实例
         self.shop_config_path = os.path.join('data', 'plugins', 'astrbot_plugin_niuniu', 'niuniu_shop.yml')
-        self.shop_items = self._load_shop_config()
+        self._catalog = Lazy(self._load_catalog)  # 首次使用商城时才加载配置
+        self.sign_cache = SignCoinCache(SIGN_DATA_FILE)
+        self.sign_writer = WriteBehindWriter(
+            'sign_data', self._write_sign_data,
+            self.main.lengths_writer.interval, self.main.context.logger, self.main.io_pool
+        )
+
+    def _write_sign_data(self, dirty_groups, dirty_users):
+        """取出待写入的金币增量，返回写入函数"""
+        pending = self.sign_cache.take_pending()
+        return lambda: self.sign_cache.write(pending)
+
+    async def close(self):
+        """写入尚未落盘的签到金币"""
+        await self.sign_writer.close()
+
+    @property
+    def catalog(self) -> ShopCatalog:
+        return self._catalog.get()
+
+    @property
+    def shop_items(self) -> list:
+        return self.catalog.items
+
+    def _load_catalog(self) -> ShopCatalog:
+        """加载商城配置并建立索引"""
+        return ShopCatalog(self._load_shop_config())
+
+    async def reload_shop(self, event: AstrMessageEvent):
+        """重新加载商城配置（管理员）"""
+        if not self.main.is_admin(event.get_sender_id()):
+            yield event.plain_result("❌ 只有管理员才能使用此指令")
+            return
+        self._catalog.reset()
+        await self._catalog.preload(self.main.io_pool)
+        yield event.plain_result(f"✅ 商城配置已重新加载，共 {len(self.catalog)} 件商品")
 
     def _load_shop_config(self) -> list:
         """加载商城配置"""
@@ -85,6 +223,8 @@ class NiuniuShop:
                 'id': 9,
                 'name': "夺心魔蝌蚪罐头",
                 'type': 'active',
+                'inventory_name': "夺心魔蝌蚪",  # 放入背包时的名称，比划时按此名称消耗
+                'aliases': ["夺心魔蝌蚪"],
                 'desc': "在比划时，有50%的概率夺取对方全部长度，10%的概率清空自己的长度，40%的概率无效",
                 'effect': 'steal_or_clear',
                 'price': 600  # 商品价格
@@ -93,10 +233,9 @@ class NiuniuShop:
         
         try:
             if os.path.exists(self.shop_config_path):
-                with open(self.shop_config_path, 'r', encoding='utf-8') as f:
-                    custom_config = yaml.safe_load(f) or []
-                    # 配置合并逻辑
-                    return self._merge_config(default_config, custom_config)
+                custom_config = load_data(self.shop_config_path, [], self.main.snapshot_cache)
+                # 配置合并逻辑
+                return self._merge_config(default_config, custom_config)
             return default_config
         except Exception as e:
             self.main.context.logger.error(f"加载商城配置失败: {str(e)}")
@@ -114,10 +253,7 @@ class NiuniuShop:
 
     async def show_shop(self, event: AstrMessageEvent):
         """显示商城"""
-        shop_list = ["🛒 牛牛商城（使用 牛牛购买+编号）"]
-        for item in self.shop_items:
-            shop_list.append(f"{item['id']}. {item['name']} - {item['desc']} (价格: {item['price']} 金币)")
-        yield event.plain_result("\n".join(shop_list))
+        yield event.plain_result(self.catalog.menu)
 
     async def handle_buy(self, event: AstrMessageEvent):
         """处理购买命令"""
@@ -127,7 +263,7 @@ class NiuniuShop:
             return
 
         item_id = int(msg_parts[1])
-        selected_item = next((i for i in self.shop_items if i['id'] == item_id), None)
+        selected_item = self.catalog.get(item_id)
         
         if not selected_item:
             yield event.plain_result("❌ 无效的商品编号")
@@ -137,12 +273,13 @@ class NiuniuShop:
         user_id = str(event.get_sender_id())
         user_data = self.main.get_user_data(group_id, user_id)
 
-        # 初始化用户数据（兼容旧版）
-        user_data.setdefault('items', {})
-        user_data.setdefault('coins', 0)  # 添加金币字段的初始化
+        if not user_data:
+            nickname = event.get_sender_name()
+            yield event.plain_result(self.main.texts.render('dajiao', 'not_registered', nickname=nickname))
+            return
 
         # 获取用户金币
-        user_coins = self.get_user_coins(group_id, user_id)
+        user_coins = await self.get_user_coins(group_id, user_id)
 
         # 检查用户是否有足够的金币
         if user_coins < selected_item['price']:
@@ -151,14 +288,16 @@ class NiuniuShop:
 
         try:
             result_msg = []
-            if selected_item['type'] == 'passive':
-                current = user_data['items'].get(selected_item['name'], 0)
-                if current >= selected_item.get('max', 3):
-                    yield event.plain_result(f"⚠️ 已达到最大持有量（最大{selected_item['max']}个）")
+            if ShopCatalog.is_held(selected_item):
+                item_name = ShopCatalog.inventory_name(selected_item)
+                current = user_data.items.get(item_name, 0)
+                max_count = selected_item.get('max', 3)
+                if current >= max_count:
+                    yield event.plain_result(f"⚠️ 已达到最大持有量（最大{max_count}个）")
                     return
                 
-                user_data['items'][selected_item['name']] = current + 1
-                result_msg.append(f"📦 获得 {selected_item['name']}x1")
+                user_data.items[item_name] = current + 1
+                result_msg.append(f"📦 获得 {item_name}x1")
 
             elif selected_item['type'] == 'active':
                 for effect_key, effect_value in selected_item['effect'].items():
@@ -170,88 +309,86 @@ class NiuniuShop:
                         result_msg.append(f"✨ {effect_key}减少了{-effect_value}")
 
             # 扣除金币
-            self.update_user_coins(group_id, user_id, user_coins - selected_item['price'])
+            await self.update_user_coins(group_id, user_id, -selected_item['price'])
 
-            self.main._save_niuniu_lengths()
+            self.main._save_niuniu_lengths(group_id, user_id)
             yield event.plain_result("✅ 购买成功\n" + "\n".join(result_msg))
         
         except Exception as e:
             self.main.context.logger.error(f"购买失败: {str(e)}")
             yield event.plain_result("⚠️ 购买过程中出现错误，请稍后再试")
 
-    def get_sign_coins(self, group_id: str, user_id: str) -> float:
-        """获取签到插件的金币"""
-        sign_data_path = os.path.join('data', 'sign_data.yml')
-        if not os.path.exists(sign_data_path):
-            return 0.0
+    async def refresh_sign_coins(self):
+        """按间隔检查签到数据文件，有变化时在线程池中重新解析"""
+        if self.sign_cache.needs_check():
+            start = time.perf_counter()
+            await self.main.io_pool.run(self.sign_cache.refresh)
+            self.main.metrics.record_timing('签到数据刷新', time.perf_counter() - start)
 
-        with open(sign_data_path, 'r', encoding='utf-8') as f:
-            sign_data = yaml.safe_load(f) or {}
-
-        return sign_data.get(group_id, {}).get(user_id, {}).get('coins', 0.0)
-
-    def update_sign_coins(self, group_id: str, user_id: str, coins: float):
-        """更新签到插件的金币"""
-        sign_data_path = os.path.join('data', 'sign_data.yml')
-        if not os.path.exists(sign_data_path):
-            with open(sign_data_path, 'w', encoding='utf-8') as f:
-                yaml.dump({}, f)
-
-        with open(sign_data_path, 'r', encoding='utf-8') as f:
-            sign_data = yaml.safe_load(f) or {}
-
-        user_data = sign_data.setdefault(group_id, {}).setdefault(user_id, {})
-        user_data['coins'] = coins
+    def get_sign_coins(self, group_id: str, user_id: str) -> float:
+        """获取签到插件的金币（读取缓存）"""
+        start = time.perf_counter()
+        coins = self.sign_cache.get(group_id, user_id)
+        self.main.metrics.record_timing('get_sign_coins', time.perf_counter() - start)
+        return coins
 
-        with open(sign_data_path, 'w', encoding='utf-8') as f:
-            yaml.dump(sign_data, f, allow_unicode=True)
+    def update_sign_coins(self, group_id: str, user_id: str, delta: float):
+        """增减签到插件的金币（合并后写入）"""
+        self.sign_cache.add(group_id, user_id, delta)
+        self.sign_writer.mark_dirty(group_id, user_id)
 
     def get_new_game_coins(self, group_id: str, user_id: str) -> float:
         """获取新游戏的金币"""
         user_data = self.main.get_user_data(group_id, user_id)
-        return user_data.get('coins', 0) if user_data else 0
+        return user_data.coins if user_data else 0
 
     def update_new_game_coins(self, group_id: str, user_id: str, coins: float):
         """更新新游戏的金币"""
         user_data = self.main.get_user_data(group_id, user_id)
         if user_data:
-            user_data['coins'] = coins
-            self.main._save_niuniu_lengths()
+            user_data.coins = coins
+            self.main._save_niuniu_lengths(group_id, user_id)
 
-    def get_user_coins(self, group_id: str, user_id: str) -> float:
+    async def get_user_coins(self, group_id: str, user_id: str) -> float:
         """获取总金币"""
+        await self.refresh_sign_coins()
         sign_coins = self.get_sign_coins(group_id, user_id)
         new_game_coins = self.get_new_game_coins(group_id, user_id)
         return sign_coins + new_game_coins
 
-    def update_user_coins(self, group_id: str, user_id: str, coins: float):
-        """更新总金币"""
-        current_coins = self.get_user_coins(group_id, user_id)
-        new_game_coins = self.get_new_game_coins(group_id, user_id)
-        sign_coins = self.get_sign_coins(group_id, user_id)
+    async def update_user_coins(self, group_id: str, user_id: str, delta: float):
+        """按增量修改总金币：增加计入游戏金币；扣除时优先扣游戏金币，不足部分从签到金币中扣除
 
-        if new_game_coins >= current_coins - coins:
-            self.update_new_game_coins(group_id, user_id, new_game_coins - (current_coins - coins))
+        扣除额基于扣除时的最新余额计算，期间签到插件增加的金币不会被覆盖
+        """
+        if delta >= 0:
+            self.update_new_game_coins(group_id, user_id, self.get_new_game_coins(group_id, user_id) + delta)
+            return
+        await self.refresh_sign_coins()
+        cost = -delta
+        new_game_coins = self.get_new_game_coins(group_id, user_id)
+        if new_game_coins >= cost:
+            self.update_new_game_coins(group_id, user_id, new_game_coins - cost)
         else:
-            remaining = (current_coins - coins) - new_game_coins
-            self.update_new_game_coins(group_id, user_id, 0)
-            self.update_sign_coins(group_id, user_id, sign_coins - remaining)
+            if new_game_coins:
+                self.update_new_game_coins(group_id, user_id, 0)
+            self.update_sign_coins(group_id, user_id, -(cost - new_game_coins))
 
     def get_user_items(self, group_id: str, user_id: str) -> Dict[str, int]:
         """获取用户道具"""
         user_data = self.main.get_user_data(group_id, user_id)
         if user_data is None:
             return {}
-        return user_data.get('items', {})
+        return user_data.items
 
     def consume_item(self, group_id: str, user_id: str, item_name: str) -> bool:
         """消耗道具返回是否成功"""
         user_data = self.main.get_user_data(group_id, user_id)
-        if user_data['items'].get(item_name, 0) > 0:
-            user_data['items'][item_name] -= 1
-            if user_data['items'][item_name] == 0:
-                del user_data['items'][item_name]
-            self.main._save_niuniu_lengths()
+        if user_data.items.get(item_name, 0) > 0:
+            user_data.items[item_name] -= 1
+            if user_data.items[item_name] == 0:
+                del user_data.items[item_name]
+            self.main._save_niuniu_lengths(group_id, user_id)
             return True
         return False
 
@@ -265,14 +402,14 @@ class NiuniuShop:
 
         # 显示道具信息
         if items:
+            catalog = self.catalog
             for name, count in items.items():
-                item_info = next(i for i in self.shop_items if i['name'] == name)
-                result_list.append(f"🔹 {name}x{count} - {item_info['desc']}")
+                result_list.append(f"🔹 {name}x{count} - {catalog.describe(name)}")
         else:
             result_list.append("🛍️ 你的背包里还没有道具哦~")
         
         # 显示金币总额
-        total_coins = self.get_user_coins(group_id, user_id)
+        total_coins = await self.get_user_coins(group_id, user_id)
         result_list.append(f"💰 你的金币：{total_coins}")
 
         yield event.plain_result("\n".join(result_list))
@@ -282,4 +419,4 @@ class NiuniuShop:
         user_data = self.main.get_user_data(group_id, user_id)
         if user_data is None:
             return {}
-        return user_data.get('items', {})
+        return user_data.items
@@ -0,0 +1,1077 @@
+import asyncio
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from niuniu_codec import decode, get_codec
+from niuniu_models import SCHEMA_VERSION, UserRecord, is_user
+
+
+class AsyncIOPool:
+    """有界线程池：把阻塞的文件读写移出事件循环，并统计排队深度和耗时"""
+
+    def __init__(self, max_workers=2, max_pending=64):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='niuniu-io')
+        self._slots = None
+        self.max_pending = max_pending
+        self.pending = 0              # 当前排队及执行中的任务数
+        self.peak_pending = 0
+        self.completed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    async def run(self, func, *args):
+        """在线程池中执行阻塞调用，排队任务过多时等待空位"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        start = time.perf_counter()
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+        finally:
+            self.pending -= 1
+            latency = time.perf_counter() - start
+            self.completed += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def stats(self):
+        avg = self.total_latency / self.completed if self.completed else 0.0
+        return {
+            'pending': self.pending,
+            'peak_pending': self.peak_pending,
+            'completed': self.completed,
+            'avg_latency_ms': round(avg * 1000, 2),
+            'max_latency_ms': round(self.max_latency * 1000, 2),
+        }
+
+
+class WriteBehindWriter:
+    """写回式持久化：记录脏数据，把短时间内的多次修改合并成一次落盘"""
+
+    def __init__(self, name, write_func, interval=5.0, logger=None, io_pool=None):
+        self.name = name
+        # write_func(dirty_groups, dirty_users) 在事件循环中拍下快照，返回实际写入的无参函数
+        self._write = write_func
+        self.interval = interval      # 合并窗口（秒），<= 0 表示尽快写入
+        self.logger = logger
+        self.io_pool = io_pool
+        self.dirty_groups = set()     # {group_id}，None 表示整份数据都需要写入
+        self.dirty_users = set()      # {(group_id, user_id)}，user_id 为 None 表示整个群组
+        self._task = None
+        self._lock = None
+        self._writing = False
+        self.writing_groups = set()   # 正在后台写入的群组
+        self.mark_count = 0           # 修改次数
+        self.flush_count = 0          # 实际写入次数
+        self.last_flush_time = 0.0
+        self.last_flush_cost = 0.0
+
+    @property
+    def dirty(self):
+        return bool(self.dirty_groups)
+
+    @property
+    def avoided_flushes(self):
+        """被合并掉的写入次数"""
+        return max(self.mark_count - self.flush_count, 0)
+
+    def mark_dirty(self, group_id=None, *user_ids):
+        """标记脏数据，稍后统一落盘"""
+        group_id = None if group_id is None else str(group_id)
+        self.dirty_groups.add(group_id)
+        if not user_ids:
+            self.dirty_users.add((group_id, None))  # 未指定用户时整个群组都视为脏数据
+        for user_id in user_ids:
+            self.dirty_users.add((group_id, str(user_id)))
+        self.mark_count += 1
+        self._schedule()
+
+    def _schedule(self):
+        """安排一次延迟写入，没有运行中的事件循环时直接写入"""
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        self._task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(max(self.interval, 0))
+        await self.flush_async()
+        if self._task is asyncio.current_task():
+            self._task = None
+        self._rearm()
+
+    def _rearm(self):
+        """写入结束后仍有脏数据（写入期间的新修改或写入失败）时重新安排写入"""
+        if not self.dirty_groups:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return  # 没有事件循环时等下次修改再写入，避免同步写入失败后反复重试
+        self._schedule()
+
+    def _take_dirty(self):
+        groups, users = self.dirty_groups, self.dirty_users
+        self.dirty_groups, self.dirty_users = set(), set()
+        return groups, users
+
+    def _on_error(self, groups, users, e):
+        # 写入失败时保留脏标记，等待下次重试
+        self.dirty_groups |= groups
+        self.dirty_users |= users
+        if self.logger:
+            self.logger.error(f"{self.name} 写入失败: {str(e)}")
+        self._rearm()
+
+    def _on_done(self, start):
+        self.flush_count += 1
+        self.last_flush_time = time.time()
+        self.last_flush_cost = time.perf_counter() - start
+
+    def flush(self):
+        """在当前线程立即写入所有脏数据"""
+        if not self.dirty_groups:
+            return
+        groups, users = self._take_dirty()
+        start = time.perf_counter()
+        try:
+            self._write(groups, users)()
+        except Exception as e:
+            self._on_error(groups, users, e)
+            return
+        self._on_done(start)
+
+    async def flush_async(self):
+        """在事件循环中拍快照，在线程池中写入；同一时间只有一次写入"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.dirty_groups:
+                return
+            groups, users = self._take_dirty()
+            start = time.perf_counter()
+            self._writing = True
+            self.writing_groups = groups
+            try:
+                job = self._write(groups, users)
+                if self.io_pool is None:
+                    job()
+                else:
+                    await self.io_pool.run(job)
+            except Exception as e:
+                self._on_error(groups, users, e)
+                return
+            finally:
+                self._writing = False
+                self.writing_groups = set()
+            self._on_done(start)
+
+    async def close(self):
+        """等待进行中的写入并写入剩余数据"""
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            if not self._writing:
+                task.cancel()  # 仍在等待合并窗口，直接取消
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush_async()
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()  # 上面等待期间重新安排的写入已由本次写入完成
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'marks': self.mark_count,
+            'flushes': self.flush_count,
+            'avoided': self.avoided_flushes,
+            'pending_groups': len(self.dirty_groups),
+            'last_flush_cost_ms': round(self.last_flush_cost * 1000, 2),
+        }
+
+
+def is_empty_group(group_data):
+    """未启用且没有任何用户的群组，与不存在等价"""
+    return not group_data.get('plugin_enabled', False) and all(key == 'plugin_enabled' for key in group_data)
+
+
+def normalize_group(group_data):
+    """校验群组数据结构，并把用户数据解码为 UserRecord（旧版字典按需迁移）"""
+    if not isinstance(group_data, dict):
+        return {'plugin_enabled': False}
+    group_data.setdefault('plugin_enabled', False)
+    for user_id, user_data in group_data.items():
+        if user_id != 'plugin_enabled' and not is_user(user_data):
+            group_data[user_id] = UserRecord.decode(user_data)
+    return group_data
+
+
+def group_lengths(group_id, group_data):
+    """已启用群组中每个用户的 (群号, 用户, 昵称, 长度)，用于全服排行"""
+    if not group_data or not group_data.get('plugin_enabled', False):
+        return
+    for user_id, user_data in group_data.items():
+        if is_user(user_data):
+            yield group_id, user_id, user_data.nickname, user_data.length
+
+
+def list_shards(shard_dir, skip=()):
+    """分片目录中的群号"""
+    try:
+        names = os.listdir(shard_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.endswith('.yml') and not name.startswith('.'):
+            group_id = unquote(name[:-4])
+            if group_id not in skip:
+                yield group_id
+
+
+def encode_group(group_data):
+    """把群组数据编码为紧凑格式的副本，供后台线程安全地序列化"""
+    return {
+        key: value.to_compact() if is_user(value) else value
+        for key, value in group_data.items()
+    }
+
+
+def atomic_dump(path, data, codec=None):
+    """先写临时文件再替换，避免写到一半时损坏原文件；返回写入的字节数"""
+    raw = (codec or get_codec('yaml')).dumps(data)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(raw)
+    os.replace(tmp_path, path)
+    return len(raw)
+
+
+def load_data(path, default=None, cache=None):
+    """读取数据文件（自动识别格式），文件不存在时返回默认值；指定 cache 时内容未变则跳过解析"""
+    if not os.path.exists(path):
+        return default
+    if cache is not None:
+        return cache.load(path, decode) or default
+    with open(path, 'rb') as f:
+        return decode(f.read()) or default
+
+
+def append_lines(path, lines):
+    """把若干行追加到文本文件末尾（用于日志类数据）"""
+    if not lines:
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+class YamlActionsMixin:
+    """冷却数据保存在独立的文件中"""
+    actions_path = None
+    codec = None
+
+    def load_actions(self):
+        if not self.actions_path:
+            return {}
+        return load_data(self.actions_path, {})
+
+    def save_actions(self, actions, dirty_groups):
+        if self.actions_path:
+            atomic_dump(self.actions_path, actions, self.codec)
+
+
+class YamlFileBackend(YamlActionsMixin):
+    """单文件存储：所有群组保存在同一个文件中，格式由 codec 决定（读取时自动识别）"""
+    lazy = False
+
+    def __init__(self, path, actions_path=None, logger=None, codec=None, cache=None):
+        self.path = path
+        self.actions_path = actions_path
+        self.logger = logger
+        self.codec = codec
+        self.cache = cache  # 解析结果缓存（SnapshotCache），只在读取时填充，文件未变化时跳过解析
+
+    def load_all(self):
+        """读取所有群组（未解码，由 GroupStore 在首次访问各群组时解码）"""
+        if not os.path.exists(self.path):
+            atomic_dump(self.path, {}, self.codec)
+            return {}
+        data = load_data(self.path, {}, self.cache)
+        if not isinstance(data, dict):
+            return {}
+        return {
+            str(gid): group_data for gid, group_data in data.items()
+            if isinstance(group_data, dict) and not is_empty_group(group_data)
+        }
+
+    def load_groups(self):
+        """读取并解码所有群组（用于迁移到其他存储方式）"""
+        return {gid: normalize_group(group_data) for gid, group_data in self.load_all().items()}
+
+    def load_group(self, group_id):
+        return None
+
+    def scan_lengths(self, skip=()):
+        return iter(())  # 单文件模式的数据都在内存中，由 GroupStore 直接遍历
+
+    def save(self, groups, dirty_groups, dirty_users):
+        # 单文件模式只能整体写入，跳过与默认值等价的空群组
+        atomic_dump(
+            self.path, {gid: group_data for gid, group_data in groups.items() if not is_empty_group(group_data)},
+            self.codec
+        )
+
+
+class ShardedYamlBackend(YamlActionsMixin):
+    """分片存储：每个群组一个文件，按需加载，只写回修改过的群组"""
+    lazy = True
+    MIGRATED_MARK = '.migrated'
+
+    def __init__(self, shard_dir, legacy_path=None, actions_path=None, logger=None, codec=None):
+        self.shard_dir = shard_dir
+        self.legacy_path = legacy_path
+        self.actions_path = actions_path
+        self.logger = logger
+        self.codec = codec
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.migrate()
+
+    def shard_path(self, group_id):
+        return os.path.join(self.shard_dir, f"{quote(str(group_id), safe='')}.yml")
+
+    def migrate(self):
+        """从单文件数据一次性迁移到分片"""
+        mark_path = os.path.join(self.shard_dir, self.MIGRATED_MARK)
+        if os.path.exists(mark_path):
+            return
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            legacy = YamlFileBackend(self.legacy_path).load_groups()
+            for group_id, group_data in legacy.items():
+                atomic_dump(self.shard_path(group_id), encode_group(group_data), self.codec)
+            os.replace(self.legacy_path, f"{self.legacy_path}.migrated")
+            if self.logger:
+                self.logger.info(f"已将 {len(legacy)} 个群组迁移为分片存储")
+        with open(mark_path, 'w', encoding='utf-8') as f:
+            f.write(str(time.time()))
+
+    def load_all(self):
+        return {}
+
+    def load_group(self, group_id):
+        group_data = load_data(self.shard_path(group_id))
+        return None if group_data is None else normalize_group(group_data)
+
+    def scan_lengths(self, skip=()):
+        """逐个读取不在 skip 中的分片（阻塞调用）"""
+        for group_id in list_shards(self.shard_dir, skip):
+            yield from group_lengths(group_id, self.load_group(group_id))
+
+    def save(self, groups, dirty_groups, dirty_users):
+        targets = groups.keys() if None in dirty_groups else dirty_groups
+        for group_id in targets:
+            if group_id in groups:
+                atomic_dump(self.shard_path(group_id), groups[group_id], self.codec)
+
+
+@contextmanager
+def file_lock(path):
+    """进程间的独占锁（fcntl.flock 建议锁），平台不支持时不加锁"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def file_key(path):
+    """文件状态（mtime, 大小, inode），文件不存在时为 None"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+# 合并时叠加双方变化量的数值字段，其他字段本地修改过时以本地为准
+ADDITIVE_FIELDS = ('length', 'hardness', 'coins')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def merge_user(theirs, mine, base):
+    """三方合并用户记录（字段字典）：数值字段和道具数量叠加双方各自的变化"""
+    merged = dict(theirs)
+    for key, value in mine.items():
+        old = base.get(key)
+        if value == old:
+            continue
+        if key in ADDITIVE_FIELDS and _is_number(value) and _is_number(old) and _is_number(theirs.get(key)):
+            merged[key] = theirs[key] + (value - old)
+        elif key == 'items' and isinstance(value, dict) and isinstance(old, dict):
+            items = dict(theirs.get('items') or {})
+            for name in set(value) | set(old):
+                count = items.get(name, 0) + value.get(name, 0) - old.get(name, 0)
+                if count > 0:
+                    items[name] = count
+                else:
+                    items.pop(name, None)
+            merged[key] = items
+        else:
+            merged[key] = value
+    return merged
+
+
+def merge_value(key, theirs, mine, base):
+    """合并共享分片中的一个键：双方都修改过时，用户记录逐字段合并，其他值以本地为准"""
+    if mine is None:
+        return theirs  # 本地删除但对方修改过，保留对方的数据
+    if theirs is None or base is None or key == 'plugin_enabled':
+        return mine
+    merged = merge_user(
+        UserRecord.from_compact(theirs).to_dict(),
+        UserRecord.from_compact(mine).to_dict(),
+        UserRecord.from_compact(base).to_dict(),
+    )
+    return UserRecord.from_dict(merged, SCHEMA_VERSION).to_compact()
+
+
+def read_shared(path):
+    """读取共享分片，返回 ({键: 修订号}, {键: 值})，用户记录统一为当前版本的紧凑列表"""
+    data = load_data(path)
+    if not isinstance(data, dict):
+        return {}, {}
+    revs = {str(key): rev for key, rev in (data.get('revs') or {}).items()}
+    values = {}
+    for key, value in (data.get('group') or {}).items():
+        key = str(key)
+        values[key] = value if key == 'plugin_enabled' else UserRecord.decode(value).to_compact()
+    return revs, values
+
+
+class SharedShardBackend(YamlActionsMixin):
+    """多进程共享存储：每个群组一个文件，每条记录带修订号
+
+    写入时持有文件锁，读出磁盘上的最新版本，与本进程加载时的版本比较：
+    其他进程修改过的记录做三方合并（数值和道具叠加双方的变化），而不是直接覆盖。
+    读取时按间隔检查文件状态，变化后在线程池中重新读取，再在事件循环中合并进内存。
+    """
+    lazy = True
+    shared = True
+    MIGRATED_MARK = '.migrated'
+
+    def __init__(self, shard_dir, legacy_path=None, actions_path=None, logger=None, codec=None, check_interval=1.0):
+        self.shard_dir = shard_dir
+        self.legacy_path = legacy_path
+        self.actions_path = actions_path
+        self.logger = logger
+        self.codec = codec
+        self.check_interval = check_interval  # 两次检查同一群组文件状态的最小间隔（秒）
+        self._lock = threading.Lock()     # 保护以下状态，只在内存中短暂持有
+        self._io_lock = threading.Lock()  # 本进程内同一时间只有一个线程读写分片
+        self._base = {}     # {group_id: {键: (修订号, 值)}}，内存数据所基于的磁盘版本
+        self._pending = {}  # {group_id: {键: (旧值, 修订号, 新值)}}，等待合并进内存的磁盘变化
+        self._keys = {}     # {group_id: 上次读写后的文件状态}
+        self._checked = {}  # {group_id: 上次检查文件状态的时间}
+        self.conflict_count = 0
+        self.refresh_count = 0
+        os.makedirs(self.shard_dir, exist_ok=True)
+        if fcntl is None and logger:
+            logger.warning("当前平台不支持 fcntl 文件锁，共享存储无法防止多个进程同时写入")
+        self.migrate()
+
+    def shard_path(self, group_id):
+        return os.path.join(self.shard_dir, f"{quote(str(group_id), safe='')}.yml")
+
+    def migrate(self):
+        """从单文件数据一次性迁移，多个进程同时启动时只由一个进程执行"""
+        mark_path = os.path.join(self.shard_dir, self.MIGRATED_MARK)
+        with file_lock(os.path.join(self.shard_dir, '.lock')):
+            if os.path.exists(mark_path):
+                return
+            if self.legacy_path and os.path.exists(self.legacy_path):
+                legacy = YamlFileBackend(self.legacy_path).load_groups()
+                for group_id, group_data in legacy.items():
+                    group = encode_group(group_data)
+                    atomic_dump(self.shard_path(group_id), {'revs': {key: 1 for key in group}, 'group': group}, self.codec)
+                os.replace(self.legacy_path, f"{self.legacy_path}.migrated")
+                if self.logger:
+                    self.logger.info(f"已将 {len(legacy)} 个群组迁移为共享存储")
+            with open(mark_path, 'w', encoding='utf-8') as f:
+                f.write(str(time.time()))
+
+    def load_all(self):
+        return {}
+
+    def load_group(self, group_id):
+        path = self.shard_path(group_id)
+        with self._io_lock:
+            key = file_key(path)
+            revs, values = read_shared(path)
+        with self._lock:
+            self._keys[group_id] = key
+            self._checked[group_id] = time.monotonic()
+            if not values:
+                return None
+            self._base[group_id] = {k: (revs.get(k, 0), v) for k, v in values.items()}
+            self._pending.pop(group_id, None)
+        group_data = {k: v if k == 'plugin_enabled' else UserRecord.from_compact(v) for k, v in values.items()}
+        return normalize_group(group_data)
+
+    def scan_lengths(self, skip=()):
+        """逐个读取不在 skip 中的分片，不记录版本信息（阻塞调用）"""
+        for group_id in list_shards(self.shard_dir, skip):
+            with self._io_lock:
+                revs, values = read_shared(self.shard_path(group_id))
+            group_data = {k: v if k == 'plugin_enabled' else UserRecord.from_compact(v) for k, v in values.items()}
+            yield from group_lengths(group_id, group_data)
+
+    def forget(self, group_id):
+        """群组被移出内存时丢弃其版本信息"""
+        with self._lock:
+            for state in (self._base, self._pending, self._keys, self._checked):
+                state.pop(group_id, None)
+
+    def changed(self, group_id):
+        """按间隔检查分片文件是否被修改过（只比较文件状态，不读取内容）"""
+        now = time.monotonic()
+        if now - self._checked.get(group_id, 0.0) < self.check_interval:
+            return False
+        self._checked[group_id] = now
+        return file_key(self.shard_path(group_id)) != self._keys.get(group_id)
+
+    def refresh(self, group_id):
+        """重新读取分片，记录修订号变化的记录，等待在事件循环中合并（阻塞调用）"""
+        path = self.shard_path(group_id)
+        with self._io_lock:
+            key = file_key(path)
+            revs, values = read_shared(path)
+        with self._lock:
+            base = self._base.setdefault(group_id, {})  # 本进程新建的群组在首次写入前没有基准版本
+            pending = self._pending.setdefault(group_id, {})
+            for k in set(values) | set(base) | set(pending):
+                old, known_rev, _ = pending.get(k) or (base.get(k, (None, None))[1], base.get(k, (None, None))[0], None)
+                rev = revs.get(k, 0) if k in values else None
+                if rev != known_rev:
+                    pending[k] = (old, rev, values.get(k))
+            self._keys[group_id] = key
+            self.refresh_count += 1
+
+    def apply(self, group_id, group_data):
+        """把其他进程的修改合并进内存（在事件循环中调用），返回有变化的用户"""
+        with self._lock:
+            pending = self._pending.pop(group_id, None)
+            if not pending:
+                return []
+            base = self._base.setdefault(group_id, {})
+            for k, (old, rev, new) in pending.items():
+                if new is None:
+                    base.pop(k, None)
+                else:
+                    base[k] = (rev, new)
+        changed = []
+        for k, (old, rev, new) in pending.items():
+            current = group_data.get(k)
+            mine = current.to_compact() if is_user(current) else current
+            if mine == old:
+                value = new  # 本地没有修改（包括其他进程新建的记录），直接采用磁盘上的版本
+            else:
+                value = merge_value(k, new, mine, old)
+            if value == mine:
+                continue
+            if k == 'plugin_enabled':
+                group_data[k] = bool(value)
+                continue
+            if value is None:
+                group_data.pop(k, None)
+            elif is_user(current):
+                current.assign(UserRecord.from_compact(value))
+            else:
+                group_data[k] = UserRecord.from_compact(value)
+            changed.append(k)
+        return changed
+
+    def save(self, groups, dirty_groups, dirty_users):
+        targets = groups.keys() if None in dirty_groups else dirty_groups
+        for group_id in targets:
+            if group_id in groups:
+                self._save_group(group_id, groups[group_id])
+
+    def _save_group(self, group_id, snapshot):
+        """加锁读出磁盘版本，本地修改过的记录与之合并后写回，磁盘上的其他变化留待合并进内存"""
+        path = self.shard_path(group_id)
+        with self._io_lock, file_lock(f"{path}.lock"):
+            revs, disk = read_shared(path)
+            with self._lock:
+                base = dict(self._base.get(group_id, {}))
+            out, out_revs, pending = {}, {}, {}
+            for k in set(snapshot) | set(disk) | set(base):
+                base_rev, base_value = base.get(k, (None, None))
+                disk_rev = revs.get(k, 0) if k in disk else None
+                disk_value = disk.get(k)
+                mine = snapshot.get(k)
+                if mine != base_value:
+                    if disk_rev == base_rev:
+                        value = mine
+                    else:
+                        value = merge_value(k, disk_value, mine, base_value)
+                        self.conflict_count += 1
+                    rev = (disk_rev or 0) + 1
+                    pending[k] = (mine, rev, value)
+                else:
+                    value, rev = disk_value, disk_rev
+                    if disk_rev != base_rev:
+                        pending[k] = (base_value, disk_rev, disk_value)
+                if value is not None:
+                    out[k] = value
+                    out_revs[k] = rev
+            atomic_dump(path, {'revs': out_revs, 'group': out}, self.codec)
+            key = file_key(path)
+        with self._lock:
+            self._pending.setdefault(group_id, {}).update(pending)
+            self._keys[group_id] = key
+
+    def save_actions(self, actions, dirty_groups):
+        """与其他进程写入的冷却记录合并，同一条记录保留较晚的到期时间"""
+        if not self.actions_path:
+            return
+        with file_lock(f"{self.actions_path}.lock"):
+            now = time.time()
+            merged = {}
+            for source in (load_data(self.actions_path, {}), actions):
+                for group_id, users in source.items():
+                    for user_id, user_actions in users.items():
+                        for action, value in user_actions.items():
+                            expires_at = value[0] if isinstance(value, (list, tuple)) else value
+                            if expires_at <= now:
+                                continue
+                            target = merged.setdefault(str(group_id), {}).setdefault(str(user_id), {})
+                            current = target.get(action)
+                            if current is None or expires_at >= (current[0] if isinstance(current, (list, tuple)) else current):
+                                target[action] = value
+            atomic_dump(self.actions_path, merged, self.codec)
+
+    def stats(self):
+        return {'conflicts': self.conflict_count, 'refreshes': self.refresh_count}
+
+
+class SqliteBackend:
+    """SQLite 存储（WAL 模式）：每次只以小事务更新修改过的行"""
+    lazy = True
+    USER_COLUMNS = ('nickname', 'length', 'hardness', 'coins')
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS groups (
+        group_id TEXT PRIMARY KEY,
+        plugin_enabled INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS users (
+        group_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        nickname TEXT,
+        length INTEGER,
+        hardness INTEGER,
+        coins REAL,
+        items TEXT,
+        extra TEXT,
+        PRIMARY KEY (group_id, user_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_users_group_length ON users (group_id, length);
+    CREATE TABLE IF NOT EXISTS last_actions (
+        group_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        action TEXT NOT NULL,
+        ts REAL NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (group_id, user_id, action)
+    );
+    """
+
+    def __init__(self, db_path, legacy_path=None, actions_path=None, logger=None):
+        self.db_path = db_path
+        self.logger = logger
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(last_actions)")}
+        if 'count' not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE last_actions ADD COLUMN count INTEGER NOT NULL DEFAULT 0")
+                self.conn.execute("UPDATE last_actions SET count = -1")  # 旧表中保存的是上次操作的时间戳
+        self.import_yaml(legacy_path, actions_path)
+
+    def import_yaml(self, lengths_path=None, actions_path=None):
+        """导入旧版 YAML 数据（仅在数据库为空时执行），导入后重命名原文件"""
+        if self.conn.execute("SELECT 1 FROM groups LIMIT 1").fetchone():
+            return
+        imported = 0
+        if lengths_path and os.path.exists(lengths_path):
+            groups = YamlFileBackend(lengths_path).load_groups()
+            self.save({gid: encode_group(group_data) for gid, group_data in groups.items()}, {None}, set())
+            imported = len(groups)
+            os.replace(lengths_path, f"{lengths_path}.migrated")
+        if actions_path and os.path.exists(actions_path):
+            self.save_actions(load_data(actions_path, {}), {None})
+            os.replace(actions_path, f"{actions_path}.migrated")
+        if imported and self.logger:
+            self.logger.info(f"已将 {imported} 个群组导入 SQLite 数据库")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def load_all(self):
+        return {}
+
+    def load_group(self, group_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT plugin_enabled FROM groups WHERE group_id = ?", (group_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            group_data = {'plugin_enabled': bool(row[0])}
+            rows = self.conn.execute(
+                "SELECT user_id, nickname, length, hardness, coins, items, extra FROM users WHERE group_id = ?",
+                (group_id,)
+            ).fetchall()
+        for user_id, nickname, length, hardness, coins, items, extra in rows:
+            user_data = json.loads(extra) if extra else {}
+            user_data.update({
+                'nickname': nickname,
+                'length': length,
+                'hardness': hardness,
+                'coins': coins,
+                'items': json.loads(items) if items else {},
+            })
+            # 未记录版本号的行来自引入 schema 版本之前，其列结构与版本 1 相同
+            group_data[user_id] = UserRecord.from_dict(user_data, user_data.pop('_v', 1))
+        return group_data
+
+    def _user_row(self, group_id, user_id, compact):
+        """紧凑列表 -> 表行，未单独建列的字段与 schema 版本放进 extra JSON"""
+        extra = UserRecord.from_compact(compact).to_dict()
+        row = [extra.pop(column) for column in self.USER_COLUMNS]
+        items = extra.pop('items')
+        extra['_v'] = SCHEMA_VERSION
+        return (
+            group_id, user_id, *row,
+            json.dumps(items, ensure_ascii=False),
+            json.dumps(extra, ensure_ascii=False),
+        )
+
+    def save(self, groups, dirty_groups, dirty_users):
+        if None in dirty_groups:
+            targets = {(group_id, None) for group_id in groups}
+        else:
+            whole = {group_id for group_id, user_id in dirty_users if user_id is None}
+            targets = {(g, u) for g, u in dirty_users if u is None or g not in whole}
+        with self._lock, self.conn:
+            for group_id, user_id in targets:
+                group_data = groups.get(group_id)
+                if group_data is None:
+                    continue
+                self.conn.execute(
+                    "INSERT INTO groups (group_id, plugin_enabled) VALUES (?, ?) "
+                    "ON CONFLICT(group_id) DO UPDATE SET plugin_enabled = excluded.plugin_enabled",
+                    (group_id, int(bool(group_data.get('plugin_enabled', False))))
+                )
+                if user_id is None:
+                    users = [(uid, data) for uid, data in group_data.items() if uid != 'plugin_enabled']
+                    self.conn.execute("DELETE FROM users WHERE group_id = ?", (group_id,))
+                else:
+                    user_data = group_data.get(user_id)
+                    if user_id == 'plugin_enabled' or user_data is None:
+                        self.conn.execute("DELETE FROM users WHERE group_id = ? AND user_id = ?", (group_id, user_id))
+                        continue
+                    users = [(user_id, user_data)]
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO users (group_id, user_id, nickname, length, hardness, coins, items, extra) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [self._user_row(group_id, uid, data) for uid, data in users]
+                )
+
+    def ranking(self, group_id, limit=5, descending=True):
+        """直接通过 (group_id, length) 索引查询排行，长度相同时按 user_id 排序；limit 为 -1 表示整群"""
+        order = 'DESC' if descending else 'ASC'
+        with self._lock:
+            return self.conn.execute(
+                f"SELECT user_id, nickname, length FROM users WHERE group_id = ? AND length IS NOT NULL "
+                f"ORDER BY length {order}, user_id {order} LIMIT ?",
+                (group_id, limit)
+            ).fetchall()
+
+    def scan_lengths(self, skip=()):
+        """一次查询所有已启用群组的用户长度（阻塞调用）"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT u.group_id, u.user_id, u.nickname, u.length FROM users u "
+                "JOIN groups g ON g.group_id = u.group_id WHERE g.plugin_enabled = 1 AND u.length IS NOT NULL"
+            ).fetchall()
+        return (row for row in rows if row[0] not in skip)
+
+    def load_actions(self):
+        actions = {}
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT group_id, user_id, action, ts, count FROM last_actions WHERE ts > ? OR count < 0", (time.time(),)
+            ).fetchall()
+        for group_id, user_id, action, ts, count in rows:
+            actions.setdefault(group_id, {}).setdefault(user_id, {})[action] = ts if count < 0 else [ts, count]
+        return actions
+
+    def save_actions(self, actions, dirty_groups):
+        """冷却数据的值为 [到期时间, 次数]；旧版数据中单个数字表示上次操作的时间戳，以次数 -1 保存"""
+        targets = actions.keys() if None in dirty_groups else dirty_groups
+        with self._lock, self.conn:
+            if None in dirty_groups:
+                self.conn.execute("DELETE FROM last_actions")
+            for group_id in targets:
+                self.conn.execute("DELETE FROM last_actions WHERE group_id = ?", (str(group_id),))
+                self.conn.executemany(
+                    "INSERT INTO last_actions (group_id, user_id, action, ts, count) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (str(group_id), str(user_id), action, *(value if isinstance(value, (list, tuple)) else (value, -1)))
+                        for user_id, user_actions in actions.get(group_id, {}).items()
+                        for action, value in user_actions.items()
+                    ]
+                )
+
+
+class GroupStore:
+    """内存中的群组数据，按需从存储后端加载
+
+    后端支持按群加载时，常驻群组数量超过 max_resident 后按最近最少使用的顺序淘汰
+    没有未写入修改的群组，再次访问时自动重新加载。
+    单文件后端在首次访问时才整体读取，各群组在首次访问时才解码，启动耗时与数据量无关。
+    """
+
+    def __init__(self, backend, logger=None, max_resident=0, max_missing=10000):
+        self.backend = backend
+        self.logger = logger
+        self.max_resident = max_resident if backend.lazy else 0  # 0 表示不淘汰
+        self.max_missing = max_missing
+        self.can_evict = lambda group_id: True   # 由插件设置，判断群组能否被淘汰
+        self.on_evict = lambda group_id: None    # 由插件设置，群组被淘汰后的回调
+        self.shared = getattr(backend, 'shared', False)  # 后端是否与其他进程共享数据
+        self.can_sync = lambda group_id: True    # 由插件设置，判断能否把其他进程的修改合并进内存
+        self.on_sync = lambda group_id, user_ids: None  # 由插件设置，合并了其他进程的修改后的回调
+        self._groups = OrderedDict()
+        self._raw = {}                    # 已读取但尚未解码的群组
+        self._loaded_all = backend.lazy  # 按群加载的后端不需要整体读取
+        self._missing = OrderedDict()  # 已确认后端中不存在的群组，避免重复访问磁盘
+        self.load_count = 0
+        self.evict_count = 0
+
+    def _read_all(self):
+        try:
+            return self.backend.load_all()
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"加载数据失败: {str(e)}")
+            return {}
+
+    def _set_all(self, data):
+        if not self._loaded_all:
+            self._raw = {gid: group_data for gid, group_data in data.items() if gid not in self._groups}
+            self._loaded_all = True
+
+    def _ensure_all(self):
+        """单文件后端首次访问时整体读取（同步调用，preload 会预先在线程池中完成）"""
+        if not self._loaded_all:
+            self._set_all(self._read_all())
+
+    def _decode(self, group_id):
+        """首次访问时才校验并解码群组；复制后解码，原数据可能正被后台线程序列化"""
+        raw = self._raw.pop(group_id, None)
+        if raw is not None:
+            self._groups[group_id] = normalize_group(dict(raw))
+
+    def _needs_load(self, group_id):
+        return self.backend.lazy and group_id not in self._groups and group_id not in self._missing
+
+    def _loaded(self, group_id, group_data):
+        if group_id in self._groups:
+            return  # 加载期间已被写入，以内存数据为准
+        if group_data is None:
+            self._missing[group_id] = True
+            if len(self._missing) > self.max_missing:
+                self._missing.popitem(last=False)
+        else:
+            self._groups[group_id] = group_data
+            self.load_count += 1
+            self._evict(keep=group_id)
+
+    def _load(self, group_id):
+        self._ensure_all()
+        if self._raw:
+            self._decode(group_id)
+        if not self._needs_load(group_id):
+            return
+        try:
+            self._loaded(group_id, self.backend.load_group(group_id))
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"加载群组 {group_id} 数据失败: {str(e)}")
+
+    def _touch(self, group_id):
+        if self.max_resident and group_id in self._groups:
+            self._groups.move_to_end(group_id)
+
+    def _evict(self, keep=None):
+        """淘汰最久未访问且已落盘的群组，keep 为刚加入、不能立即淘汰的群组"""
+        if not self.max_resident:
+            return
+        excess = len(self._groups) - self.max_resident
+        if excess <= 0:
+            return
+        for group_id in list(self._groups):
+            if excess <= 0:
+                break
+            if group_id == keep or not self.can_evict(group_id):
+                continue
+            del self._groups[group_id]
+            self.evict_count += 1
+            excess -= 1
+            if self.shared:
+                self.backend.forget(group_id)
+            self.on_evict(group_id)
+
+    async def preload(self, group_id, io_pool):
+        """在线程池中预先加载群组，之后的同步访问不再读盘"""
+        group_id = str(group_id)
+        if not self._loaded_all:
+            self._set_all(await io_pool.run(self._read_all))
+        if self._raw:
+            self._decode(group_id)
+        if self.shared and group_id in self._missing and self.backend.changed(group_id):
+            del self._missing[group_id]  # 其他进程创建了该群组
+        if not self._needs_load(group_id):
+            self._touch(group_id)
+            if self.shared and group_id in self._groups:
+                await self._sync(group_id, io_pool)
+            return
+        try:
+            self._loaded(group_id, await io_pool.run(self.backend.load_group, group_id))
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"加载群组 {group_id} 数据失败: {str(e)}")
+
+    async def _sync(self, group_id, io_pool):
+        """分片文件被其他进程修改过时重新读取，并把变化合并进内存"""
+        if self.backend.changed(group_id):
+            try:
+                await io_pool.run(self.backend.refresh, group_id)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"刷新群组 {group_id} 数据失败: {str(e)}")
+        if group_id in self._groups and self.can_sync(group_id):
+            self._apply(group_id)
+
+    def _apply(self, group_id):
+        changed = self.backend.apply(group_id, self._groups[group_id])
+        if changed:
+            self.on_sync(group_id, changed)
+
+    def __contains__(self, group_id):
+        group_id = str(group_id)
+        self._load(group_id)
+        return group_id in self._groups
+
+    def __getitem__(self, group_id):
+        group_id = str(group_id)
+        self._load(group_id)
+        return self._groups[group_id]
+
+    def __setitem__(self, group_id, group_data):
+        group_id = str(group_id)
+        self._ensure_all()
+        self._raw.pop(group_id, None)
+        self._missing.pop(group_id, None)
+        self._groups[group_id] = group_data
+        self._evict(keep=group_id)
+
+    def get(self, group_id, default=None):
+        """读取群组数据，不存在时返回默认值且不会创建"""
+        return self[group_id] if group_id in self else default
+
+    def items(self):
+        """已加载到内存中的群组（会解码所有尚未解码的群组）"""
+        self._ensure_all()
+        for group_id in list(self._raw):
+            self._decode(group_id)
+        return self._groups.items()
+
+    async def scan_lengths(self, io_pool):
+        """收集所有已启用群组的 (群号, 用户, 昵称, 长度)：内存中的群组以内存为准，其余在线程池中从后端读取"""
+        if not self._loaded_all:
+            self._set_all(await io_pool.run(self._read_all))
+        raw = list(self._raw.items())
+        scanned = await io_pool.run(self._scan_lengths, raw, set(self._groups))
+        records = [record for record in scanned if record[0] not in self._groups]  # 扫描期间被加载的群组以内存为准
+        for group_id, group_data in self._groups.items():
+            records.extend(group_lengths(group_id, group_data))
+        return records
+
+    def _scan_lengths(self, raw, resident):
+        records = []
+        for group_id, group_data in raw:
+            records.extend(group_lengths(group_id, normalize_group(dict(group_data))))
+        records.extend(self.backend.scan_lengths(resident))
+        return records
+
+    def prepare_save(self, dirty_groups, dirty_users):
+        """拍下需要写入的群组快照，返回可在线程池中执行的写入函数"""
+        self._ensure_all()  # 未读取过的数据不能被部分内容覆盖
+        if not self.backend.lazy or None in dirty_groups:
+            targets = self._groups.keys()
+        else:
+            targets = [group_id for group_id in dirty_groups if group_id in self._groups]
+        if self.shared:
+            # 先合并已读到的其他进程的修改，快照才与后端记录的基准版本一致
+            for group_id in targets:
+                self._apply(group_id)
+        snapshot = {group_id: encode_group(self._groups[group_id]) for group_id in targets}
+        if not self.backend.lazy:
+            snapshot.update(self._raw)  # 未解码的群组没有被修改过，原样写回
+        return functools.partial(self.backend.save, snapshot, dirty_groups, dirty_users)
+
+    def stats(self):
+        return {
+            'resident': len(self._groups),
+            'undecoded': len(self._raw),
+            'missing_cached': len(self._missing),
+            'loads': self.load_count,
+            'evictions': self.evict_count,
+        }
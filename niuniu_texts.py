@@ -0,0 +1,264 @@
+import random
+from bisect import bisect_right
+from string import Formatter
+
+DEFAULT_TEXTS = {
+    'register': {
+        'success': "🧧 {nickname} 成功注册牛牛！\n📏 初始长度：{length}cm\n💪 硬度等级：{hardness}",
+        'already_registered': "⚠️ {nickname} 你已经注册过牛牛啦！",
+    },
+    'dajiao': {
+        'cooldown': [
+            "⏳ {nickname} 牛牛需要休息，{remaining}秒后可再打胶",
+            "🛑 冷却中，{nickname} 请耐心等待 ({remaining}秒)"
+        ],
+        'increase': [
+            "🚀 {nickname} 打胶成功！长度增加 {change}cm！",
+            "🎉 {nickname} 的牛牛茁壮成长！+{change}cm"
+        ],
+        'decrease': [
+            "😱 {nickname} 用力过猛！长度减少 {change}cm！",
+            "⚠️ {nickname} 操作失误！-{change}cm"
+        ],
+        'no_effect': [
+            "🌀 {nickname} 的牛牛毫无变化...",
+            "🔄 {nickname} 这次打胶没有效果"
+        ],
+        'not_registered': "❌ {nickname} 请先注册牛牛"
+    },
+    'crazy_dajiao': {
+        'increase': [
+            "🚀 {nickname} 疯狂打胶成功！牛牛暴涨 {change}cm！",
+            "🎉 {nickname} 的牛牛狂暴生长！+{change}cm"
+        ],
+        'decrease': [
+            "😱 {nickname} 疯狂打胶失误，牛牛骤减 {change}cm！",
+            "⚠️ {nickname} 操作失误！-{change}cm"
+        ],
+        'no_effect': [
+            "🌀 {nickname} 疯狂打胶后牛牛毫无变化...",
+            "🔄 {nickname} 的疯狂打胶结果平平"
+        ],
+        'summary': "🌀 {nickname} 疯狂打胶 {rounds} 次：成功 {increase} 次，失误 {decrease} 次，无变化 {no_effect} 次，共 {net}cm",
+        'evaluation': "【疯狂打胶{rounds}次结束】 {nickname} 的牛牛最终长度为 {length}，评价：{evaluation}"
+    },
+    'my_niuniu': {
+        'info': "📊 {nickname} 的牛牛状态\n📏 长度：{length}\n💪 硬度：{hardness}\n📝 评价：{evaluation}",
+        'evaluation': {
+            'short': ["小巧玲珑", "精致可爱"],
+            'medium': ["中规中矩", "潜力无限"],
+            'long': ["威风凛凛", "傲视群雄"],
+            'very_long': ["擎天巨柱", "突破天际"],
+            'super_long': ["超级长", "无与伦比"],
+            'ultra_long': ["超越极限", "无人能敌"]
+        },
+        'not_registered': "❌ {nickname} 请先注册牛牛"
+    },
+    'compare': {
+        'no_target': "❌ {nickname} 请指定比划对象",
+        'target_not_registered': "❌ 对方尚未注册牛牛",
+        'cooldown': "⏳ {nickname} 请等待{remaining}秒后再比划",
+        'self_compare': "❌ 不能和自己比划",
+        'ambiguous': "❓ {nickname} 找到 {count} 位匹配的用户：{candidates}\n请输入更完整的昵称或直接 @ 对方",
+        'win': [
+            "🎉 {winner} 战胜了 {loser}！\n📈 增加 {gain}cm",
+            "🏆 {winner} 的牛牛更胜一筹！+{gain}cm"
+        ],
+        'lose': [
+            "😭 {loser} 败给 {winner}\n📉 减少 {loss}cm",
+            "💔 {loser} 的牛牛不敌对方！-{loss}cm"
+        ],
+        'draw': "🤝 双方势均力敌！",
+        'double_loss': "😱 {nickname1} 和 {nickname2} 的牛牛因过于柔软发生缠绕，长度减半！",
+        'hardness_win': "🎉 {nickname} 因硬度优势获胜！",
+        'hardness_lose': "💔 {nickname} 因硬度劣势败北！",
+        'user_no_increase': "😅 {nickname} 的牛牛没有任何增长。"
+    },
+    'ranking': {
+        'strong_header': "🏅 最强牛牛排行榜 TOP5：\n",
+        'weak_header': "💔 阳痿榜 TOP5：\n",
+        'no_data': "📭 本群暂无牛牛数据",
+        'item': "{rank}. {name} ➜ {length}",
+        'my_rank': "🏅 {nickname} 的牛牛在本群排名第 {rank}/{total}\n📏 长度：{length}",
+        'global_strong_header': "🌏 全服最强牛牛 TOP{count}：\n",
+        'global_weak_header': "💔 全服阳痿榜 TOP{count}：\n",
+        'global_no_data': "📭 全服暂无牛牛数据",
+        'global_item': "{rank}. {name}（群{group}） ➜ {length}"
+    },
+    'menu': {
+        'default': """📜 牛牛菜单：
+🔹 注册牛牛 - 初始化你的牛牛
+🔹 打胶 - 提升牛牛长度
+🔹 疯狂打胶 [次数] - 连续打胶多次（默认十次，无单次冷却），功能整体1分钟冷却
+🔹 我的牛牛 - 查看当前状态
+🔹 比划比划 @目标 - 发起对决
+🔹 牛牛排行 - 查看群排行榜
+🔹 我的排名 - 查看自己在本群的排名
+🔹 全服排行 - 查看所有群的牛牛排行
+🔹 牛牛商城 - 查看商城
+🔹 牛牛购买 - 购买道具
+🔹 牛牛背包 - 查看已购道具
+🔹 牛牛开/关 - 管理插件
+🔹 牛牛统计 - 查看运行统计（管理员）
+🔹 牛牛商城重载 - 重新加载商城配置（管理员）
+🔹 牛牛管理 - 整群重置长度/发金币/发道具/清理（管理员）"""
+    },
+    'system': {
+        'enable': "✅ 牛牛插件已启用",
+        'disable': "❌ 牛牛插件已禁用"
+    }
+}
+
+# 各模板允许使用的占位符，加载时据此校验自定义文本
+TEXT_FIELDS = {
+    ('register', 'success'): {'nickname', 'length', 'hardness'},
+    ('register', 'already_registered'): {'nickname'},
+    ('dajiao', 'cooldown'): {'nickname', 'remaining'},
+    ('dajiao', 'increase'): {'nickname', 'change'},
+    ('dajiao', 'decrease'): {'nickname', 'change'},
+    ('dajiao', 'no_effect'): {'nickname', 'change'},
+    ('dajiao', 'not_registered'): {'nickname'},
+    ('crazy_dajiao', 'increase'): {'nickname', 'change'},
+    ('crazy_dajiao', 'decrease'): {'nickname', 'change'},
+    ('crazy_dajiao', 'no_effect'): {'nickname', 'change'},
+    ('crazy_dajiao', 'summary'): {'nickname', 'rounds', 'increase', 'decrease', 'no_effect', 'net', 'length'},
+    ('crazy_dajiao', 'evaluation'): {'nickname', 'rounds', 'length', 'evaluation'},
+    ('my_niuniu', 'info'): {'nickname', 'length', 'hardness', 'evaluation'},
+    ('my_niuniu', 'not_registered'): {'nickname'},
+    ('compare', 'no_target'): {'nickname'},
+    ('compare', 'target_not_registered'): {'nickname'},
+    ('compare', 'cooldown'): {'nickname', 'remaining'},
+    ('compare', 'self_compare'): {'nickname'},
+    ('compare', 'ambiguous'): {'nickname', 'count', 'candidates'},
+    ('compare', 'win'): {'winner', 'loser', 'gain', 'nickname', 'target_nickname'},
+    ('compare', 'lose'): {'winner', 'loser', 'loss', 'nickname', 'target_nickname'},
+    ('compare', 'draw'): set(),
+    ('compare', 'double_loss'): {'nickname1', 'nickname2'},
+    ('compare', 'hardness_win'): {'nickname'},
+    ('compare', 'hardness_lose'): {'nickname'},
+    ('compare', 'user_no_increase'): {'nickname'},
+    ('ranking', 'strong_header'): set(),
+    ('ranking', 'weak_header'): set(),
+    ('ranking', 'no_data'): set(),
+    ('ranking', 'item'): {'rank', 'name', 'length'},
+    ('ranking', 'my_rank'): {'nickname', 'rank', 'total', 'length'},
+    ('ranking', 'global_strong_header'): {'count'},
+    ('ranking', 'global_weak_header'): {'count'},
+    ('ranking', 'global_no_data'): set(),
+    ('ranking', 'global_item'): {'rank', 'name', 'group', 'length'},
+    ('menu', 'default'): set(),
+    ('system', 'enable'): set(),
+    ('system', 'disable'): set(),
+}
+
+# 评价等级从短到长，阈值列表比等级少一个：长度 < 阈值[i] 时取等级 i
+EVALUATION_TIERS = ('short', 'medium', 'long', 'very_long', 'super_long', 'ultra_long')
+DEFAULT_EVALUATION_THRESHOLDS = (12, 25, 50, 100, 200)
+
+_formatter = Formatter()
+
+
+def template_fields(text):
+    """模板中用到的占位符名称，模板语法错误或使用位置参数时抛出 ValueError"""
+    fields = set()
+    for _, field_name, _, _ in _formatter.parse(text):
+        if field_name is None:
+            continue
+        name = field_name.split('.', 1)[0].split('[', 1)[0]
+        if not name or name.isdigit():
+            raise ValueError(f"不支持位置参数 {{{field_name}}}")
+        fields.add(name)
+    return fields
+
+
+def _constant(text):
+    return lambda **_: text
+
+
+class TemplateSet:
+    """一组可随机选择的模板变体，加载时已预先绑定 str.format"""
+    __slots__ = ('texts', 'renders', 'single')
+
+    def __init__(self, texts, fields):
+        self.texts = tuple(texts)
+        renders = []
+        for text in self.texts:
+            unknown = template_fields(text) - fields
+            if unknown:
+                raise ValueError(f"未知的占位符 {sorted(unknown)}")
+            # 不含花括号的模板无需格式化，直接返回原字符串
+            renders.append(text.format if '{' in text or '}' in text else _constant(text))
+        if not renders:
+            raise ValueError("模板不能为空")
+        self.renders = tuple(renders)
+        self.single = renders[0] if len(renders) == 1 else None
+
+    def render(self, choice=random.choice, **kwargs):
+        render = self.single or choice(self.renders)
+        return render(**kwargs)
+
+
+def _compile(value, fields):
+    texts = [value] if isinstance(value, str) else value
+    if not isinstance(texts, (list, tuple)) or not all(isinstance(text, str) for text in texts):
+        raise ValueError("模板必须是字符串或字符串列表")
+    return TemplateSet(texts, fields)
+
+
+def _lookup(texts, path):
+    for key in path:
+        if not isinstance(texts, dict) or key not in texts:
+            return None
+        texts = texts[key]
+    return texts
+
+
+class TextCatalog:
+    """游戏文本：加载时校验并编译所有模板，无效的自定义模板回退为默认文本"""
+
+    def __init__(self, custom_texts=None, evaluation_thresholds=None, logger=None, choice=random.choice):
+        self.logger = logger
+        self.choice = choice  # 选择模板变体的随机函数
+        self.errors = []
+        self._templates = {
+            path: self._compile_path(custom_texts, path, fields)
+            for path, fields in TEXT_FIELDS.items()
+        }
+        self._tiers = tuple(
+            self._compile_path(custom_texts, ('my_niuniu', 'evaluation', tier), set())
+            for tier in EVALUATION_TIERS
+        )
+        self._thresholds = self._check_thresholds(evaluation_thresholds)
+
+    def _error(self, message):
+        self.errors.append(message)
+        if self.logger:
+            self.logger.error(message)
+
+    def _compile_path(self, custom_texts, path, fields):
+        custom = _lookup(custom_texts, path)
+        if custom is not None:
+            try:
+                return _compile(custom, fields)
+            except ValueError as e:
+                self._error(f"自定义文本 {'.'.join(path)} 无效，已使用默认文本: {str(e)}")
+        return _compile(_lookup(DEFAULT_TEXTS, path), fields)
+
+    def _check_thresholds(self, thresholds):
+        if thresholds is None:
+            return DEFAULT_EVALUATION_THRESHOLDS
+        try:
+            thresholds = tuple(float(value) for value in thresholds)
+        except (TypeError, ValueError):
+            thresholds = ()
+        if len(thresholds) != len(EVALUATION_TIERS) - 1 or list(thresholds) != sorted(thresholds):
+            self._error(f"evaluation_thresholds 需要 {len(EVALUATION_TIERS) - 1} 个递增的数值，已使用默认值")
+            return DEFAULT_EVALUATION_THRESHOLDS
+        return thresholds
+
+    def render(self, section, key, **kwargs):
+        return self._templates[section, key].render(self.choice, **kwargs)
+
+    def evaluation(self, length):
+        """按长度所在的区间随机选择一条评价"""
+        return self._tiers[bisect_right(self._thresholds, length)].render(self.choice)
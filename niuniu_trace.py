@@ -0,0 +1,76 @@
+"""指令录制：把收到的群指令按到达顺序追加到日志，供 benchmarks/replay_trace.py 回放压测
+
+每行一条 JSON 数组：[时间戳, 群号, 发送者, 昵称, 消息] 或末尾再加上 @ 的目标。
+"""
+import json
+import threading
+import time
+from functools import partial
+
+from niuniu_storage import WriteBehindWriter, append_lines
+
+
+class TraceEntry:
+    """录制的一条指令"""
+    __slots__ = ('time', 'group_id', 'user_id', 'nickname', 'text', 'at')
+
+    def __init__(self, time, group_id, user_id, nickname, text, at=None):
+        self.time = time
+        self.group_id = group_id
+        self.user_id = user_id
+        self.nickname = nickname
+        self.text = text
+        self.at = at
+
+    def encode(self):
+        entry = [self.time, self.group_id, self.user_id, self.nickname, self.text]
+        if self.at is not None:
+            entry.append(self.at)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+
+
+class TraceRecorder:
+    """录制群指令，合并后批量追加到日志文件"""
+
+    def __init__(self, path, logger=None, io_pool=None, flush_interval=5.0):
+        self.path = path
+        self.count = 0
+        self._pending = []  # 待写入的行，写入在线程池中进行，读写都需持有 _lock
+        self._lock = threading.Lock()
+        self.writer = WriteBehindWriter('trace', self._write, flush_interval, logger, io_pool)
+
+    def record(self, group_id, user_id, nickname, text, at=None):
+        line = TraceEntry(round(time.time(), 3), group_id, user_id, nickname, text, at).encode()
+        with self._lock:
+            self._pending.append(line)
+        self.count += 1
+        self.writer.mark_dirty()
+
+    def _write(self, dirty_groups, dirty_users):
+        with self._lock:
+            lines, self._pending = self._pending, []
+        return partial(self._append, lines)
+
+    def _append(self, lines):
+        """追加到日志；失败时把这批记录放回待写队列最前面，由写回器重试"""
+        try:
+            append_lines(self.path, lines)
+        except Exception:
+            with self._lock:
+                self._pending[:0] = lines
+            raise
+
+    async def close(self):
+        await self.writer.close()
+
+
+def read_trace(path):
+    """逐条读取录制的指令，跳过无法解析的行"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, list) and len(entry) >= 5:
+                yield TraceEntry(*entry[:6])
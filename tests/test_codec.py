@@ -0,0 +1,15 @@
+import pytest
+
+from niuniu_codec import CODECS, decode
+
+
+@pytest.mark.parametrize('name', sorted(CODECS))
+def test_round_trip_with_detection(name):
+    data = {'g1': {'plugin_enabled': True, 'u1': [1, '牛牛', 10, 1, 0.0, {}]}}
+    assert decode(CODECS[name].dumps(data)) == data
+
+
+def test_text_starting_with_msgpack_map_byte():
+    """U+0780-U+07FF 的 UTF-8 首字节与 msgpack map16/map32 相同，解析失败时按文本格式读取"""
+    assert decode('ހ: 1\n'.encode('utf-8')) == {'ހ': 1}
+    assert decode('߿: [1, 2]\n'.encode('utf-8')) == {'߿': [1, 2]}
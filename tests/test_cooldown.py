@@ -0,0 +1,69 @@
+from niuniu_cooldown import CooldownStore
+
+
+def test_expired_entries_are_purged_from_heap():
+    store = CooldownStore()
+    store.start('g1', 'u1', 'dajiao', 30, now=1000)
+    store.start('g1', 'u2', 'dajiao', 60, now=1000)
+    store.start('g2', 'u1', 'dajiao', 10, now=1000)
+    assert len(store) == 3
+    assert store.remaining('g1', 'u1', 'dajiao', now=1020) == 10
+    assert store.remaining('g2', 'u1', 'dajiao', now=1020) == 0
+    assert len(store) == 2 and store.stats()['groups'] == 1
+    assert store.remaining('g1', 'u2', 'dajiao', now=1060) == 0
+    assert len(store) == 0 and store.stats()['expired'] == 3
+
+
+def test_restarted_cooldown_keeps_new_expiry():
+    """重新开始的冷却不会被堆中的旧记录提前清理"""
+    store = CooldownStore()
+    store.start('g1', 'u1', 'dajiao', 30, now=1000)
+    store.start('g1', 'u1', 'dajiao', 30, now=1020)
+    assert store.remaining('g1', 'u1', 'dajiao', now=1040) == 10
+    assert len(store) == 1
+
+
+def test_group_cap_evicts_soonest_expiry():
+    store = CooldownStore(max_per_group=3)
+    for i, duration in enumerate((50, 10, 30)):
+        store.start('g1', f'u{i}', 'dajiao', duration, now=1000)
+    store.start('g2', 'u0', 'dajiao', 5, now=1000)
+    store.start('g1', 'u3', 'dajiao', 40, now=1000)
+    assert store.remaining('g1', 'u1', 'dajiao', now=1001) == 0  # 最早到期的被淘汰
+    assert {f'u{i}' for i in (0, 2, 3)} == set(store.snapshot(now=1001)['g1'])
+    assert store.remaining('g2', 'u0', 'dajiao', now=1001) == 4  # 其他群不受影响
+    assert store.stats()['evicted'] == 1
+
+
+def test_window_counter():
+    store = CooldownStore()
+    assert all(store.hit('g1', 'u1', 'compare_count', 600, 3, now=1000 + i) for i in range(3))
+    assert not store.hit('g1', 'u1', 'compare_count', 600, 3, now=1100)
+    assert store.hit('g1', 'u1', 'compare_count', 600, 3, now=1600)
+
+
+def test_snapshot_round_trip_drops_expired():
+    store = CooldownStore()
+    store.start('g1', 'u1', 'dajiao', 30, now=1000)
+    store.start('g1', 'u2', 'dajiao', 5, now=1000)
+    store.hit('g1', 'u1', 'compare_count', 600, 3, now=1000)
+    data = store.snapshot(now=1010)
+    assert data == {'g1': {'u1': {'dajiao': [1030, 0], 'compare_count': [1600, 1]}}}
+
+    restored = CooldownStore()
+    restored.load(data, now=1020)
+    assert restored.remaining('g1', 'u1', 'dajiao', now=1020) == 10
+    assert not restored.hit('g1', 'u1', 'compare_count', 600, 1, now=1020)
+    expired = CooldownStore()
+    expired.load(data, now=2000)
+    assert len(expired) == 0
+
+
+def test_legacy_timestamps_are_converted():
+    """旧版数据保存的是上次操作的时间，按冷却时长换算为到期时间"""
+    durations = {'dajiao': 30, 'crazy_dajiao': 60}
+    store = CooldownStore()
+    store.load({'g1': {'u1': {'dajiao': 1000, 'crazy_dajiao': 1000, 'unknown': 1000}}}, now=1020, cooldown_for=durations.get)
+    assert store.remaining('g1', 'u1', 'dajiao', now=1020) == 10
+    assert store.remaining('g1', 'u1', 'crazy_dajiao', now=1020) == 40
+    assert len(store) == 2
@@ -0,0 +1,35 @@
+import asyncio
+import random
+
+from harness import FakeEvent, flush, make_plugin, populate, send, workdir
+
+
+def test_global_ranking_reconciles_unloaded_groups(tmp_path):
+    """重启后首次查询时校准：未加载的群组从磁盘读取，未开启插件的群不上榜"""
+    config = {'storage_mode': 'sharded', 'global_ranking_size': 5, 'global_ranking_show': 3}
+    with workdir(str(tmp_path)):
+        plugin = make_plugin(config)
+        rnd = random.Random(3)
+        for group_id in ('g1', 'g2', 'g3'):
+            populate(plugin, group_id, 8, rnd)
+        plugin.get_group_data('g3')['plugin_enabled'] = False
+        plugin._save_niuniu_lengths('g3')
+        expected = sorted(
+            ((user.length, group_id, user_id) for group_id in ('g1', 'g2')
+             for user_id, user in plugin.get_group_data(group_id).items() if user_id != 'plugin_enabled'),
+            reverse=True,
+        )
+        asyncio.run(flush(plugin))
+
+        async def query():
+            plugin = make_plugin(config, admins=None)
+            await send(plugin, FakeEvent('g1', 'u0', '用户0', '全服排行'))
+            ranking = plugin.global_ranking
+            assert not ranking.stale and ranking.reconcile_count == 1
+            top = ranking.top.first(3)
+            assert [length for _, _, _, length in top] == [length for length, _, _ in expected[:3]]
+            assert {group_id for group_id, _, _, _ in top} == {'g1', 'g2'}  # g2 重启后未加载，由校准从磁盘读取
+            assert all(group_id != 'g3' for group_id, _, _, _ in ranking.top.first(5) + ranking.bottom.first(5))
+            await plugin.terminate()
+
+        asyncio.run(query())
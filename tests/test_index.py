@@ -0,0 +1,101 @@
+import random
+
+from niuniu_index import BoundedRanking, GlobalRanking, GroupRanking, RankingIndex
+from niuniu_models import UserRecord
+
+
+def _group(**lengths):
+    group_data = {'plugin_enabled': True}
+    for user_id, length in lengths.items():
+        group_data[user_id] = UserRecord(nickname=user_id, length=length)
+    return group_data
+
+
+def test_group_ranking_top_bottom_and_rank():
+    ranking = GroupRanking(_group(a=10, b=30, c=20, d=30))
+    assert ranking.top(2) == [('d', 30), ('b', 30)]
+    assert ranking.bottom(2) == [('a', 10), ('c', 20)]
+    assert ranking.rank('b') == ranking.rank('d') == 1
+    assert ranking.rank('a') == 4
+    ranking.update('a', 40)
+    ranking.update('c', None)
+    assert ranking.top(1) == [('a', 40)] and len(ranking) == 3 and ranking.rank('c') is None
+
+
+def test_seeded_ranking_keeps_changes_made_while_reading():
+    """用存储后端的有序数据构建索引，读取期间的长度变化会补上"""
+    group_data = _group(a=10, b=20, c=30)
+    index = RankingIndex()
+    index.begin_seed('g1')
+    assert 'g1' in index
+    entries = [(10, 'a'), (20, 'b'), (30, 'c')]  # 读取开始时的数据
+    group_data['a']['length'] = 50
+    index.update('g1', group_data, 'a')
+    index.seed('g1', group_data, entries)
+    ranking = index.get('g1', group_data)
+    assert ranking.entries == GroupRanking(group_data).entries
+
+
+def test_seed_is_dropped_after_whole_group_change():
+    group_data = _group(a=10)
+    index = RankingIndex()
+    index.begin_seed('g1')
+    index.update('g1', group_data)  # 整群变化，读出的数据不再可信
+    index.seed('g1', group_data, [(99, 'a')])
+    assert 'g1' not in index
+    assert index.get('g1', group_data).top(1) == [('a', 10)]
+
+
+def _check_prefix(side, lengths):
+    """榜上的 n 人就是全服的前 n 名；榜外没有人时不得标记为截断"""
+    expected = sorted(side.sign * length for length in lengths.values())
+    assert [entry[0] for entry in side.entries] == expected[:len(side.entries)]
+    assert len(side.entries) <= side.capacity and len(side.members) == len(side.entries)
+    for key, (length, _) in side.members.items():
+        assert lengths[key] == length
+    if len(side.entries) < len(lengths):
+        assert side.truncated
+
+
+def test_bounded_ranking_keeps_prefix_invariant():
+    """随机增删改后榜单始终是全服前 n 名，缺人时 complete() 返回 False"""
+    rnd = random.Random(7)
+    top, bottom = BoundedRanking(5, descending=True), BoundedRanking(5, descending=False)
+    lengths = {}
+    for _ in range(2000):
+        key = ('g%d' % rnd.randint(1, 3), 'u%d' % rnd.randint(1, 15))
+        length = None if rnd.random() < 0.2 else rnd.randint(-50, 50)
+        if length is None:
+            lengths.pop(key, None)
+        else:
+            lengths[key] = length
+        for side in (top, bottom):
+            side.update(key, length, key[1])
+            _check_prefix(side, lengths)
+            if side.complete(3):
+                assert len(side.first(3)) == min(3, len(lengths))
+
+
+def test_global_ranking_reconcile_restores_full_list():
+    """榜上的人被移除导致人数不足时需要校准，重建后与全量排序一致并可持久化"""
+    records = [('g1', f'u{i}', f'u{i}', i) for i in range(10)] + [('g2', f'u{i}', f'u{i}', 100 + i) for i in range(3)]
+    ranking = GlobalRanking(capacity=3)
+    assert ranking.stale
+    ranking.rebuild(records, now=1.0)
+    assert not ranking.stale and ranking.complete(3)
+    assert [r[3] for r in ranking.top.first(3)] == [102, 101, 100]
+    assert [r[3] for r in ranking.bottom.first(3)] == [0, 1, 2]
+
+    for user_id in ('u0', 'u1', 'u2'):
+        ranking.update('g2', user_id, None)
+    assert not ranking.complete(3)  # 榜外的人无法补上
+    records = [r for r in records if r[0] != 'g2']
+    ranking.rebuild(records, now=2.0)
+    assert [r[3] for r in ranking.top.first(3)] == [9, 8, 7]
+
+    loaded = GlobalRanking(capacity=3)
+    loaded.load(ranking.to_data())
+    assert loaded.top.first(3) == ranking.top.first(3) and loaded.reconciled_at == 2.0 and not loaded.stale
+    resized = GlobalRanking(capacity=5)
+    resized.load(ranking.to_data())
+    assert resized.stale  # 容量变化后需要重新校准
@@ -0,0 +1,36 @@
+import json
+
+import niuniu_rng
+from niuniu_rng import RngService
+
+
+def _draw(rng, user_id):
+    with rng.draw('g1', user_id, '打胶'):
+        rng.stream('g1', user_id).random()
+
+
+def test_same_seed_replays_same_draws():
+    a, b = RngService(seed=42), RngService(seed=42)
+    assert [a.stream('g1').random() for _ in range(100)] == [b.stream('g1').random() for _ in range(100)]
+    assert a.stream('g1').random() != a.stream('g2').random()
+
+
+def test_audit_lines_kept_when_write_fails(tmp_path, monkeypatch):
+    """审计日志写入失败时记录留在队列中，下次写入时按原顺序写出"""
+    path = tmp_path / 'audit.jsonl'
+    attempts = []
+    append_lines = niuniu_rng.append_lines
+
+    def flaky(target, lines):
+        attempts.append(len(lines))
+        if len(attempts) == 1:
+            raise OSError("disk full")
+        append_lines(target, lines)
+    monkeypatch.setattr(niuniu_rng, 'append_lines', flaky)
+
+    rng = RngService(seed=1, audit_path=str(path), flush_interval=0)
+    _draw(rng, 'u1')
+    assert not path.exists()
+    _draw(rng, 'u2')
+    assert attempts == [1, 2]
+    assert [json.loads(line)['u'] for line in path.read_text(encoding='utf-8').splitlines()] == ['u1', 'u2']
@@ -0,0 +1,46 @@
+import asyncio
+import random
+import time
+
+from harness import FakeEvent, flush, make_plugin, populate, send, workdir
+from niuniu_rush import RUSH_MAX_SECONDS
+
+
+def test_rush_settles_after_restart(tmp_path):
+    """重启后从开冲文件恢复堆：已超时的立即结算，未到期的到期后自动结算"""
+    def start():
+        plugin = make_plugin()
+        populate(plugin, 'g1', 3, random.Random(1), coins=0)
+        now = time.time()
+        for user_id, start_time in (('u0', now - RUSH_MAX_SECONDS - 60), ('u1', now - RUSH_MAX_SECONDS + 0.3)):
+            user_data = plugin.get_user_data('g1', user_id)
+            user_data.is_rushing = True
+            user_data.rush_start_time = start_time
+            plugin.rush.schedule('g1', user_id, start_time)  # 没有事件循环，后台任务不会启动
+        plugin._save_niuniu_lengths('g1')
+        asyncio.run(flush(plugin))  # 模拟进程退出：数据已落盘，但开冲尚未结算
+
+    async def restart():
+        plugin = make_plugin(admins=None)
+        plugin.rush.batch_window = 0  # 不与已超时的开冲合并为一批
+        await send(plugin, FakeEvent('g1', 'u2', '用户2', '牛牛菜单'))
+        assert set(plugin.rush.active) == {('g1', 'u0'), ('g1', 'u1')}
+        await asyncio.sleep(0.1)
+        assert not plugin.get_user_data('g1', 'u0').is_rushing  # 已超时，恢复后立即结算
+        assert plugin.get_user_data('g1', 'u1').is_rushing
+        await asyncio.sleep(0.5)
+        for user_id in ('u0', 'u1'):
+            user_data = plugin.get_user_data('g1', user_id)
+            assert not user_data.is_rushing
+            assert 30 <= user_data.coins <= 60  # 按 30 分钟、每分钟 1~2 金币结算
+        assert not plugin.rush.active and plugin.rush.stats()['settled'] == 2
+        await plugin.terminate()
+        return plugin
+
+    with workdir(str(tmp_path)):
+        start()
+        asyncio.run(restart())
+        plugin = make_plugin(admins=None)  # 结算结果已写入，再次重启不会重复结算
+        assert plugin.get_user_data('g1', 'u0').coins > 0
+        asyncio.run(plugin.rush.restore())
+        assert not plugin.rush.active
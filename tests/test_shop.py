@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import os
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+pytest.importorskip('astrbot.api.all')  # 商城模块依赖 AstrBot
+
+from niuniu_metrics import Metrics  # noqa: E402
+from niuniu_shop import SIGN_DATA_FILE, NiuniuShop  # noqa: E402
+from niuniu_storage import AsyncIOPool  # noqa: E402
+
+
+def _write_sign_coins(coins):
+    with open(SIGN_DATA_FILE, 'w', encoding='utf-8') as f:
+        yaml.safe_dump({'g1': {'u0': {'coins': coins}}}, f)
+
+
+def _read_sign_coins():
+    with open(SIGN_DATA_FILE, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)['g1']['u0']['coins']
+
+
+def _make_shop(io_pool):
+    main = SimpleNamespace(
+        lengths_writer=SimpleNamespace(interval=5),
+        context=SimpleNamespace(logger=logging.getLogger('niuniu.test')),
+        io_pool=io_pool,
+        metrics=Metrics(),
+        get_user_data=lambda group_id, user_id: None,  # 没有游戏金币，只扣签到金币
+        _save_niuniu_lengths=lambda *args: None,
+    )
+    return NiuniuShop(main)
+
+
+def test_external_credit_during_purchase_is_kept(tmp_path, monkeypatch):
+    """读取余额后、扣款前签到插件增加的金币不会被扣款覆盖"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+
+    async def run():
+        pool = AsyncIOPool(1)
+        shop = _make_shop(pool)
+        shop.sign_cache.check_interval = 0  # 每次读取都检查文件
+        _write_sign_coins(100)
+        assert await shop.get_user_coins('g1', 'u0') == 100
+        await asyncio.sleep(0.01)  # 保证文件修改时间不同
+        _write_sign_coins(150)  # 签到插件在读取余额后增加了 50 金币
+        await shop.update_user_coins('g1', 'u0', -70)
+        await shop.close()
+        pool.shutdown()
+
+    asyncio.run(run())
+    assert _read_sign_coins() == 80
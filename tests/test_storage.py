@@ -0,0 +1,221 @@
+import asyncio
+import os
+import time
+
+import yaml
+
+from niuniu_models import UserRecord
+from niuniu_storage import (
+    AsyncIOPool, GroupStore, SharedShardBackend, ShardedYamlBackend, SqliteBackend, WriteBehindWriter,
+    merge_user, merge_value,
+)
+
+
+def _write_yaml(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.dump(data, f, allow_unicode=True)
+
+
+def test_sharded_migrates_legacy_file_once(tmp_path):
+    """首次启用分片存储时拆分旧文件并重命名为 .migrated，之后不再迁移"""
+    legacy = str(tmp_path / 'niuniu_lengths.yml')
+    shard_dir = str(tmp_path / 'groups')
+    _write_yaml(legacy, {
+        'g1': {'plugin_enabled': True, 'u1': {'nickname': 'a', 'length': 10}},
+        'g2': {'plugin_enabled': False, 'u2': {'nickname': 'b', 'length': 5}},
+        'g3': {'plugin_enabled': False},  # 空群组与不存在等价，不会生成分片
+    })
+
+    backend = ShardedYamlBackend(shard_dir, legacy)
+    assert not os.path.exists(legacy)
+    assert os.path.exists(f"{legacy}.migrated")
+    assert os.path.exists(backend.shard_path('g1')) and os.path.exists(backend.shard_path('g2'))
+    assert backend.load_group('g1')['u1']['length'] == 10
+    assert not os.path.exists(backend.shard_path('g3'))
+    assert backend.load_group('g3') is None
+
+    # 再次出现的旧文件不会覆盖已经迁移的分片
+    _write_yaml(legacy, {'g1': {'plugin_enabled': True, 'u1': {'nickname': 'a', 'length': 99}}})
+    backend = ShardedYamlBackend(shard_dir, legacy)
+    assert os.path.exists(legacy)
+    assert backend.load_group('g1')['u1']['length'] == 10
+
+
+def test_sharded_writes_only_dirty_groups(tmp_path):
+    """只写回修改过的群组文件"""
+    backend = ShardedYamlBackend(str(tmp_path / 'groups'))
+    store = GroupStore(backend)
+    store['g1'] = {'plugin_enabled': True}
+    store['g2'] = {'plugin_enabled': True}
+    store.prepare_save({'g1'}, set())()
+    assert os.path.exists(backend.shard_path('g1'))
+    assert not os.path.exists(backend.shard_path('g2'))
+
+    store = GroupStore(ShardedYamlBackend(str(tmp_path / 'groups')))
+    assert 'g1' in store and 'g2' not in store
+
+
+def test_sqlite_imports_yaml_once(tmp_path):
+    """首次启用时导入旧的 YAML 数据和冷却数据，之后不再导入"""
+    legacy = str(tmp_path / 'niuniu_lengths.yml')
+    actions = str(tmp_path / 'last_actions.yml')
+    db_path = str(tmp_path / 'niuniu.db')
+    _write_yaml(legacy, {'g1': {'plugin_enabled': True, 'u1': {'nickname': 'a', 'length': 10, 'items': {'妙脆角': 1}}}})
+    _write_yaml(actions, {'g1': {'u1': {'dajiao': 100.0}}})
+
+    backend = SqliteBackend(db_path, legacy, actions)
+    assert os.path.exists(f"{legacy}.migrated") and os.path.exists(f"{actions}.migrated")
+    group_data = backend.load_group('g1')
+    assert group_data['plugin_enabled'] is True
+    assert group_data['u1']['length'] == 10 and group_data['u1']['items'] == {'妙脆角': 1}
+    assert backend.load_actions() == {'g1': {'u1': {'dajiao': 100.0}}}
+    backend.close()
+
+    _write_yaml(legacy, {'g1': {'plugin_enabled': True, 'u1': {'nickname': 'a', 'length': 99}}})
+    backend = SqliteBackend(db_path, legacy)
+    assert os.path.exists(legacy)  # 数据库已有数据，不会再次导入
+    assert backend.load_group('g1')['u1']['length'] == 10
+    backend.close()
+
+
+def test_sqlite_saves_only_dirty_rows(tmp_path):
+    """只更新标记过的用户行，已删除的用户同时删除对应的行"""
+    backend = SqliteBackend(str(tmp_path / 'niuniu.db'))
+    store = GroupStore(backend)
+    store['g1'] = {
+        'plugin_enabled': True,
+        'u1': UserRecord(nickname='a', length=10),
+        'u2': UserRecord(nickname='b', length=20),
+        'u3': UserRecord(nickname='c', length=30),
+    }
+    store.prepare_save({'g1'}, {('g1', None)})()
+
+    group_data = store['g1']
+    group_data['u1']['length'] = 11
+    group_data['u2']['length'] = 21  # 未标记，不会写入
+    del group_data['u3']
+    store.prepare_save({'g1'}, {('g1', 'u1'), ('g1', 'u3')})()
+
+    saved = backend.load_group('g1')
+    assert saved['u1']['length'] == 11
+    assert saved['u2']['length'] == 20
+    assert 'u3' not in saved
+    assert [row[0] for row in backend.ranking('g1', 5, True)] == ['u2', 'u1']
+    backend.close()
+
+
+def test_mark_during_slow_write_is_flushed():
+    """写入进行中标记的脏数据在写入结束后会被再次安排写入"""
+    written = []
+
+    def write(dirty_groups, dirty_users):
+        groups = set(dirty_groups)
+
+        def job():
+            time.sleep(0.2)
+            written.append(groups)
+        return job
+
+    async def run():
+        pool = AsyncIOPool(1)
+        writer = WriteBehindWriter('test', write, 0.05, io_pool=pool)
+        writer.mark_dirty('g1')
+        await asyncio.sleep(0.1)  # 第一次写入正在进行
+        assert writer._writing
+        writer.mark_dirty('g2')
+        await asyncio.sleep(0.6)
+        assert not writer.dirty_groups
+        await writer.close()
+        pool.shutdown()
+
+    asyncio.run(run())
+    assert written == [{'g1'}, {'g2'}]
+
+
+def test_failed_write_is_retried():
+    """写入失败后保留脏标记并重新安排写入"""
+    attempts = []
+
+    def write(dirty_groups, dirty_users):
+        def job():
+            attempts.append(set(dirty_groups))
+            if len(attempts) == 1:
+                raise OSError("disk full")
+        return job
+
+    async def run():
+        writer = WriteBehindWriter('test', write, 0.05)
+        writer.mark_dirty('g1')
+        await asyncio.sleep(0.3)
+        assert not writer.dirty_groups
+        await writer.close()
+
+    asyncio.run(run())
+    assert attempts == [{'g1'}, {'g1'}]
+
+
+def test_merge_user_adds_both_changes():
+    """数值字段和道具数量叠加双方各自的变化，其他字段以本地修改为准"""
+    base = {'nickname': 'a', 'length': 10, 'coins': 5, 'items': {'妙脆角': 1}}
+    theirs = {'nickname': 'a', 'length': 15, 'coins': 8, 'items': {'妙脆角': 1, '伟哥': 2}}
+    mine = {'nickname': 'b', 'length': 12, 'coins': 5, 'items': {}}
+    merged = merge_user(theirs, mine, base)
+    assert merged['nickname'] == 'b'
+    assert merged['length'] == 17
+    assert merged['coins'] == 8  # 本地未修改，保留对方的值
+    assert merged['items'] == {'伟哥': 2}
+
+
+def test_merge_value_edge_cases():
+    """本地删除时保留对方数据，开关和没有基准版本的记录以本地为准"""
+    theirs = UserRecord(nickname='a', length=15).to_compact()
+    mine = UserRecord(nickname='a', length=12).to_compact()
+    base = UserRecord(nickname='a', length=10).to_compact()
+    assert merge_value('u1', theirs, None, base) == theirs
+    assert merge_value('u1', theirs, mine, None) == mine
+    assert merge_value('plugin_enabled', False, True, False) is True
+    assert UserRecord.from_compact(merge_value('u1', theirs, mine, base))['length'] == 17
+
+
+def test_shared_concurrent_writes_are_merged(tmp_path):
+    """两个进程基于同一修订号修改同一用户时，后写入的一方合并而不是覆盖"""
+    shard_dir = str(tmp_path / 'shared')
+    store_a = GroupStore(SharedShardBackend(shard_dir, check_interval=0))
+    store_a['g1'] = {'plugin_enabled': True, 'u1': UserRecord(nickname='a', length=10)}
+    store_a.prepare_save({'g1'}, set())()
+    store_b = GroupStore(SharedShardBackend(shard_dir, check_interval=0))
+    assert store_b['g1']['u1']['length'] == 10
+
+    store_a['g1']['u1']['length'] = 15
+    store_a.prepare_save({'g1'}, set())()
+    store_b['g1']['u1']['length'] = 12  # 基于过期的修订号
+    store_b.prepare_save({'g1'}, set())()
+    assert store_b.backend.conflict_count == 1
+
+    assert SharedShardBackend(shard_dir).load_group('g1')['u1']['length'] == 17
+
+    async def sync_a():
+        pool = AsyncIOPool(1)
+        await store_a.preload('g1', pool)
+        pool.shutdown()
+
+    asyncio.run(sync_a())
+    assert store_a['g1']['u1']['length'] == 17
+    store_a['g1']['u1']['length'] = 20
+    store_a.prepare_save({'g1'}, set())()
+    assert store_a.backend.conflict_count == 0  # 已合并最新版本，不再冲突
+    assert SharedShardBackend(shard_dir).load_group('g1')['u1']['length'] == 20
+
+
+def test_shared_actions_keep_later_expiry(tmp_path):
+    """冷却记录与其他进程写入的记录合并，同一条记录保留较晚的到期时间"""
+    actions = str(tmp_path / 'last_actions.yml')
+    now = time.time()
+    a = SharedShardBackend(str(tmp_path / 'shared'), actions_path=actions)
+    b = SharedShardBackend(str(tmp_path / 'shared'), actions_path=actions)
+    a.save_actions({'g1': {'u1': {'dajiao': [now + 100, 1]}, 'u2': {'dajiao': [now - 1, 1]}}}, {'g1'})
+    b.save_actions({'g1': {'u1': {'dajiao': [now + 50, 1]}, 'u3': {'dajiao': [now + 30, 2]}}}, {'g1'})
+    saved = a.load_actions()
+    assert saved['g1']['u1']['dajiao'][0] == now + 100
+    assert saved['g1']['u3']['dajiao'] == [now + 30, 2]
+    assert 'u2' not in saved['g1']  # 已过期的记录不再写回
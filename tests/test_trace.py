@@ -0,0 +1,24 @@
+import niuniu_trace
+from niuniu_trace import TraceRecorder, read_trace
+
+
+def test_trace_lines_kept_when_write_fails(tmp_path, monkeypatch):
+    """录制日志写入失败时记录留在队列中，下次写入时按原顺序写出"""
+    path = tmp_path / 'trace.jsonl'
+    attempts = []
+    append_lines = niuniu_trace.append_lines
+
+    def flaky(target, lines):
+        attempts.append(len(lines))
+        if len(attempts) == 1:
+            raise OSError("disk full")
+        append_lines(target, lines)
+    monkeypatch.setattr(niuniu_trace, 'append_lines', flaky)
+
+    recorder = TraceRecorder(str(path), flush_interval=0)
+    recorder.record('g1', 'u1', 'a', '打胶')
+    assert not path.exists()
+    recorder.record('g1', 'u2', 'b', '比划比划', at='u1')
+    assert attempts == [1, 2]
+    entries = list(read_trace(str(path)))
+    assert [(e.user_id, e.text, e.at) for e in entries] == [('u1', '打胶', None), ('u2', '比划比划', 'u1')]